@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+    Configuration benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures reading configuration values from :class:`tipfy.config.Config`
+    and from a frozen snapshot (:class:`tipfy.config.FrozenConfig`), with
+    10 and 50 loaded modules. Run from the repository root:
+
+        $ python benchmarks/config_bench.py
+
+    :copyright: 2011 by tipfy.org.
+    :license: BSD, see LICENSE.txt for more details.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tipfy.config import Config
+
+
+def get_config(count):
+    values = {}
+    for i in xrange(count):
+        values['module_%d' % i] = {'foo': 'bar', 'baz': i}
+
+    values['tipfy.sessions'] = {
+        'secret_key': 'secret',
+        'cookie_name': 'session',
+    }
+    config = Config(values)
+    config['tipfy.sessions']
+    return config
+
+
+def bench(config, number=200000):
+    def run():
+        config['tipfy.sessions']['cookie_name']
+
+    seconds = min(timeit.repeat(run, number=number, repeat=3))
+    return seconds / number * 1000000000
+
+
+def main():
+    print '%8s %14s %14s' % ('modules', 'Config (ns)', 'frozen (ns)')
+    for count in (10, 50):
+        config = get_config(count)
+        print '%8d %14.1f %14.1f' % (count, bench(config),
+            bench(config.freeze()))
+
+
+if __name__ == '__main__':
+    main()
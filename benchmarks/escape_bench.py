@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+    Escape benchmark
+    ~~~~~~~~~~~~~~~~
+
+    Measures escaping short and long strings with
+    :func:`tipfy.utils.xhtml_escape`, and with `xml.sax.saxutils.escape`
+    followed by UTF-8 encoding, as it was done before. The last rows escape
+    a list of 100 short strings one by one and with
+    :func:`tipfy.utils.xhtml_escape_all`. Run from the repository root:
+
+        $ python benchmarks/escape_bench.py
+
+    :copyright: 2011 by tipfy.org.
+    :license: BSD, see LICENSE.txt for more details.
+"""
+import os
+import sys
+import timeit
+import xml.sax.saxutils
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tipfy.utils import utf8, xhtml_escape, xhtml_escape_all
+
+VALUES = [
+    ('short', 'Hello, World'),
+    ('short, escaped', 'Tom & Jerry'),
+    ('short, unicode', u'Ol\xe1 <b>mundo</b>'),
+    ('medium', 'Lorem ipsum dolor sit amet. ' * 8),
+    ('long', 'Lorem ipsum dolor sit amet. ' * 200),
+    ('long, escaped', 'Lorem <b>ipsum</b> & "dolor" sit amet. ' * 200),
+    ('long, unicode', u'A\xe7\xe3o <b>ipsum</b> & "dolor" sit amet. ' * 200),
+]
+
+LISTS = [
+    ('100 values', ['Item %d' % i for i in xrange(100)]),
+    ('100 values, escaped', ['Item %d & <b>' % i for i in xrange(100)]),
+]
+
+
+def saxutils_escape(value):
+    return utf8(xml.sax.saxutils.escape(value, {'"': "&quot;"}))
+
+
+def bench(func, number=10000):
+    seconds = min(timeit.repeat(func, number=number, repeat=3))
+    return seconds / number * 1000000
+
+
+def main():
+    print '%20s %14s %14s' % ('value', 'saxutils (us)', 'tipfy (us)')
+    for name, value in VALUES:
+        assert saxutils_escape(value) == xhtml_escape(value)
+        print '%20s %14.2f %14.2f' % (name,
+            bench(lambda: saxutils_escape(value)),
+            bench(lambda: xhtml_escape(value)))
+
+    print
+    print '%20s %14s %14s' % ('list', 'one by one (us)', 'batch (us)')
+    for name, values in LISTS:
+        assert [xhtml_escape(v) for v in values] == xhtml_escape_all(values)
+        print '%20s %14.1f %14.1f' % (name,
+            bench(lambda: [xhtml_escape(v) for v in values], 1000),
+            bench(lambda: xhtml_escape_all(values), 1000))
+
+
+if __name__ == '__main__':
+    main()
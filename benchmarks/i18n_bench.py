@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+    I18n benchmark
+    ~~~~~~~~~~~~~~
+
+    Measures the time to format 1000 dates with :class:`tipfy.i18n.I18nStore`
+    and by calling Babel directly with a locale code and a timezone name, as
+    the store did before locales, timezones and date patterns were cached.
+    Run from the repository root:
+
+        $ python benchmarks/i18n_bench.py
+
+    :copyright: 2011 by tipfy.org.
+    :license: BSD, see LICENSE.txt for more details.
+"""
+import datetime
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from babel import dates
+
+from tipfy.app import App, Request
+from tipfy.i18n import pytz
+from tipfy.local import local
+
+LOCALE = 'pt_BR'
+TIMEZONE = 'America/Sao_Paulo'
+VALUES = [datetime.datetime(2011, 1, 1) + datetime.timedelta(hours=i * 7)
+    for i in xrange(1000)]
+
+
+def get_store():
+    app = App(config={
+        'tipfy.i18n': {
+            'locale': LOCALE,
+            'timezone': TIMEZONE,
+            'locale_request_lookup': [],
+            'timezone_request_lookup': [],
+        },
+    })
+    local.request = request = Request.from_values('/')
+    request.app = app
+    return request.i18n
+
+
+def get_funcs(store, key, format):
+    pattern = store._get_format(key, format)
+
+    if key == 'date':
+        def babel():
+            tzinfo = pytz.timezone(TIMEZONE)
+            for value in VALUES:
+                value = value.replace(tzinfo=pytz.UTC).astimezone(tzinfo)
+                dates.format_date(tzinfo.normalize(value), pattern,
+                    locale=LOCALE)
+
+        def tipfy():
+            for value in VALUES:
+                store.format_date(value, format)
+    else:
+        def babel():
+            tzinfo = pytz.timezone(TIMEZONE)
+            for value in VALUES:
+                dates.format_datetime(value, pattern, tzinfo=tzinfo,
+                    locale=LOCALE)
+
+        def tipfy():
+            for value in VALUES:
+                store.format_datetime(value, format)
+
+    return babel, tipfy
+
+
+def bench(func, number=5):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1000
+
+
+def main():
+    store = get_store()
+    print '%20s %12s %12s' % ('1000 values', 'Babel (ms)', 'tipfy (ms)')
+    for key, format in [
+        ('date', 'medium'),
+        ('date', 'iso'),
+        ('datetime', 'medium'),
+        ('datetime', 'full'),
+        ('datetime', 'iso'),
+    ]:
+        babel, tipfy = get_funcs(store, key, format)
+        print '%20s %12.1f %12.1f' % ('%s %s' % (key, format), bench(babel),
+            bench(tipfy))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+    Handler middleware benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Measures the overhead of :class:`tipfy.RequestHandler` middleware per
+    request, with 0, 5 and 15 middleware. Run from the repository root:
+
+        $ python benchmarks/middleware_bench.py
+
+    :copyright: 2011 by tipfy.org.
+    :license: BSD, see LICENSE.txt for more details.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tipfy import Request, RequestHandler, Response, Rule, Tipfy
+from tipfy.handler import RequestHandlerMiddleware
+
+
+class NoopMiddleware(RequestHandlerMiddleware):
+    pass
+
+
+class PartialMiddleware(object):
+    def after_dispatch(self, handler, response):
+        return response
+
+
+def get_handler_class(count):
+    middleware = []
+    for i in xrange(count):
+        # Mix middleware implementing all hooks and only some of them.
+        middleware.append(i % 2 and PartialMiddleware() or NoopMiddleware())
+
+    class Handler(RequestHandler):
+        def get(self, **kwargs):
+            return response
+
+    Handler.middleware = middleware
+    return Handler
+
+
+response = Response('Hello, World!')
+
+
+def bench(count, number=20000):
+    handler_class = get_handler_class(count)
+    app = Tipfy([Rule('/', name='home', handler=handler_class)])
+    request = Request.from_values('/')
+    request.app = app
+    app.router.match(request)
+
+    def run():
+        handler_class(request)()
+
+    seconds = min(timeit.repeat(run, number=number, repeat=3))
+    return seconds / number * 1000000
+
+
+def main():
+    print '%12s %16s' % ('middleware', 'per request (us)')
+    for count in (0, 5, 15):
+        print '%12d %16.2f' % (count, bench(count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+    Routing benchmark
+    ~~~~~~~~~~~~~~~~~
+
+    Compares URL matching with the default router and with `compile_rules`
+    enabled, for maps with 10, 100 and 1000 rules. Run from the repository
+    root:
+
+        $ python benchmarks/routing_bench.py
+
+    :copyright: 2011 by tipfy.org.
+    :license: BSD, see LICENSE.txt for more details.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.test import EnvironBuilder
+
+from tipfy import Rule, Tipfy
+
+
+def get_rules(count):
+    rules = []
+    for i in xrange(count / 2):
+        rules.append(Rule('/section%d/' % i, name='section-%d' % i,
+            handler='handlers.SectionHandler'))
+        rules.append(Rule('/section%d/<int:id>' % i, name='item-%d' % i,
+            handler='handlers.ItemHandler'))
+
+    return rules
+
+
+def get_requests(app, count):
+    # First, middle and last rules, so the linear matcher is not favored.
+    paths = ['/section0/', '/section%d/42' % (count / 4),
+        '/section%d/42' % (count / 2 - 1)]
+    requests = []
+    for path in paths:
+        builder = EnvironBuilder(path)
+        requests.append(app.request_class(builder.get_environ()))
+        builder.close()
+
+    return requests
+
+
+def bench(count, compiled, number=2000):
+    app = Tipfy(get_rules(count), config={
+        'tipfy': {'compile_rules': compiled},
+    })
+    requests = get_requests(app, count)
+    match = app.router.match
+
+    def run():
+        for request in requests:
+            match(request)
+
+    seconds = min(timeit.repeat(run, number=number, repeat=3))
+    return seconds / (number * len(requests)) * 1000000
+
+
+def main():
+    print '%8s %16s %16s %8s' % ('rules', 'default (us)', 'compiled (us)',
+        'speedup')
+    for count in (10, 100, 1000):
+        default = bench(count, False)
+        compiled = bench(count, True)
+        print '%8d %16.2f %16.2f %7.1fx' % (count, default, compiled,
+            default / compiled)
+
+
+if __name__ == '__main__':
+    main()
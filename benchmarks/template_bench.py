@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+    Template benchmark
+    ~~~~~~~~~~~~~~~~~~
+
+    Measures rendering small and large templates, and the templates in
+    `tests/resources/templates`, with :class:`tipfy.template.Template`. The
+    `exec` column runs the compiled template module on every render to
+    define `_execute`, as done before the function code was kept by the
+    template. Run from the repository root:
+
+        $ python benchmarks/template_bench.py
+
+    :copyright: 2011 by tipfy.org.
+    :license: BSD, see LICENSE.txt for more details.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tipfy import template
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'tests', 'resources', 'templates')
+
+SMALL = '<p>Hello, {{ escape(name) }}!</p>'
+
+LARGE = '''<html>
+  <head><title>{{ escape(title) }}</title></head>
+  <body>
+    <h1>{{ escape(title) }}</h1>
+    <table>
+      {% for row in rows %}
+      <tr>
+        <td>{{ row['id'] }}</td>
+        <td><a href="/items/{{ url_escape(row['name']) }}">{{ escape(row['name']) }}</a></td>
+        <td>{% if row['active'] %}active{% else %}inactive{% end %}</td>
+      </tr>
+      {% end %}
+    </table>
+  </body>
+</html>
+'''
+
+CONTEXTS = {
+    'small.html': {'name': u'World & friends'},
+    'large.html': {
+        'title': u'Items <list>',
+        'rows': [{'id': i, 'name': u'item %d' % i, 'active': i % 3 == 0}
+            for i in xrange(500)],
+    },
+    'template1.html': {'message': 'Hello, World!'},
+    'template2.html': {'_': lambda s: s},
+    'template_tornado1.html': {'students': ['calvin', 'hobbes', 'moe']},
+}
+
+
+def generate_exec(t, **kwargs):
+    namespace = template._NAMESPACE.copy()
+    namespace.update(kwargs)
+    exec t.compiled in namespace
+    return namespace['_execute'](*[namespace[name] for name in
+        t.local_names])
+
+
+def bench(func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=3))
+    return seconds / number * 1000000
+
+
+def main():
+    loader = template.Loader(TEMPLATES_DIR)
+    templates = [
+        (template.Template(SMALL, name='small.html'), 50000),
+        (template.Template(LARGE, name='large.html'), 200),
+    ]
+    for name in ('template1.html', 'template2.html',
+                 'template_tornado1.html'):
+        templates.append((loader.load(name), 50000))
+
+    print '%24s %12s %12s %12s' % ('template', 'exec (us)', 'tipfy (us)',
+        'stream (us)')
+    for t, number in templates:
+        context = CONTEXTS[t.name]
+        assert generate_exec(t, **context) == t.generate(**context)
+        print '%24s %12.1f %12.1f %12.1f' % (t.name,
+            bench(lambda: generate_exec(t, **context), number),
+            bench(lambda: t.generate(**context), number),
+            bench(lambda: list(t.generate_stream(**context)), number))
+
+
+if __name__ == '__main__':
+    main()
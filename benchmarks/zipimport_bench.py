@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+    Zipimport benchmark
+    ~~~~~~~~~~~~~~~~~~~
+
+    Measures the time to import werkzeug, jinja2 (with markupsafe), babel,
+    pytz and blinker (the ones that are installed) from loose files and from
+    zip bundles made by :func:`tipfy.scripting.build_zip`, with and without
+    compiled modules. Each import runs in a new interpreter. Run from the
+    repository root:
+
+        $ python benchmarks/zipimport_bench.py
+
+    :copyright: 2011 by tipfy.org.
+    :license: BSD, see LICENSE.txt for more details.
+"""
+import compileall
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tipfy.scripting import build_zip
+
+PACKAGES = ['werkzeug', 'jinja2', 'markupsafe', 'babel', 'pytz', 'blinker']
+
+SCRIPT = """
+import sys, time
+sys.path.insert(0, %(path)r)
+start = time.time()
+%(imports)s
+sys.stdout.write(repr(time.time() - start))
+"""
+
+
+def copy_packages(lib_dir):
+    names = []
+    for name in PACKAGES:
+        try:
+            module = __import__(name)
+        except ImportError:
+            continue
+
+        shutil.copytree(os.path.dirname(module.__file__),
+            os.path.join(lib_dir, name),
+            ignore=shutil.ignore_patterns('*.pyc', '*.pyo', 'tests'))
+        names.append(name)
+
+    return names
+
+
+def bench(path, names, repeat=5):
+    script = SCRIPT % dict(path=path, imports='\n'.join('import %s' % name
+        for name in names))
+    times = []
+    for i in xrange(repeat):
+        # -S skips site-packages, so the packages are imported from path.
+        output = subprocess.Popen([sys.executable, '-S', '-c', script],
+            stdout=subprocess.PIPE).communicate()[0]
+        times.append(float(output))
+
+    return min(times) * 1000
+
+
+def main():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        lib_dir = os.path.join(tmp_dir, 'dist')
+        os.mkdir(lib_dir)
+        names = copy_packages(lib_dir)
+
+        zip_path = os.path.join(tmp_dir, 'dist.zip')
+        build_zip(lib_dir, zip_path)
+        zip_nopyc_path = os.path.join(tmp_dir, 'dist_nopyc.zip')
+        build_zip(lib_dir, zip_nopyc_path, compile_pyc=False)
+        compileall.compile_dir(lib_dir, quiet=True)
+
+        print 'Packages: %s' % ', '.join(names)
+        print '%16s %12s' % ('layout', 'import (ms)')
+        for name, path in [
+            ('loose', lib_dir),
+            ('zip', zip_path),
+            ('zip (no .pyc)', zip_nopyc_path),
+        ]:
+            print '%16s %12.1f' % (name, bench(path, names))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
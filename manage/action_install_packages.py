@@ -11,6 +11,11 @@ from z3c.recipe.scripts.scripts import Scripts
 from appfy.recipe import (copytree, ignore_patterns, include_patterns,
     rmfiles, zipdir)
 
+try:
+    from tipfy.scripting import build_zip
+except ImportError:
+    build_zip = None
+
 
 LIB_README = """Warning!
 ========
@@ -40,6 +45,10 @@ class Recipe(Scripts):
         if self.use_zip:
             self.lib_path += '.zip'
 
+        # Add compiled modules to the zip, so that they are not compiled
+        # every time they are imported.
+        self.compile_pyc = opts.get('compile-pyc', 'true') == 'true'
+
         # Set list of globs and packages to be ignored.
         self.ignore_globs = [i for i in opts.get('ignore-globs', '') \
             .splitlines() if i.strip()]
@@ -103,7 +112,16 @@ class Recipe(Scripts):
 
         if self.use_zip:
             # Zip file and remove temporary dir.
-            zipdir(tmp_dir, self.lib_path)
+            if self.compile_pyc and build_zip is not None:
+                build_zip(tmp_dir, self.lib_path)
+            else:
+                if self.compile_pyc:
+                    self.logger.warning('compile-pyc is enabled but '
+                        'tipfy.scripting could not be imported: %r is '
+                        'built without .pyc files.' % self.lib_path)
+
+                zipdir(tmp_dir, self.lib_path)
+
             if os.path.isdir(tmp_dir):
                 shutil.rmtree(tmp_dir)
 
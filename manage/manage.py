@@ -568,6 +568,71 @@ class BuildAction(Action):
 
 
 
+class ProfileImportsAction(Action):
+    """Imports the app modules and displays the import tree with the time
+    spent importing each module. Modules can also be defined in tipfy.cfg:
+
+        [tipfy:profile_imports]
+        modules =
+            main
+            urls
+    """
+    description = 'Displays the time spent importing each module.'
+
+    def get_parser(self):
+        manager = self.manager
+        section = self.get_config_section()
+
+        parser = argparse.ArgumentParser(description=self.description)
+        parser.add_argument('modules', help='Modules to import.', nargs='*',
+            default=manager.config.getlist(section, 'modules', ['main']))
+        parser.add_argument('--threshold', type=float,
+            help='Hide imports that took less than this number of '
+                'milliseconds.',
+            default=manager.config.getfloat(section, 'threshold', 0)
+        )
+        return parser
+
+    def __call__(self, argv):
+        parser = self.get_parser()
+        args = parser.parse_args(args=argv)
+
+        profile_imports = import_string('tipfy.scripting.profile_imports',
+            True)
+        if profile_imports is None:
+            self.error('Could not import tipfy. Add it to sys.path or '
+                'configure sys.path in tipfy.cfg.')
+
+        print profile_imports(args.modules, args.threshold)
+
+
+class PrecompileTemplatesAction(Action):
+    """Compiles tipfy.template templates to a bytecode cache directory or
+    zip file, to be loaded using a FileSystemBytecodeCache or a
+    ZipBytecodeCache.
+    """
+    description = 'Compiles tipfy templates to a bytecode cache.'
+
+    def get_parser(self):
+        parser = argparse.ArgumentParser(description=self.description)
+        parser.add_argument('templates_dir', help='Templates directory.')
+        parser.add_argument('target', help='Bytecode cache directory, or '
+            'a zip file if it ends with ".zip".')
+        return parser
+
+    def __call__(self, argv):
+        parser = self.get_parser()
+        args = parser.parse_args(args=argv)
+
+        precompile = import_string('tipfy.template.precompile', True)
+        if precompile is None:
+            self.error('Could not import tipfy. Add it to sys.path or '
+                'configure sys.path in tipfy.cfg.')
+
+        for name in precompile(args.templates_dir, args.target):
+            self.log('Compiled %s' % name)
+
+
 class InstallAppengineSdkAction(Action):
     """Not implemented yet."""
     description = 'Downloads and unzips the App Engine SDK.'
@@ -610,6 +675,8 @@ class TipfyManager(object):
         #'install_gae_sdk': InstallAppengineSdkAction(),
         'create_app':       CreateAppAction,
         'build':            BuildAction,
+        'profile_imports':  ProfileImportsAction,
+        'precompile_templates': PrecompileTemplatesAction,
         'test':             TestAction,
     }
 
@@ -297,6 +297,58 @@ class TestRequestHandler(BaseTestCase):
             self.assertEqual(isinstance(handler.auth, AuthStore), True)
             self.assertEqual(isinstance(handler.i18n, I18nStore), True)
 
+    def test_last_modified(self):
+        import datetime
+        from werkzeug import http_date
+
+        calls = []
+
+        class Handler(RequestHandler):
+            def last_modified(self, **kwargs):
+                return datetime.datetime(2011, 1, 1, 12, 0, 0, 500)
+
+            def get(self, **kwargs):
+                calls.append(kwargs)
+                return Response('Hello, World!')
+
+            def post(self, **kwargs):
+                calls.append(kwargs)
+                return Response('Posted')
+
+        app = Tipfy(rules=[Rule('/', name='home', handler=Handler)])
+        client = app.get_test_client()
+
+        response = client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Last-Modified'],
+            'Sat, 01 Jan 2011 12:00:00 GMT')
+        self.assertEqual(len(calls), 1)
+
+        since = http_date(datetime.datetime(2011, 1, 1, 12, 0, 0))
+        response = client.get('/', headers={'If-Modified-Since': since})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['Last-Modified'],
+            'Sat, 01 Jan 2011 12:00:00 GMT')
+        self.assertEqual(len(calls), 1)
+
+        # Modified after the date sent by the client.
+        since = http_date(datetime.datetime(2011, 1, 1, 11, 0, 0))
+        response = client.get('/', headers={'If-Modified-Since': since})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(calls), 2)
+
+        # Only GET and HEAD are conditional.
+        response = client.post('/', headers={'If-Modified-Since': since})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(calls), 3)
+
+        # An If-None-Match header takes precedence.
+        since = http_date(datetime.datetime(2011, 1, 1, 12, 0, 0))
+        response = client.get('/', headers={'If-Modified-Since': since,
+            'If-None-Match': '"foo"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(calls), 4)
+
 
 class TestHandlerMiddleware(BaseTestCase):
     def test_before_dispatch(self):
@@ -428,6 +480,200 @@ class TestHandlerMiddleware(BaseTestCase):
         response = client.get('/')
         self.assertEqual(response.status_code, 500)
 
+    def test_middleware_hooks(self):
+        class BeforeMiddleware(object):
+            def before_dispatch(self, handler):
+                pass
+
+        class AfterMiddleware(object):
+            def after_dispatch(self, handler, response):
+                return response
+
+            def handle_exception(self, handler, exception):
+                pass
+
+        before = BeforeMiddleware()
+        after1 = AfterMiddleware()
+        after2 = AfterMiddleware()
+
+        class MyHandler(RequestHandler):
+            middleware = [before, after1, after2]
+
+        request = Request.from_values()
+        hooks = MyHandler(request).get_middleware_hooks()
+        self.assertEqual(hooks, (
+            (before.before_dispatch,),
+            (after2.after_dispatch, after1.after_dispatch),
+            (after2.handle_exception, after1.handle_exception),
+        ))
+        # Cached in the class.
+        self.assertTrue(MyHandler(request).get_middleware_hooks() is hooks)
+
+        # Reassigning the middleware invalidates the cache.
+        MyHandler.middleware = [after1]
+        self.assertEqual(MyHandler(request).get_middleware_hooks(), (
+            (), (after1.after_dispatch,), (after1.handle_exception,),
+        ))
+
+        # So does changing its size.
+        MyHandler.middleware.append(before)
+        self.assertEqual(MyHandler(request).get_middleware_hooks()[0],
+            (before.before_dispatch,))
+
+        # Subclasses and handlers without middleware.
+        class OtherHandler(MyHandler):
+            middleware = None
+
+        self.assertEqual(OtherHandler(request).get_middleware_hooks(),
+            ((), (), ()))
+        self.assertEqual(len(MyHandler(request).get_middleware_hooks()[1]),
+            1)
+
+    def test_middleware_order(self):
+        calls = []
+
+        class MyMiddleware(object):
+            def __init__(self, name):
+                self.name = name
+
+            def before_dispatch(self, handler):
+                calls.append('before_%s' % self.name)
+
+            def after_dispatch(self, handler, response):
+                calls.append('after_%s' % self.name)
+                return response
+
+        class MyHandler(RequestHandler):
+            middleware = [MyMiddleware('a'), MyMiddleware('b')]
+
+            def get(self, **kwargs):
+                calls.append('get')
+                return Response('default')
+
+        app = Tipfy(rules=[
+            Rule('/', name='home', handler=MyHandler),
+        ])
+        client = app.get_test_client()
+        client.get('/')
+        client.get('/')
+        self.assertEqual(calls, ['before_a', 'before_b', 'get', 'after_b',
+            'after_a'] * 2)
+
+
+class TestAppMiddleware(BaseTestCase):
+    def test_before_request(self):
+        instances = []
+
+        class MyMiddleware(object):
+            def before_request(self, request):
+                if request.path == '/health':
+                    return Response('ok')
+
+        class MyHandler(RequestHandler):
+            def __init__(self, request):
+                RequestHandler.__init__(self, request)
+                instances.append(self)
+
+            def get(self, **kwargs):
+                return Response('default')
+
+        app = Tipfy(rules=[
+            Rule('/', name='home', handler=MyHandler),
+        ], middleware=[MyMiddleware()])
+        client = app.get_test_client()
+
+        response = client.get('/health')
+        self.assertEqual(response.data, 'ok')
+        self.assertEqual(instances, [])
+
+        response = client.get('/')
+        self.assertEqual(response.data, 'default')
+        self.assertEqual(len(instances), 1)
+
+    def test_after_request(self):
+        class MyMiddleware(object):
+            def __init__(self, name):
+                self.name = name
+
+            def before_request(self, request):
+                if request.path == '/intercepted':
+                    return 'intercepted'
+
+            def after_request(self, request, response):
+                response.data += '-' + self.name
+                return response
+
+        class MyHandler(RequestHandler):
+            def get(self, **kwargs):
+                return Response('default')
+
+        class MyApp(Tipfy):
+            middleware = [MyMiddleware('a'), MyMiddleware('b')]
+
+        app = MyApp(rules=[
+            Rule('/', name='home', handler=MyHandler),
+        ])
+        client = app.get_test_client()
+
+        self.assertEqual(client.get('/').data, 'default-b-a')
+        self.assertEqual(client.get('/intercepted').data,
+            'intercepted-b-a')
+
+    def test_exception(self):
+        class MyMiddleware(object):
+            def before_request(self, request):
+                raise ValueError()
+
+        class Handle500(RequestHandler):
+            def handle_exception(self, exception=None):
+                return Response('500 custom handler', status=500)
+
+        app = Tipfy(rules=[
+            Rule('/', name='home', handler=AllMethodsHandler),
+        ], middleware=[MyMiddleware()])
+        app.error_handlers[500] = Handle500
+        client = app.get_test_client()
+
+        response = client.get('/')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.data, '500 custom handler')
+
+    def test_middleware_hooks(self):
+        from tipfy.app import AppMiddleware
+
+        class MyMiddleware(object):
+            def after_request(self, request, response):
+                return response
+
+        middleware1 = AppMiddleware()
+        middleware2 = MyMiddleware()
+
+        app = Tipfy()
+        self.assertEqual(app.get_middleware_hooks(), ((), ()))
+
+        app.middleware = [middleware1, middleware2]
+        hooks = app.get_middleware_hooks()
+        self.assertEqual(hooks, (
+            (middleware1.before_request,),
+            (middleware2.after_request, middleware1.after_request),
+        ))
+        self.assertTrue(app.get_middleware_hooks() is hooks)
+
+    def test_etag_middleware(self):
+        from tipfy.middleware import ETagMiddleware
+
+        app = Tipfy(rules=[
+            Rule('/', name='home', handler=AllMethodsHandler),
+        ], middleware=[ETagMiddleware()])
+        client = app.get_test_client()
+
+        response = client.get('/')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        response = client.get('/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
 
 class TestTipfy(BaseTestCase):
     def test_custom_error_handlers(self):
@@ -518,6 +764,94 @@ class TestTipfy(BaseTestCase):
         app = Tipfy(config={'tipfy': {'foo': 'bar'}})
         self.assertEqual(app.get_config('tipfy', 'foo'), 'bar')
 
+    def test_warmup(self):
+        from tipfy import HandlerPrefix
+        from resources.handlers import HomeHandler
+
+        called = []
+
+        def warmup_function(app):
+            called.append(app)
+
+        app = Tipfy(rules=[
+            HandlerPrefix('resources.handlers.', [
+                Rule('/', name='home', handler='HomeHandler'),
+            ]),
+            Rule('/old', name='old', handler='not.a.Handler',
+                redirect_to='/'),
+        ], config={
+            'tipfy': {
+                'i18n_store_class': 'not.a.Store',
+                'warmup_functions': [warmup_function],
+            },
+        })
+        timings = app.warmup()
+
+        self.assertEqual([name for name, seconds in timings],
+            ['handlers', 'stores', 'warmup_function'])
+        self.assertEqual(called, [app])
+
+        rule = list(app.router.map.iter_rules('home'))[0]
+        self.assertEqual(rule.handler, HomeHandler)
+        self.assertEqual(app.session_store_class.__name__, 'SessionStore')
+
+    def test_warmup_on_init(self):
+        from resources.handlers import HomeHandler
+
+        app = Tipfy(rules=[
+            Rule('/', name='home', handler='resources.handlers.HomeHandler'),
+        ], config={'tipfy': {'warmup': True}})
+
+        rule = list(app.router.map.iter_rules('home'))[0]
+        self.assertEqual(rule.handler, HomeHandler)
+
+        client = app.get_test_client()
+        self.assertEqual(client.get('/').data, 'Hello, World!')
+
+    def test_warmup_import_error(self):
+        app = Tipfy(rules=[
+            Rule('/', name='home', handler='resources.missing.Handler'),
+        ])
+        self.assertRaises(ImportError, app.warmup)
+
+    def test_warmup_handler(self):
+        from tipfy.appengine.warmup import WarmupHandler
+
+        app = Tipfy(rules=[
+            Rule('/_ah/warmup', name='warmup', handler=WarmupHandler),
+        ])
+        client = app.get_test_client()
+        response = client.get('/_ah/warmup')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/plain')
+        self.assertTrue(response.data.startswith('handlers: '))
+        self.assertEqual(app.warmed_up, True)
+
+        response = client.get('/_ah/warmup')
+        self.assertEqual(response.data, 'Already warmed up.')
+
+    def test_warmup_handler_after_init(self):
+        from tipfy.appengine.warmup import WarmupHandler
+
+        called = []
+
+        app = Tipfy(rules=[
+            Rule('/_ah/warmup', name='warmup', handler=WarmupHandler),
+        ], config={
+            'tipfy': {
+                'warmup': True,
+                'warmup_functions': [called.append],
+            },
+        })
+        self.assertEqual(called, [app])
+        client = app.get_test_client()
+        response = client.get('/_ah/warmup')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, 'Already warmed up.')
+        self.assertEqual(called, [app])
+
 
 class TestRequest(BaseTestCase):
     def test_json(self):
@@ -535,5 +869,45 @@ class TestRequest(BaseTestCase):
         self.assertEqual(response.data, 'bar')
 
 
+
+class TestNamespace(BaseTestCase):
+    def test_lazy_attributes(self):
+        import tipfy.app
+        import tipfy.routing
+
+        self.assertTrue(tipfy.Tipfy is tipfy.app.Tipfy)
+        self.assertTrue(tipfy.Rule is tipfy.routing.Rule)
+        self.assertTrue(tipfy.i18n is sys.modules['tipfy.i18n'])
+        self.assertEqual(tipfy.default_config['server_name'], None)
+        self.assertRaises(AttributeError, getattr, tipfy, 'foo')
+
+    def test_star_import(self):
+        namespace = {}
+        exec 'from tipfy import *' in namespace
+        namespace.pop('__builtins__')
+        self.assertEqual(sorted(namespace), ['APPENGINE', 'APPLICATION_ID',
+            'CURRENT_VERSION_ID', 'DEFAULT_VALUE', 'DEV_APPSERVER',
+            'HTTPException', 'HandlerPrefix', 'NamePrefix', 'REQUIRED_VALUE',
+            'Request', 'RequestHandler', 'Response', 'Rule', 'Subdomain',
+            'Submount', 'Tipfy', 'abort', 'app', 'appengine', 'config',
+            'current_app', 'current_handler', 'default_config', 'handler',
+            'local', 'routing'])
+        self.assertTrue(namespace['app'] is sys.modules['tipfy.app'])
+
+    def test_profile_imports(self):
+        from tipfy.scripting import ImportProfiler
+
+        sys.modules.pop('resources.i18n', None)
+        profiler = ImportProfiler()
+        with profiler:
+            import resources.i18n
+
+        self.assertEqual([node[0] for node in profiler.root[2]],
+            ['resources.i18n'])
+        self.assertTrue(profiler.format().splitlines()[0].endswith(
+            'ms  resources.i18n'))
+        self.assertEqual(profiler.format(threshold=60000), '')
+
+
 if __name__ == '__main__':
     test_utils.main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+    Tests for tipfy.cache
+"""
+import unittest
+
+from tipfy.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_get_set(self):
+        cache = LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+
+        self.assertEqual(cache['a'], 1)
+        self.assertEqual(cache.get('b'), 2)
+        self.assertEqual(cache.get('c'), None)
+        self.assertEqual(cache.get('c', 3), 3)
+        self.assertRaises(KeyError, cache.__getitem__, 'c')
+        self.assertEqual(len(cache), 2)
+
+    def test_discard_least_recently_used(self):
+        cache = LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache.get('a')
+        cache['c'] = 3
+
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertTrue('c' in cache)
+
+        cache['a'] = 4
+        cache['d'] = 5
+        self.assertEqual(cache['a'], 4)
+        self.assertFalse('c' in cache)
+
+    def test_delete(self):
+        cache = LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+
+        del cache['a']
+        self.assertFalse('a' in cache)
+        self.assertRaises(KeyError, cache.__delitem__, 'a')
+
+        self.assertEqual(cache.pop('b'), 2)
+        self.assertEqual(cache.pop('b'), None)
+        self.assertEqual(len(cache), 0)
+
+        cache['c'] = 3
+        cache['d'] = 4
+        cache['e'] = 5
+        self.assertEqual(len(cache), 2)
+
+    def test_clear(self):
+        cache = LRUCache(2)
+        cache['a'] = 1
+        cache.clear()
+
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get('a'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
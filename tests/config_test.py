@@ -8,7 +8,7 @@ import unittest
 
 from tipfy import Tipfy, RequestHandler, REQUIRED_VALUE
 from tipfy.app import local
-from tipfy.config import Config
+from tipfy.config import Config, FrozenConfig, FrozenSubConfig
 
 import test_utils
 
@@ -358,6 +358,134 @@ class TestLoadConfigGetItem(test_utils.BaseTestCase):
         self.assertRaises(KeyError, config['tipfy'].__getitem__, 'foo')
 
 
+class TestPreloadConfig(test_utils.BaseTestCase):
+    def test_preload(self):
+        config = Config({'resources.i18n': {'required': 'foo'}})
+        config.preload(['resources.i18n', 'resources.template'])
+        self.assertEqual(config.loaded >= set(['resources.i18n', 'resources.template']), True)
+        self.assertEqual(dict.get(config, 'resources.template'), {'templates_dir': 'templates'})
+
+    def test_preload_required(self):
+        config = Config()
+        self.assertRaises(KeyError, config.preload, ['resources.i18n'])
+
+    def test_preload_missing_module(self):
+        config = Config()
+        self.assertRaises(KeyError, config.preload, ['i_dont_exist'])
+
+    def test_app(self):
+        app = Tipfy(config={
+            'tipfy': {
+                'preload_config': ['resources.template'],
+            },
+        })
+        self.assertEqual('resources.template' in app.config.loaded, True)
+
+        self.assertRaises(KeyError, Tipfy, config={
+            'tipfy': {
+                'preload_config': ['tipfy.sessions'],
+            },
+        })
+
+        app = Tipfy(config={
+            'tipfy': {
+                'preload_config': ['tipfy.sessions'],
+                'freeze_config': True,
+            },
+            'tipfy.sessions': {
+                'secret_key': 'secret',
+            },
+        })
+        self.assertEqual(app.config['tipfy.sessions']['cookie_name'], 'session')
+
+
+class TestFrozenConfig(test_utils.BaseTestCase):
+    def test_freeze(self):
+        config = Config({
+            'resources.i18n': {
+                'locale': 'pt_BR',
+                'required': 'foo',
+            },
+        })
+        frozen = config.freeze()
+
+        self.assertEqual(isinstance(frozen, FrozenConfig), True)
+        self.assertEqual(frozen['resources.i18n']['locale'], 'pt_BR')
+        self.assertEqual(frozen['resources.i18n']['timezone'], 'America/Chicago')
+        self.assertEqual(frozen['resources.i18n'].get('foo', 'bar'), 'bar')
+        self.assertEqual(frozen.get_config('resources.i18n', 'required'), 'foo')
+        self.assertEqual(frozen.get('foo'), {})
+        self.assertRaises(KeyError, frozen['resources.i18n'].__getitem__, 'foo')
+
+    def test_freeze_required(self):
+        config = Config({
+            'resources.i18n': {
+                'locale': 'pt_BR',
+            },
+        })
+        self.assertRaises(KeyError, config.freeze)
+
+    def test_freeze_modules(self):
+        config = Config()
+        self.assertRaises(KeyError, config.freeze, ['resources.i18n'])
+
+        config = Config({'resources.i18n': {'required': 'foo'}})
+        frozen = config.freeze(['resources.template'])
+        self.assertEqual(frozen['resources.template']['templates_dir'], 'templates')
+
+    def test_missing_module(self):
+        frozen = Config().freeze()
+
+        # Loaded and validated on first access.
+        self.assertEqual(frozen['resources.template']['templates_dir'], 'templates')
+        self.assertEqual(isinstance(frozen['resources.template'], FrozenSubConfig), True)
+        self.assertRaises(KeyError, frozen.__getitem__, 'resources.i18n')
+        self.assertRaises(KeyError, frozen.__getitem__, 'resources.i18n')
+        self.assertRaises(KeyError, frozen.__getitem__, 'i_dont_exist')
+        self.assertRaises(KeyError, frozen.__getitem__, 'i_dont_exist')
+
+    def test_set(self):
+        frozen = Config({'resources.i18n': {'required': 'foo'}}).freeze()
+        self.assertRaises(TypeError, frozen.__setitem__, 'foo', {})
+        self.assertRaises(TypeError, frozen.setdefault, 'foo', {})
+        self.assertRaises(TypeError, frozen.update, 'foo', {})
+        self.assertRaises(TypeError, frozen.__delitem__, 'resources.i18n')
+        self.assertRaises(TypeError, frozen.pop, 'resources.i18n')
+        self.assertRaises(TypeError, frozen.popitem)
+        self.assertRaises(TypeError, frozen.clear)
+
+        for module in ('resources.i18n', 'resources.template'):
+            module_dict = frozen[module]
+            self.assertRaises(TypeError, module_dict.__setitem__, 'foo', 1)
+            self.assertRaises(TypeError, module_dict.setdefault, 'foo', 1)
+            self.assertRaises(TypeError, module_dict.update, {'foo': 1})
+            self.assertRaises(TypeError, module_dict.__delitem__, 'foo')
+            self.assertRaises(TypeError, module_dict.pop, 'foo')
+            self.assertRaises(TypeError, module_dict.popitem)
+            self.assertRaises(TypeError, module_dict.clear)
+            self.assertEqual('foo' in module_dict, False)
+
+        self.assertEqual(frozen.get_config('resources.i18n', 'required'), 'foo')
+
+    def test_get_config_missing_key(self):
+        frozen = Config({'resources.i18n': {'required': 'foo'}}).freeze()
+        self.assertRaises(KeyError, frozen.get_config, 'resources.i18n',
+            'i_dont_exist')
+        self.assertEqual(frozen.get_config('resources.i18n', 'i_dont_exist',
+            'bar'), 'bar')
+
+    def test_app(self):
+        app = Tipfy(config={
+            'tipfy': {
+                'freeze_config': True,
+            },
+        })
+        self.assertEqual(isinstance(app.config, FrozenConfig), True)
+        self.assertEqual(app.config['tipfy']['freeze_config'], True)
+        self.assertRaises(KeyError, app.get_config, 'tipfy', 'i_dont_exist')
+        self.assertRaises(TypeError, app.config['tipfy'].__setitem__, 'x', 1)
+
+
 class TestGetConfig(test_utils.BaseTestCase):
     '''
     def test_get_config(self):
@@ -146,6 +146,21 @@ class TestJinja2(test_utils.BaseTestCase):
         res = jinja2.render_template(handler, 'template1.html', message=message)
         self.assertEqual(res, message)
 
+    def test_warmup(self):
+        app = Tipfy(config={
+            'tipfy': {
+                'warmup_functions': ['tipfyext.jinja2.warmup'],
+            },
+            'tipfyext.jinja2': {
+                'templates_dir': templates_dir,
+            },
+        })
+        self.assertFalse('jinja2' in app.registry)
+
+        timings = app.warmup()
+        self.assertEqual(timings[-1][0], 'tipfyext.jinja2.warmup')
+        self.assertTrue(isinstance(app.registry['jinja2'], Jinja2))
+
     def test_engine_factory2(self):
         old_sys_path = sys.path[:]
         sys.path.insert(0, current_dir)
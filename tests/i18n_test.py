@@ -7,8 +7,14 @@ from __future__ import with_statement
 import datetime
 import gettext as gettext_stdlib
 import os
+import shutil
+import StringIO
+import tempfile
 import unittest
 
+from babel import dates as babel_dates
+from babel.messages.catalog import Catalog
+from babel.messages.mofile import write_mo
 from babel.numbers import NumberFormatError
 
 from pytz.gae import pytz
@@ -179,6 +185,45 @@ class BaseTestCase(test_utils.BaseTestCase):
             handler.request.rule_args = {'locale': 'es_ES'}
             self.assertEqual(handler.i18n.locale, 'es_ES')
 
+    def test_get_store_for_request_lazy(self):
+        app = self.get_app()
+        app.config['tipfy.i18n']['locale_request_lookup'] = [
+            ('form', 'language'),
+            ('session', '_locale'),
+        ]
+
+        with app.get_test_handler('/', data={'foo': 'bar'}, method='POST') as handler:
+            i18n_store = handler.i18n
+            self.assertFalse('form' in handler.request.__dict__)
+            self.assertFalse('session' in handler.request.__dict__)
+
+            self.assertEqual(i18n_store.gettext('foo'), u'foo')
+            self.assertEqual(i18n_store.locale, 'en_US')
+            self.assertTrue('form' in handler.request.__dict__)
+            self.assertTrue('session' in handler.request.__dict__)
+
+        with app.get_test_handler('/', data={'foo': 'bar'}, method='POST') as handler:
+            handler.i18n.set_locale('pt_BR')
+            self.assertEqual(handler.i18n.locale, 'pt_BR')
+            self.assertFalse('form' in handler.request.__dict__)
+
+    def test_get_store_for_request_multipart_form(self):
+        app = self.get_app()
+        app.config['tipfy.i18n']['locale_request_lookup'] = [('form', 'language')]
+        data = {
+            'language': 'es_ES',
+            'file': (StringIO.StringIO('contents'), 'file.txt'),
+        }
+
+        with app.get_test_handler('/', data=data, method='POST') as handler:
+            self.assertEqual(handler.i18n.locale, 'en_US')
+            self.assertFalse('form' in handler.request.__dict__)
+
+        app.config['tipfy.i18n']['lookup_multipart_form'] = True
+        data['file'] = (StringIO.StringIO('contents'), 'file.txt')
+        with app.get_test_handler('/', data=data, method='POST') as handler:
+            self.assertEqual(handler.i18n.locale, 'es_ES')
+
     #==========================================================================
     # Date formatting
     #==========================================================================
@@ -460,6 +505,34 @@ class BaseTestCase(test_utils.BaseTestCase):
         i18n.set_locale('de')
         self.assertRaises(NumberFormatError, i18n.parse_decimal, '2,109,998')
 
+    def test_memoized_patterns(self):
+        store = get_request().i18n
+        pattern = store._get_pattern('date', 'iso')
+        self.assertTrue(store._get_pattern('date', 'iso') is pattern)
+        self.assertTrue(store._get_pattern('date', "yyyy'-'MM'-'dd") is
+            pattern)
+
+        value = datetime.datetime(2009, 11, 10, 16, 36, 05)
+        i18n.set_locale('pt_BR')
+        self.assertFalse(store._get_pattern('datetime', 'short') is
+            store._get_pattern('date', 'short'))
+        self.assertEqual(i18n.format_datetime(value, format='short'),
+            babel_dates.format_datetime(value, format='short',
+            tzinfo=pytz.UTC, locale='pt_BR'))
+
+    def test_interned_objects(self):
+        store = get_request().i18n
+        i18n.set_timezone('America/Chicago')
+        tzinfo = store.tzinfo
+        i18n.set_timezone('UTC')
+        i18n.set_timezone('America/Chicago')
+        self.assertTrue(store.tzinfo is tzinfo)
+
+        locale = store.babel_locale
+        self.assertEqual(str(locale), 'en_US')
+        i18n.set_locale('en_US')
+        self.assertTrue(store.babel_locale is locale)
+
     #==========================================================================
     # Miscelaneous
     #==========================================================================
@@ -487,5 +560,150 @@ class BaseTestCase(test_utils.BaseTestCase):
         os.chdir(cwd)
 
 
+
+class LoggedI18nStore(i18n.I18nStore):
+    loaded = []
+
+    def load_translations(self, locales, dirname='locale', domain='messages'):
+        self.loaded.append(locales)
+        return i18n.I18nStore.load_translations(self, locales, dirname,
+            domain)
+
+
+class TestCompiledTranslations(test_utils.BaseTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.locale_dir = os.path.join(self.tmp_dir, 'locale')
+        catalog = Catalog(locale='pt_BR')
+        catalog.add('foo', u'f\xf3')
+        catalog.add(('One foo', 'Many foos'), (u'Um f\xf3', u'Muitos f\xf3s'))
+        for locale in ('pt_BR', 'en_US'):
+            path = os.path.join(self.locale_dir, locale, 'LC_MESSAGES')
+            os.makedirs(path)
+            f = open(os.path.join(path, 'messages.mo'), 'wb')
+            write_mo(f, catalog)
+            f.close()
+
+        test_utils.BaseTestCase.setUp(self)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        test_utils.BaseTestCase.tearDown(self)
+
+    def test_compile_translations(self):
+        paths = i18n.compile_translations(self.locale_dir)
+        self.assertEqual(paths, [
+            os.path.join(self.locale_dir, 'en_US', 'LC_MESSAGES',
+                'messages.marshal'),
+            os.path.join(self.locale_dir, 'pt_BR', 'LC_MESSAGES',
+                'messages.marshal'),
+        ])
+
+        translations = i18n.load_translations(['pt_BR'], self.locale_dir,
+            compiled=True)
+        self.assertTrue(isinstance(translations, i18n.CompiledTranslations))
+        mo = i18n.load_translations(['pt_BR'], self.locale_dir)
+        self.assertFalse(isinstance(mo, i18n.CompiledTranslations))
+
+        for t in (translations, mo):
+            self.assertEqual(t.ugettext('foo'), u'f\xf3')
+            self.assertEqual(t.ugettext('bar'), u'bar')
+            self.assertTrue(isinstance(t.ugettext('bar'), unicode))
+            self.assertEqual(t.ungettext('One foo', 'Many foos', 1),
+                u'Um f\xf3')
+            self.assertEqual(t.ungettext('One foo', 'Many foos', 2),
+                u'Muitos f\xf3s')
+            self.assertEqual(t.ungettext('One bar', 'Many bars', 2),
+                u'Many bars')
+
+        # Compiled catalogs are found for the language too.
+        translations = i18n.CompiledTranslations.load(self.locale_dir,
+            ['es_ES', 'pt'])
+        self.assertEqual(translations, None)
+        os.rename(os.path.join(self.locale_dir, 'pt_BR'),
+            os.path.join(self.locale_dir, 'pt'))
+        translations = i18n.CompiledTranslations.load(self.locale_dir,
+            ['pt_BR'])
+        self.assertEqual(translations.ugettext('foo'), u'f\xf3')
+
+    def test_locale_order(self):
+        i18n.compile_translations(self.locale_dir)
+        # pt_BR only has a .mo file, which is preferred to the compiled
+        # catalog of the next locale.
+        os.remove(os.path.join(self.locale_dir, 'pt_BR', 'LC_MESSAGES',
+            'messages.marshal'))
+        self.assertEqual(i18n.CompiledTranslations.load(self.locale_dir,
+            ['pt_BR', 'en_US']), None)
+        translations = i18n.load_translations(['pt_BR', 'en_US'],
+            self.locale_dir, compiled=True)
+        self.assertFalse(isinstance(translations, i18n.CompiledTranslations))
+        self.assertEqual(translations.ugettext('foo'), u'f\xf3')
+
+        translations = i18n.load_translations(['es_ES', 'en_US'],
+            self.locale_dir, compiled=True)
+        self.assertTrue(isinstance(translations, i18n.CompiledTranslations))
+
+    def test_stale_compiled_catalog(self):
+        i18n.compile_translations(self.locale_dir)
+        path = os.path.join(self.locale_dir, 'pt_BR', 'LC_MESSAGES',
+            'messages')
+        mtime = os.stat(path + '.marshal').st_mtime
+        os.utime(path + '.mo', (mtime + 10, mtime + 10))
+        translations = i18n.load_translations(['pt_BR'], self.locale_dir,
+            compiled=True)
+        self.assertFalse(isinstance(translations, i18n.CompiledTranslations))
+
+        # A compiled catalog without a .mo file is used.
+        os.remove(path + '.mo')
+        translations = i18n.load_translations(['pt_BR'], self.locale_dir,
+            compiled=True)
+        self.assertTrue(isinstance(translations, i18n.CompiledTranslations))
+
+    def test_preload_translations_store(self):
+        app = App(config={
+            'tipfy': {
+                'i18n_store_class': 'i18n_test.LoggedI18nStore',
+            },
+        })
+        del LoggedI18nStore.loaded[:]
+        app.i18n_store_class.preload_translations(app, self.locale_dir)
+        self.assertEqual(sorted(LoggedI18nStore.loaded), [['en_US'],
+            ['pt_BR', 'en_US']])
+        self.assertEqual(sorted(app.registry['i18n.translations'].keys()),
+            ['en_US', 'pt_BR'])
+
+    def test_warmup(self):
+        i18n.compile_translations(self.locale_dir)
+        app = App(config={
+            'tipfy': {
+                'warmup_functions': ['tipfy.i18n.warmup'],
+            },
+            'tipfy.i18n': {
+                'compiled_translations': True,
+            },
+            'tipfy.sessions': {
+                'secret_key': 'secret',
+            },
+        })
+
+        cwd = os.getcwd()
+        os.chdir(self.tmp_dir)
+        try:
+            app.warmup()
+        finally:
+            os.chdir(cwd)
+
+        translations = app.registry['i18n.translations']
+        self.assertEqual(sorted(translations.keys()), ['en_US', 'pt_BR'])
+        self.assertTrue(isinstance(translations['pt_BR'],
+            i18n.CompiledTranslations))
+
+        with app.get_test_context('/') as request:
+            request.i18n.set_locale('pt_BR')
+            self.assertTrue(request.i18n.translations is
+                translations['pt_BR'])
+            self.assertEqual(request.i18n.gettext('foo'), u'f\xf3')
+
+
 if __name__ == '__main__':
     test_utils.main()
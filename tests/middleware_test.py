@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+"""
+    Tests for tipfy.middleware
+"""
+from werkzeug import generate_etag, quote_etag
+from werkzeug.contrib.cache import SimpleCache
+
+from tipfy import RequestHandler, Response, Rule, Tipfy
+from tipfy.middleware import (ETagMiddleware, ResponseCache,
+    ResponseCacheMiddleware)
+
+import test_utils
+
+
+class DictCache(SimpleCache):
+    """A stand-in for memcache that counts reads."""
+    reads = 0
+
+    def get(self, key):
+        DictCache.reads += 1
+        return SimpleCache.get(self, key)
+
+
+class ForgetfulCache(DictCache):
+    """A backend that doesn't keep tag versions."""
+    def add(self, key, value, timeout=None):
+        if not key.startswith(ResponseCache.tag_prefix):
+            DictCache.add(self, key, value, timeout)
+
+
+calls = []
+handlers = []
+
+
+class CachedHandler(RequestHandler):
+    middleware = [ResponseCacheMiddleware(ttl=60, tags=['pages'],
+        vary_headers=['Accept-Language'], public=True)]
+
+    def __init__(self, request):
+        handlers.append(self)
+        RequestHandler.__init__(self, request)
+
+    def get(self, **kwargs):
+        calls.append(kwargs)
+        return Response('Hello, %s! %d' % (kwargs.get('name', 'World'),
+            len(calls)))
+
+    def post(self, **kwargs):
+        calls.append(kwargs)
+        return Response('Posted %d' % len(calls))
+
+
+class LoginRequiredMiddleware(object):
+    def before_dispatch(self, handler):
+        if 'X-User' not in handler.request.headers:
+            return Response('Login required', status=403)
+
+
+class PrivateHandler(CachedHandler):
+    middleware = [LoginRequiredMiddleware(), ResponseCacheMiddleware()]
+
+
+class CookieHandler(CachedHandler):
+    def get(self, **kwargs):
+        response = CachedHandler.get(self, **kwargs)
+        response.set_cookie('foo', 'bar')
+        return response
+
+
+def get_app(size=100, middleware=None, backend=DictCache):
+    return Tipfy(middleware=middleware, rules=[
+        Rule('/', name='home', handler=CachedHandler),
+        Rule('/hello/<name>', name='hello', handler=CachedHandler),
+        Rule('/cookie', name='cookie', handler=CookieHandler),
+        Rule('/private', name='private', handler=PrivateHandler),
+    ], config={
+        'tipfy.middleware': {
+            'response_cache_backend': backend,
+            'response_cache_size': size,
+        },
+    })
+
+
+class TestResponseCacheMiddleware(test_utils.BaseTestCase):
+    def setUp(self):
+        del calls[:]
+        del handlers[:]
+        DictCache.reads = 0
+        test_utils.BaseTestCase.setUp(self)
+
+    def test_hit(self):
+        client = get_app().get_test_client()
+
+        response = client.get('/')
+        self.assertEqual(response.data, 'Hello, World! 1')
+        headers = list(response.headers)
+        response = client.get('/')
+        self.assertEqual(response.data, 'Hello, World! 1')
+        self.assertEqual(list(response.headers), headers)
+        self.assertEqual(len(calls), 1)
+
+        response = client.head('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(calls), 1)
+
+    def test_key(self):
+        client = get_app().get_test_client()
+
+        self.assertEqual(client.get('/hello/foo').data, 'Hello, foo! 1')
+        self.assertEqual(client.get('/hello/bar').data, 'Hello, bar! 2')
+        self.assertEqual(client.get('/hello/foo').data, 'Hello, foo! 1')
+        self.assertEqual(client.get('/hello/foo?a=b').data, 'Hello, foo! 3')
+        self.assertEqual(client.get('/hello/foo', headers={
+            'Accept-Language': 'pt-BR'}).data, 'Hello, foo! 4')
+        self.assertEqual(client.get('/hello/foo?a=b').data, 'Hello, foo! 3')
+
+    def test_not_cached(self):
+        client = get_app().get_test_client()
+
+        self.assertEqual(client.post('/').data, 'Posted 1')
+        self.assertEqual(client.post('/').data, 'Posted 2')
+        self.assertEqual(client.get('/cookie').data, 'Hello, World! 3')
+        self.assertEqual(client.get('/cookie').data, 'Hello, World! 4')
+
+    def test_local_tier(self):
+        app = get_app()
+        client = app.get_test_client()
+
+        client.get('/')
+        reads = DictCache.reads
+        client.get('/')
+        # Nothing was read from the backend.
+        self.assertEqual(DictCache.reads, reads)
+
+        # Without the local tier, responses are read from the backend.
+        ResponseCache.factory(app).local.clear()
+        self.assertEqual(client.get('/').data, 'Hello, World! 1')
+        self.assertEqual(DictCache.reads, reads + 1)
+
+    def test_backend_only(self):
+        app = get_app(size=0)
+        client = app.get_test_client()
+        self.assertEqual(ResponseCache.factory(app).local, None)
+
+        self.assertEqual(client.get('/').data, 'Hello, World! 1')
+        self.assertEqual(client.get('/').data, 'Hello, World! 1')
+
+    def test_app_middleware(self):
+        app = get_app(middleware=[ResponseCacheMiddleware()])
+        client = app.get_test_client()
+
+        self.assertEqual(client.get('/hello/foo').data, 'Hello, foo! 1')
+        self.assertEqual(len(handlers), 1)
+        # The cached response is served without creating a handler.
+        self.assertEqual(client.get('/hello/foo').data, 'Hello, foo! 1')
+        self.assertEqual(client.head('/hello/foo').status_code, 200)
+        self.assertEqual(len(handlers), 1)
+
+        # The headers the handler middleware varies on are used.
+        self.assertEqual(client.get('/hello/foo', headers={
+            'Accept-Language': 'pt-BR'}).data, 'Hello, foo! 2')
+        self.assertEqual(client.get('/hello/foo', headers={
+            'Accept-Language': 'pt-BR'}).data, 'Hello, foo! 2')
+        self.assertEqual(len(handlers), 2)
+
+        ResponseCache.factory(app).invalidate_tags('pages')
+        self.assertEqual(client.get('/hello/foo').data, 'Hello, foo! 3')
+        self.assertEqual(len(handlers), 3)
+
+    def test_app_middleware_private(self):
+        app = get_app(middleware=[ResponseCacheMiddleware()])
+        client = app.get_test_client()
+
+        headers = {'X-User': 'alice'}
+        self.assertEqual(client.get('/private', headers=headers).data,
+            'Hello, World! 1')
+        self.assertEqual(client.get('/private', headers=headers).data,
+            'Hello, World! 1')
+        self.assertEqual(len(calls), 1)
+
+        # The handler didn't opt in, so the app middleware doesn't serve
+        # the cached response and the login check runs.
+        response = client.get('/private')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.data, 'Login required')
+        self.assertEqual(len(handlers), 3)
+
+    def test_app_middleware_vary_locale(self):
+        class Handler(CachedHandler):
+            middleware = [ResponseCacheMiddleware(vary_locale=True,
+                public=True)]
+
+            def get(self, **kwargs):
+                response = CachedHandler.get(self, **kwargs)
+                response.data += ' ' + self.i18n.locale
+                return response
+
+        app = get_app(middleware=[ResponseCacheMiddleware()])
+        app.config['tipfy.i18n']['locale_request_lookup'] = [
+            ('rule_args', 'locale')]
+        app.router.add(Rule('/<locale>/page', name='page', handler=Handler))
+        client = app.get_test_client()
+
+        self.assertEqual(client.get('/pt_BR/page').data,
+            'Hello, World! 1 pt_BR')
+        self.assertEqual(client.get('/en_US/page').data,
+            'Hello, World! 2 en_US')
+        self.assertEqual(client.get('/pt_BR/page').data,
+            'Hello, World! 1 pt_BR')
+        self.assertEqual(len(handlers), 2)
+
+    def test_local_tag_versions(self):
+        app = get_app()
+        client = app.get_test_client()
+        cache = ResponseCache.factory(app)
+
+        self.assertEqual(client.get('/').data, 'Hello, World! 1')
+        # Another process invalidates the tag.
+        cache.backend.set(cache.tag_prefix + 'pages', 0)
+        self.assertEqual(client.get('/').data, 'Hello, World! 1')
+
+        # The tag version is read again once the local one expires.
+        cache.tag_versions.clear()
+        self.assertEqual(client.get('/').data, 'Hello, World! 2')
+
+    def test_missing_tag_version(self):
+        app = get_app(backend=ForgetfulCache)
+        client = app.get_test_client()
+        cache = ResponseCache.factory(app)
+
+        cache.set('foo', (200, [], 'bar'), 60, ['foo'])
+        # The entry can't be checked against the tag version, so it is
+        # not served.
+        self.assertEqual(cache.get('foo'), None)
+        self.assertEqual(client.get('/').data, 'Hello, World! 1')
+        self.assertEqual(client.get('/').data, 'Hello, World! 2')
+
+    def test_invalidate_tags(self):
+        app = get_app()
+        client = app.get_test_client()
+
+        self.assertEqual(client.get('/').data, 'Hello, World! 1')
+        ResponseCache.factory(app).invalidate_tags('other')
+        self.assertEqual(client.get('/').data, 'Hello, World! 1')
+        ResponseCache.factory(app).invalidate_tags('pages')
+        self.assertEqual(client.get('/').data, 'Hello, World! 2')
+        self.assertEqual(client.get('/').data, 'Hello, World! 2')
+
+    def test_ttl(self):
+        app = get_app()
+        cache = ResponseCache.factory(app)
+
+        cache.set('foo', (200, [], 'bar'), 60)
+        self.assertEqual(cache.get('foo'), (200, [], 'bar'))
+        cache.set('foo', (200, [], 'bar'), -1)
+        self.assertEqual(cache.get('foo'), None)
+
+    def test_callable_tags(self):
+        middleware = ResponseCacheMiddleware(tags=lambda handler: [
+            handler.request.rule_args['name']])
+
+        class Handler(CachedHandler):
+            pass
+
+        Handler.middleware = [middleware]
+        app = get_app()
+        app.router.add(Rule('/tagged/<name>', name='tagged', handler=Handler))
+        client = app.get_test_client()
+
+        self.assertEqual(client.get('/tagged/foo').data, 'Hello, foo! 1')
+        self.assertEqual(client.get('/tagged/bar').data, 'Hello, bar! 2')
+        ResponseCache.factory(app).invalidate_tags('foo')
+        self.assertEqual(client.get('/tagged/foo').data, 'Hello, foo! 3')
+        self.assertEqual(client.get('/tagged/bar').data, 'Hello, bar! 2')
+
+
+class VersionedHandler(RequestHandler):
+    middleware = [ETagMiddleware()]
+    version = u'2011-01-01'
+
+    def get_etag(self, **kwargs):
+        return self.version
+
+    def get(self, **kwargs):
+        calls.append(kwargs)
+        return Response('Version %s' % self.version)
+
+
+class StreamedHandler(RequestHandler):
+    middleware = [ETagMiddleware()]
+
+    def get(self, **kwargs):
+        def generate():
+            calls.append(kwargs)
+            yield 'foo'
+            yield u'bar'
+
+        return Response(generate())
+
+
+class ListHandler(RequestHandler):
+    middleware = [ETagMiddleware()]
+
+    def get(self, **kwargs):
+        return Response(['foo', u'b\xe1r'])
+
+
+class TestETagMiddleware(test_utils.BaseTestCase):
+    def setUp(self):
+        del calls[:]
+        test_utils.BaseTestCase.setUp(self)
+
+    def get_app(self):
+        return Tipfy(rules=[
+            Rule('/versioned', name='versioned', handler=VersionedHandler),
+            Rule('/streamed', name='streamed', handler=StreamedHandler),
+            Rule('/list', name='list', handler=ListHandler),
+        ])
+
+    def test_body_etag(self):
+        client = self.get_app().get_test_client()
+
+        response = client.get('/list')
+        self.assertEqual(response.data, 'foob\xc3\xa1r')
+        etag = response.headers['ETag']
+        self.assertEqual(etag, '"%s"' % generate_etag(response.data))
+
+        response = client.get('/list', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+
+    def test_streamed(self):
+        client = self.get_app().get_test_client()
+
+        response = client.get('/streamed')
+        # The generator was not consumed to compute an etag.
+        self.assertEqual(calls, [])
+        self.assertEqual('ETag' in response.headers, False)
+        self.assertEqual(response.data, 'foobar')
+        self.assertEqual(len(calls), 1)
+
+    def test_get_etag(self):
+        client = self.get_app().get_test_client()
+
+        response = client.get('/versioned')
+        self.assertEqual(response.data, 'Version 2011-01-01')
+        etag = response.headers['ETag']
+        self.assertEqual(etag, quote_etag(generate_etag('2011-01-01'), True))
+        self.assertEqual(len(calls), 1)
+
+        response = client.get('/versioned', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        # The handler method was not called.
+        self.assertEqual(len(calls), 1)
+
+        VersionedHandler.version = u'2011-01-02'
+        try:
+            response = client.get('/versioned', headers={
+                'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(calls), 2)
+        finally:
+            VersionedHandler.version = u'2011-01-01'
+
+
+if __name__ == '__main__':
+    test_utils.main()
@@ -119,6 +119,206 @@ class TestRouting(test_utils.BaseTestCase):
             self.assertEqual(url_for('company-contact'), '/contact')
 
 
+class TestCompiledRouting(test_utils.BaseTestCase):
+    def get_app(self, rules):
+        return Tipfy(rules, config={'tipfy': {'compile_rules': True}})
+
+    def test_compiled_map(self):
+        from tipfy.routing import CompiledMap
+
+        app = self.get_app([Rule('/', name='home', handler='HomeHandler')])
+        self.assertTrue(isinstance(app.router.map, CompiledMap))
+
+    def test_match(self):
+        class DummyHandler(RequestHandler):
+            def get(self, **kwargs):
+                return Response('%s %r' % (self.request.rule.name,
+                    sorted(self.request.rule_args.items())))
+
+        app = self.get_app([
+            Rule('/', name='home', handler=DummyHandler),
+            Rule('/about', name='about', handler=DummyHandler),
+            Rule('/users/', name='users', handler=DummyHandler),
+            Rule('/users/<int:id>', name='user', handler=DummyHandler),
+            Rule('/<slug>', name='page', handler=DummyHandler),
+            Rule('/x<int:n>', name='x', handler=DummyHandler),
+        ])
+        client = app.get_test_client()
+
+        self.assertEqual(client.get('/').data, "home []")
+        self.assertEqual(client.get('/about').data, "about []")
+        self.assertEqual(client.get('/users/').data, "users []")
+        self.assertEqual(client.get('/users/42').data, "user [('id', 42)]")
+        self.assertEqual(client.get('/foo').data, "page [('slug', u'foo')]")
+        self.assertEqual(client.get('/x3').data, "x [('n', 3)]")
+
+        response = client.get('/users')
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response.headers['Location'],
+            'http://localhost/users/')
+
+        self.assertEqual(client.get('/users/foo').status_code, 404)
+
+    def test_method_not_allowed(self):
+        class DummyHandler(RequestHandler):
+            def post(self, **kwargs):
+                return Response('post')
+
+        app = self.get_app([
+            Rule('/form', name='form', handler=DummyHandler, methods=['POST']),
+        ])
+        client = app.get_test_client()
+
+        self.assertEqual(client.post('/form').data, 'post')
+        self.assertEqual(client.get('/form').status_code, 405)
+
+    def test_add(self):
+        class DummyHandler(RequestHandler):
+            def get(self, **kwargs):
+                return Response(self.request.rule.name)
+
+        app = self.get_app([Rule('/', name='home', handler=DummyHandler)])
+        client = app.get_test_client()
+        self.assertEqual(client.get('/about').status_code, 404)
+
+        app.router.add(Rule('/about', name='about', handler=DummyHandler))
+        self.assertEqual(client.get('/about').data, 'about')
+
+    def test_adapter_reuse(self):
+        class DummyHandler(RequestHandler):
+            def get(self, **kwargs):
+                return ''
+
+        app = self.get_app([
+            Rule('/', name='home', handler=DummyHandler),
+            Rule('/about', name='about', handler=DummyHandler),
+        ])
+
+        with app.get_test_context('/') as request:
+            app.router.match(request)
+            adapter = request.rule_adapter
+
+        with app.get_test_context('/about') as request:
+            app.router.match(request)
+            self.assertTrue(request.rule_adapter is adapter)
+            self.assertEqual(request.rule.name, 'about')
+
+        with app.get_test_context('/', base_url='https://localhost/') as request:
+            app.router.match(request)
+            self.assertFalse(request.rule_adapter is adapter)
+
+    def test_url_for(self):
+        class DummyHandler(RequestHandler):
+            def get(self, **kwargs):
+                return ''
+
+        app = self.get_app([
+            NamePrefix('company-', [
+                Rule('/', name='home', handler=DummyHandler),
+                Rule('/about', name='about', handler=DummyHandler),
+                Rule('/users/<int:id>', name='user', handler=DummyHandler),
+            ]),
+        ])
+
+        with app.get_test_handler('/') as handler:
+            self.assertEqual(url_for('company-home'), '/')
+            self.assertEqual(url_for('company-about', _full=True),
+                'http://localhost/about')
+            self.assertEqual(url_for('company-user', id=42), '/users/42')
+
+
+class TestUrlCache(test_utils.BaseTestCase):
+    def get_app(self):
+        class DummyHandler(RequestHandler):
+            def get(self, **kwargs):
+                return ''
+
+        return Tipfy([
+            Rule('/', name='home', handler=DummyHandler),
+            Rule('/users/<int:id>', name='user', handler=DummyHandler),
+            Rule('/tags/<tag>', name='tag', handler=DummyHandler),
+        ])
+
+    def test_static_url(self):
+        app = self.get_app()
+
+        with app.get_test_handler('/') as handler:
+            self.assertEqual(url_for('home'), '/')
+            self.assertEqual(url_for('home'), '/')
+            self.assertEqual(len(app.router.static_urls), 1)
+            self.assertEqual(len(app.router.urls), 0)
+
+            self.assertEqual(url_for('home', _full=True), 'http://localhost/')
+            self.assertEqual(len(app.router.static_urls), 2)
+
+    def test_url_with_args(self):
+        app = self.get_app()
+
+        with app.get_test_handler('/') as handler:
+            self.assertEqual(url_for('user', id=1), '/users/1')
+            self.assertEqual(url_for('user', id=1), '/users/1')
+            self.assertEqual(url_for('user', id=2), '/users/2')
+            self.assertEqual(len(app.router.urls), 2)
+
+            self.assertEqual(url_for('tag', tag=1), '/tags/1')
+            self.assertEqual(url_for('tag', tag=1.0), '/tags/1.0')
+            self.assertEqual(url_for('tag', tag=u'foo', page=2),
+                '/tags/foo?page=2')
+
+            # Values of other types are not cached.
+            self.assertEqual(url_for('tag', tag=u'foo', page=[1, 2]),
+                '/tags/foo?page=1&page=2')
+            self.assertEqual(len(app.router.urls), 5)
+
+    def test_special_keys(self):
+        app = self.get_app()
+
+        with app.get_test_handler('/') as handler:
+            self.assertEqual(url_for('user', id=1, _anchor='top'),
+                '/users/1#top')
+            self.assertEqual(url_for('user', id=1, _full=True),
+                'http://localhost/users/1')
+            self.assertEqual(url_for('user', id=1, _scheme='https'),
+                'https://localhost/users/1')
+            self.assertEqual(url_for('user', id=1, _netloc='foo.com'),
+                'http://foo.com/users/1')
+            self.assertEqual(url_for('home', _scheme='https', _anchor='a'),
+                'https://localhost/#a')
+
+    def test_invalidate_on_add(self):
+        class DummyHandler(RequestHandler):
+            def get(self, **kwargs):
+                return ''
+
+        app = self.get_app()
+
+        with app.get_test_handler('/') as handler:
+            self.assertEqual(url_for('user', id=1), '/users/1')
+            self.assertEqual(url_for('home'), '/')
+
+            app.router.add(Rule('/u/<int:id>', name='user',
+                handler=DummyHandler, defaults={'short': True}))
+            self.assertEqual(len(app.router.static_urls), 0)
+            self.assertEqual(len(app.router.urls), 0)
+
+            self.assertEqual(url_for('user', id=1, short=True), '/u/1')
+
+    def test_disabled(self):
+        class DisabledRouter(Router):
+            max_cached_urls = 0
+
+        class App(Tipfy):
+            router_class = DisabledRouter
+
+        app = App([Rule('/', name='home', handler='HomeHandler')])
+
+        with app.get_test_context('/') as request:
+            app.router.match(request)
+            self.assertEqual(app.router.url_for(request, 'home', {}), '/')
+            self.assertEqual(app.router.urls, None)
+            self.assertEqual(len(app.router.static_urls), 0)
+
+
 class TestAlternativeRouting(test_utils.BaseTestCase):
     def test_handler(self):
         rules = [
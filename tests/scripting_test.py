@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+    Tests for tipfy.scripting
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+import zipimport
+
+from tipfy.scripting import build_zip, get_lib_paths
+
+
+class TestZipBundle(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        src_dir = os.path.join(self.tmp_dir, 'src', 'zipped_pkg')
+        os.makedirs(src_dir)
+        for name, source in [
+            ('__init__.py', 'from zipped_pkg.mod import value\n'),
+            ('mod.py', 'value = 42\n'),
+            ('mod.pyc', 'stale'),
+            ('_speedups.so', ''),
+        ]:
+            f = open(os.path.join(src_dir, name), 'w')
+            f.write(source)
+            f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        for name in ('zipped_pkg', 'zipped_pkg.mod'):
+            sys.modules.pop(name, None)
+
+    def test_build_zip(self):
+        zip_path = os.path.join(self.tmp_dir, 'dist.zip')
+        build_zip(os.path.join(self.tmp_dir, 'src'), zip_path)
+
+        zip_file = zipfile.ZipFile(zip_path)
+        self.assertEqual(sorted(zip_file.namelist()), [
+            'zipped_pkg/__init__.py',
+            'zipped_pkg/__init__.pyc',
+            'zipped_pkg/mod.py',
+            'zipped_pkg/mod.pyc',
+        ])
+        zip_file.close()
+
+        module = zipimport.zipimporter(zip_path).load_module('zipped_pkg')
+        self.assertEqual(module.value, 42)
+        # The compiled module was used.
+        self.assertTrue(sys.modules['zipped_pkg.mod'].__file__.endswith(
+            'mod.pyc'))
+
+    def test_build_zip_without_pyc(self):
+        zip_path = os.path.join(self.tmp_dir, 'dist.zip')
+        build_zip(os.path.join(self.tmp_dir, 'src'), zip_path,
+            compile_pyc=False)
+
+        zip_file = zipfile.ZipFile(zip_path)
+        self.assertEqual(sorted(zip_file.namelist()), [
+            'zipped_pkg/__init__.py',
+            'zipped_pkg/mod.py',
+        ])
+        zip_file.close()
+
+    def test_get_lib_paths(self):
+        app_path = os.path.join(self.tmp_dir, 'app')
+        lib_path = os.path.join(app_path, 'lib')
+        os.makedirs(lib_path)
+        self.assertEqual(get_lib_paths(app_path), [lib_path])
+
+        zip_path = os.path.join(lib_path, 'dist.zip')
+        build_zip(os.path.join(self.tmp_dir, 'src'), zip_path)
+        try:
+            self.assertEqual(get_lib_paths(app_path), [lib_path, zip_path])
+            self.assertTrue(isinstance(sys.path_importer_cache[zip_path],
+                zipimport.zipimporter))
+        finally:
+            sys.path_importer_cache.pop(zip_path, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
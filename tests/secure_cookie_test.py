@@ -1,8 +1,11 @@
+from __future__ import with_statement
+
 import time
 import unittest
 
 from tipfy import Tipfy, Request, Response
-from tipfy.sessions import SessionStore, SecureCookieStore, SecureCookieSession
+from tipfy.sessions import (CompactSerializer, JSONSerializer, SessionStore,
+    SecureCookieStore, SecureCookieSession)
 
 import test_utils
 
@@ -50,6 +53,106 @@ class TestSecureCookie(test_utils.BaseTestCase):
         request = Request.from_values('/', headers=[('Cookie', 'session="eyJmb28iOiJiYXIifQ==|1284849476|847b472f2fabbf1efef55748a394b6f182acd8be"; Path=/')])
         self.assertEqual(store.get_cookie(request, 'session'), {'foo': 'bar'})
 
+    def test_sha256(self):
+        store = SecureCookieStore('secret', 'sha256')
+        value = store.get_signed_value('session', {'foo': 'bar'})
+        self.assertEqual(len(value.split('|')[2]), 64)
+
+        request = Request.from_values('/', headers=[('Cookie', 'session="%s"; Path=/' % value)])
+        self.assertEqual(store.get_cookie(request, 'session'), {'foo': 'bar'})
+
+        # A SHA-1 store doesn't accept the cookie.
+        store = SecureCookieStore('secret')
+        self.assertEqual(store.get_cookie(request, 'session'), None)
+
+    def test_check_signature(self):
+        store = SecureCookieStore('secret')
+        signature = store._get_signature('session', 'foo', '1284849476')
+        self.assertEqual(signature, store._get_signature('session', 'foo', '1284849476'))
+        self.assertEqual(store._check_signature(signature, signature), True)
+        self.assertEqual(store._check_signature(unicode(signature), signature), True)
+        self.assertEqual(store._check_signature(signature[:-1] + 'x', signature), False)
+        self.assertEqual(store._check_signature(signature[:-1], signature), False)
+        self.assertEqual(store._check_signature(u'\xe1' * 40, signature), False)
+
+    def test_shared_store(self):
+        app = self._get_app()
+        with app.get_test_context() as request:
+            store1 = SessionStore(request).secure_cookie_store
+        with app.get_test_context() as request:
+            store2 = SessionStore(request).secure_cookie_store
+        self.assertEqual(store1 is store2, True)
+        self.assertEqual(store1.secret_key, 'something very secret')
+
+
+class TestSerializers(test_utils.BaseTestCase):
+    def test_json(self):
+        serializer = JSONSerializer()
+        value = serializer.dumps({'foo': 'bar'})
+        self.assertEqual(value, 'eyJmb28iOiJiYXIifQ==')
+        self.assertEqual(serializer.loads(value), {'foo': 'bar'})
+        self.assertEqual(serializer.is_outdated(value), False)
+
+    def test_compact(self):
+        serializer = CompactSerializer()
+        data = {
+            '_flash': [['Hello', 'info']],
+            '_auth': {'id': 'foo'},
+            '_csrf_token': 'abc',
+            '_sid': 'def',
+            '!foo': 1,
+            '!!bar': 2,
+            '!a': 3,
+            'baz': 4,
+        }
+        value = serializer.dumps(data)
+        self.assertEqual(value.startswith('~j'), True)
+        self.assertEqual(serializer.loads(value), data)
+        self.assertEqual(serializer.loads(unicode(value)), data)
+        self.assertEqual(serializer.is_outdated(value), False)
+
+    def test_compact_compressed(self):
+        serializer = CompactSerializer()
+        data = {'_flash': [['Hello, World!', 'info']] * 20}
+        value = serializer.dumps(data)
+        self.assertEqual(value.startswith('~z'), True)
+        self.assertEqual(len(value) < len(JSONSerializer().dumps(data)) / 4, True)
+        self.assertEqual(serializer.loads(value), data)
+
+    def test_compact_reads_json(self):
+        serializer = CompactSerializer()
+        value = JSONSerializer().dumps({'_flash': [['Hello', 'info']]})
+        self.assertEqual(serializer.is_outdated(value), True)
+        self.assertEqual(serializer.loads(value), {'_flash': [['Hello', 'info']]})
+
+    def test_migrate_session(self):
+        app = Tipfy(config={
+            'tipfy.sessions': {
+                'secret_key': 'secret',
+                'serializer': 'compact',
+            }
+        })
+        json_store = SecureCookieStore('secret')
+        cookie = json_store.get_signed_value('session', {'foo': 'bar'})
+
+        with app.get_test_context(headers=[('Cookie', 'session="%s"' % cookie)]) as request:
+            store = request.session_store
+            self.assertEqual(isinstance(store.secure_cookie_store.serializer, CompactSerializer), True)
+            session = store.get_session()
+            self.assertEqual(session, {'foo': 'bar'})
+            self.assertEqual(session.modified, True)
+
+            response = Response()
+            store.save(response)
+            cookie = response.headers['Set-Cookie'].split(';')[0][len('session='):].strip('"')
+            self.assertEqual(cookie.startswith('~j'), True)
+
+        # Sessions already in the compact format are not saved again.
+        with app.get_test_context(headers=[('Cookie', 'session="%s"' % cookie)]) as request:
+            session = request.session_store.get_session()
+            self.assertEqual(session, {'foo': 'bar'})
+            self.assertEqual(session.modified, False)
+
 
 if __name__ == '__main__':
     test_utils.main()
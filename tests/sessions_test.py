@@ -1,13 +1,18 @@
 from __future__ import with_statement
 
+import copy
+import datetime
 import os
+import time
 import unittest
 
+from google.appengine.api import memcache
+
 from werkzeug import cached_property
 
 from tipfy.app import App, Request, Response
 from tipfy.handler import RequestHandler
-from tipfy.json import json_b64decode
+from tipfy.json import json_b64decode, json_encode
 from tipfy.local import local
 from tipfy.routing import Rule
 from tipfy.sessions import (SecureCookieSession, SecureCookieStore,
@@ -122,6 +127,136 @@ class TestSessionStoreBase(test_utils.BaseTestCase):
             self.assertEqual(json_b64decode(request.cookies.get('foo')), 'bar')
             self.assertEqual(json_b64decode(request.cookies.get('baz')), 'ding')
 
+    def test_app_middleware(self):
+        class MyHandler(RequestHandler):
+            def get(self, **kwargs):
+                self.session['foo'] = 'bar'
+                return Response('ok')
+
+        class OtherHandler(RequestHandler):
+            def get(self, **kwargs):
+                return Response('ok')
+
+        app = App(rules=[
+            Rule('/', name='home', handler=MyHandler),
+            Rule('/other', name='other', handler=OtherHandler),
+        ], config={
+            'tipfy.sessions': {
+                'secret_key': 'secret',
+            }
+        }, middleware=[SessionMiddleware()])
+        client = app.get_test_client()
+
+        response = client.get('/')
+        self.assertTrue(response.headers.get('Set-Cookie', '').startswith(
+            'session='))
+
+        response = client.get('/other')
+        self.assertEqual(response.headers.get('Set-Cookie'), None)
+
+    def test_lazy_session(self):
+        loaded = []
+
+        class LoggedSession(SecureCookieSession):
+            @classmethod
+            def get_session(cls, store, name=None, **kwargs):
+                loaded.append(name)
+                return super(LoggedSession, cls).get_session(store, name,
+                    **kwargs)
+
+        class MyHandler(BaseHandler):
+            def get(self, **kwargs):
+                return Response('ok')
+
+        app = App(rules=[Rule('/', name='home', handler=MyHandler)], config={
+            'tipfy.sessions': {
+                'secret_key': 'secret',
+            }
+        })
+        with app.get_test_context() as request:
+            request.session_store.backends = {'securecookie': LoggedSession}
+
+            # The session is only loaded when it is first used.
+            response = app.router.dispatch(request)
+            self.assertEqual(loaded, [])
+            self.assertEqual(response.headers.get('Set-Cookie'), None)
+
+            session = request.session
+            self.assertEqual(type(session), LoggedSession)
+            self.assertEqual(request.session is session, True)
+            self.assertEqual(loaded, ['session'])
+
+    def test_session_copy_and_json(self):
+        with self._get_app().get_test_context() as request:
+            session = request.session_store.get_session()
+            session['a'] = 1
+            self.assertEqual(json_encode(session), '{"a":1}')
+
+            # The session is returned itself, not a proxy that would be
+            # copied as an empty session.
+            self.assertEqual(type(session), SecureCookieSession)
+            self.assertRaises(TypeError, copy.copy, session)
+
+    def test_session_not_used(self):
+        class MyHandler(BaseHandler):
+            def get(self, **kwargs):
+                return Response('ok')
+
+        app = App(rules=[Rule('/', name='home', handler=MyHandler)], config={
+            'tipfy.sessions': {
+                'secret_key': 'secret',
+            }
+        })
+        with app.get_test_context() as request:
+            local.request = request
+            response = app.router.dispatch(request)
+            self.assertEqual(response.headers.get('Set-Cookie'), None)
+            self.assertEqual('session_store' in request.__dict__, False)
+
+    def test_handler_session_store(self):
+        class MySessionStore(SessionStore):
+            pass
+
+        class MyHandler(BaseHandler):
+            @cached_property
+            def session_store(self):
+                return MySessionStore(self.request)
+
+            def get(self, **kwargs):
+                self.session['foo'] = 'bar'
+                return Response('ok')
+
+        app = App(rules=[Rule('/', name='home', handler=MyHandler)], config={
+            'tipfy.sessions': {
+                'secret_key': 'secret',
+            }
+        })
+        client = app.get_test_client()
+
+        # The session is saved by the store of the handler.
+        response = client.get('/')
+        self.assertTrue(response.headers.get('Set-Cookie', '').startswith(
+            'session='))
+
+    def test_get_batch(self):
+        committed = []
+
+        class Batch(object):
+            def commit(self):
+                committed.append(self)
+
+        with self._get_app().get_test_context() as request:
+            store = request.session_store
+            batch = store.get_batch('foo', Batch)
+            self.assertEqual(store.get_batch('foo', Batch) is batch, True)
+
+            store.save(Response())
+            self.assertEqual(committed, [batch])
+
+            # Batches are only committed once.
+            store.save(Response())
+            self.assertEqual(committed, [batch])
+
 
 class TestSessionStore(test_utils.BaseTestCase):
     def setUp(self):
@@ -243,6 +378,110 @@ class TestSessionStore(test_utils.BaseTestCase):
         })
         self.assertEqual(response.data, 'a datastore session value')
 
+    def test_datastore_write_interval(self):
+        app = App(config={
+            'tipfy.sessions': {
+                'secret_key': 'secret',
+            },
+            'tipfy.appengine.sessions': {
+                'write_interval': 60,
+            },
+        })
+
+        with app.get_test_context() as request:
+            store = request.session_store
+            session = store.get_session(backend='datastore')
+            session['foo'] = 'bar'
+            response = Response()
+            store.save(response)
+
+        sid = session.sid
+        self.assertEqual(SessionModel.get_by_key_name(sid).data, {'foo': 'bar'})
+
+        headers = {'Cookie': '\n'.join(response.headers.getlist('Set-Cookie'))}
+        with app.get_test_context('/', headers=headers) as request:
+            store = request.session_store
+            session = store.get_session(backend='datastore')
+            self.assertEqual(session, {'foo': 'bar'})
+            session['foo'] = 'baz'
+            store.save(Response())
+
+        # Written recently: only memcache was updated.
+        self.assertEqual(SessionModel.get_by_key_name(sid).data, {'foo': 'bar'})
+        self.assertEqual(SessionModel.get_by_sid(sid).data, {'foo': 'baz'})
+
+        with app.get_test_context('/', headers=headers) as request:
+            store = request.session_store
+            session = store.get_session(backend='datastore')
+            self.assertEqual(session, {'foo': 'baz'})
+            session.written -= datetime.timedelta(seconds=61)
+            session['foo'] = 'ding'
+            store.save(Response())
+
+        self.assertEqual(SessionModel.get_by_key_name(sid).data, {'foo': 'ding'})
+
+    def test_datastore_write_interval_saves(self):
+        app = App(config={
+            'tipfy.sessions': {
+                'secret_key': 'secret',
+            },
+            'tipfy.appengine.sessions': {
+                'write_interval': 0.5,
+            },
+        })
+
+        headers = {}
+        for value in ('foo', 'bar', 'baz'):
+            with app.get_test_context('/', headers=headers) as request:
+                store = request.session_store
+                session = store.get_session(backend='datastore')
+                session['value'] = value
+                response = Response()
+                store.save(response)
+
+            headers = {'Cookie': '\n'.join(
+                response.headers.getlist('Set-Cookie'))}
+            time.sleep(0.3)
+
+        # Memcache-only saves keep the date of the last datastore write,
+        # so the third save is written after the interval.
+        entity = SessionModel.get_by_key_name(session.sid)
+        self.assertEqual(entity.data, {'value': 'baz'})
+
+    def test_batch(self):
+        with self._get_app().get_test_context() as request:
+            store = request.session_store
+            session1 = store.get_session('session1', backend='memcache')
+            session1['foo'] = 'bar'
+            session2 = store.get_session('session2', backend='datastore')
+            session2['baz'] = 'ding'
+            store.save(Response())
+
+        self.assertEqual(memcache.get(session1.sid), {'foo': 'bar'})
+        self.assertEqual(SessionModel.get_by_key_name(session2.sid).data, {'baz': 'ding'})
+        self.assertEqual(SessionModel.get_cache(session2.sid).data, {'baz': 'ding'})
+
+    def test_cleanup_mapper(self):
+        from tipfy.appengine.sessions_cleanup import SessionCleanupMapper
+
+        for i in range(5):
+            entity = SessionModel.create('session_%d' % i, {'foo': i})
+            entity.put()
+
+        self.assertEqual(SessionModel.get_cache('session_0').data, {'foo': 0})
+
+        # Sessions were updated now.
+        mapper = SessionCleanupMapper(60)
+        mapper.run(batch_size=2)
+        self.assertEqual(mapper.deleted, 0)
+        self.assertEqual(SessionModel.all().count(), 5)
+
+        mapper = SessionCleanupMapper(-60)
+        mapper.run(batch_size=2)
+        self.assertEqual(mapper.deleted, 5)
+        self.assertEqual(SessionModel.all().count(), 0)
+        self.assertEqual(SessionModel.get_cache('session_0'), None)
+
     def test_set_delete_cookie(self):
         class MyHandler(BaseHandler):
             def get(self):
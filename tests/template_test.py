@@ -1,4 +1,7 @@
 import os
+import shutil
+import tempfile
+import time
 import unittest
 
 from tipfy import template
@@ -16,6 +19,43 @@ class TestTemplate(test_utils.BaseTestCase):
         t = template.Template('<html>{{ myvalue }}</html>')
         self.assertEqual(t.generate(myvalue='XXX'), '<html>XXX</html>')
 
+    def test_generate_namespace(self):
+        t = template.Template('{% if defined %}{{ value }}{% end %}'
+            '{{ escape(value) }}')
+        self.assertEqual(t.generate(defined=True, value='<'), '<&lt;')
+        # Values from a previous call are not kept.
+        self.assertRaises(NameError, t.generate, value='>')
+        self.assertEqual(t.generate(defined=False, value='>'), '&gt;')
+
+    def test_generate_stream(self):
+        t = template.Template('<head>{% block title %}Title{% end %}</head>'
+            '{% for i in range(4) %}<p>{{ i }}</p>{% end %}'
+            '{% apply squeeze %}a   b{% end %}')
+        t.stream_threshold = 16
+        chunks = list(t.generate_stream())
+        self.assertEqual(''.join(chunks), t.generate())
+        self.assertEqual(chunks, ['<head>', 'Title',
+            '</head><p>0</p><p>1</p>', '<p>2</p><p>3</p>a b'])
+
+    def test_stream_code_is_lazy(self):
+        t = template.Template('{% for i in range(3) %}{{ i }}{% end %}')
+        self.assertEqual(t._stream_code, None)
+        self.assertEqual(t.generate(), '012')
+        self.assertEqual(t._stream_code, None)
+        self.assertEqual(''.join(t.generate_stream()), '012')
+        code = t._stream_code
+        self.assertNotEqual(code, None)
+        self.assertEqual(''.join(t.generate_stream()), '012')
+        self.assertTrue(t._stream_code is code)
+
+    def test_generate_stream_response(self):
+        from tipfy.app import Response
+
+        t = template.Template('{% for i in items %}{{ i }},{% end %}')
+        t.stream_threshold = 4
+        response = Response(t.generate_stream(items=range(10)))
+        self.assertEqual(response.data, '0,1,2,3,4,5,6,7,8,9,')
+
     def test_loader(self):
         loader = template.Loader(TEMPLATES_DIR)
         t = loader.load('template_tornado1.html')
@@ -27,5 +67,131 @@ class TestTemplate(test_utils.BaseTestCase):
         self.assertEqual(t.generate(message='Hello, World!'), 'Hello, World!\n')
 
 
+
+class TestTemplateCache(test_utils.BaseTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.templates_dir = os.path.join(self.tmp_dir, 'templates')
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        os.mkdir(self.templates_dir)
+        os.mkdir(self.cache_dir)
+        self.write('base.txt', '<{% block body %}{% end %}>')
+        self.write('header.txt', 'Header {{ title }}')
+        self.write('page.txt', '{% extends "base.txt" %}'
+            '{% block body %}{% include "header.txt" %}: '
+            '{{ message }}{% end %}')
+        test_utils.BaseTestCase.setUp(self)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        test_utils.BaseTestCase.tearDown(self)
+
+    def write(self, name, source, mtime=None):
+        path = os.path.join(self.templates_dir, name)
+        f = open(path, 'w')
+        f.write(source)
+        f.close()
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def get_loader(self, **kwargs):
+        return template.Loader(self.templates_dir,
+            bytecode_cache=template.FileSystemBytecodeCache(self.cache_dir),
+            **kwargs)
+
+    def test_bytecode_cache(self):
+        t = self.get_loader().load('page.txt')
+        self.assertEqual(t.dependencies, ['base.txt', 'header.txt'])
+        self.assertEqual(t.generate(title='T', message='M'), '<Header T: M>')
+        self.assertEqual(len(os.listdir(self.cache_dir)), 3)
+
+        # A new loader doesn't parse the cached templates.
+        t = self.get_loader().load('page.txt')
+        self.assertEqual(t._file, None)
+        self.assertEqual(t._code, None)
+        self.assertEqual(t.generate(title='T', message='M'), '<Header T: M>')
+
+        # Changing an included template invalidates the cached code.
+        self.write('header.txt', 'New header {{ title }}')
+        t = self.get_loader().load('page.txt')
+        self.assertNotEqual(t._code, None)
+        self.assertEqual(t.generate(title='T', message='M'),
+            '<New header T: M>')
+
+    def test_debug(self):
+        loader = template.Loader(self.templates_dir, debug=True)
+        t = loader.load('page.txt')
+        self.assertTrue(loader.load('page.txt') is t)
+
+        self.write('base.txt', '[{% block body %}{% end %}]',
+            time.time() + 10)
+        t = loader.load('page.txt')
+        self.assertEqual(t.generate(title='T', message='M'), '[Header T: M]')
+
+        # Without debug, the loaded template is used.
+        loader.debug = False
+        self.write('base.txt', '({% block body %}{% end %})',
+            time.time() + 20)
+        self.assertTrue(loader.load('page.txt') is t)
+
+    def test_folded_code(self):
+        self.write('footer.txt', 'Footer')
+        self.write('list.txt', '{% extends "base.txt" %}{% block body %}'
+            '{% for i in items %}{{ escape(i) }}{% end %}'
+            '{% include "footer.txt" %}{% end %}')
+        loader = template.Loader(self.templates_dir)
+        t = loader.load('list.txt')
+        self.assertEqual(t.generate(items=['&', 'a']), '<&amp;aFooter>')
+        self.assertEqual(t.generate(items=['&'], escape=lambda v: '[%s]' % v),
+            '<[&]Footer>')
+        self.assertEqual(''.join(t.generate_stream(items=['&', 'a'])),
+            '<&amp;aFooter>')
+
+        t = loader.load('page.txt')
+        self.assertEqual(t.generate(title='&', message='M'),
+            '<Header &: M>')
+        self.assertEqual(''.join(t.generate_stream(title='&', message='M')),
+            '<Header &: M>')
+
+    def test_loops_in_blocks_and_includes(self):
+        # Loops can come from a named block or an included template.
+        self.write('loop.txt', '{% for i in items %}{{ squeeze(i) }}{% end %}')
+        self.write('child.txt', '{% extends "base.txt" %}{% block body %}'
+            '{% apply escape %}{% include "loop.txt" %}{% end %}{% end %}')
+        loader = template.Loader(self.templates_dir)
+        t = loader.load('child.txt')
+        self.assertEqual(t.generate(items=['a  b', '&']), '<a b&amp;>')
+        self.assertEqual(''.join(t.generate_stream(items=['a  b', '&'])),
+            '<a b&amp;>')
+        self.assertEqual(t.generate(items=['x'], squeeze=str.upper), '<X>')
+
+    def test_cache_size(self):
+        loader = template.Loader(self.templates_dir, cache_size=2)
+        loader.load('page.txt')
+        self.assertEqual(len(loader.templates), 2)
+        self.assertFalse('base.txt' in loader.templates)
+
+        for cache_size in (0, None):
+            loader = template.Loader(self.templates_dir,
+                cache_size=cache_size)
+            t = loader.load('page.txt')
+            self.assertEqual(t.generate(title='T', message='M'),
+                '<Header T: M>')
+            self.assertFalse(loader.load('page.txt') is t)
+            self.assertEqual(len(loader.templates), 0)
+
+    def test_precompile(self):
+        self.write('jinja2.txt', '{% macro foo() %}{% endmacro %}')
+        zip_path = os.path.join(self.tmp_dir, 'templates.zip')
+        compiled = template.precompile(self.templates_dir, zip_path)
+        self.assertEqual(compiled, ['base.txt', 'header.txt', 'page.txt'])
+
+        cache = template.ZipBytecodeCache(zip_path)
+        loader = template.Loader(self.templates_dir, bytecode_cache=cache)
+        t = loader.load('page.txt')
+        self.assertEqual(t._code, None)
+        self.assertEqual(t.generate(title='T', message='M'), '<Header T: M>')
+
+
 if __name__ == '__main__':
     test_utils.main()
@@ -11,9 +11,9 @@ import werkzeug
 from tipfy import RequestHandler, Request, Response, Rule, Tipfy
 from tipfy.app import local
 
-from tipfy.utils import (xhtml_escape, xhtml_unescape, json_encode,
-    json_decode, render_json_response, url_escape, url_unescape, utf8,
-    _unicode)
+from tipfy.utils import (xhtml_escape, xhtml_escape_all, xhtml_unescape,
+    json_encode, json_decode, render_json_response, url_escape, url_unescape,
+    utf8, _unicode)
 
 import test_utils
 
@@ -165,6 +165,22 @@ class TestRenderJson(test_utils.BaseTestCase):
 class TestUtils(test_utils.BaseTestCase):
     def test_xhtml_escape(self):
         self.assertEqual(xhtml_escape('"foo"'), '&quot;foo&quot;')
+        self.assertEqual(xhtml_escape('<a href="?a=1&b=2">'),
+            '&lt;a href=&quot;?a=1&amp;b=2&quot;&gt;')
+        self.assertEqual(xhtml_escape(u'\xe7\xe3o & "foo"'),
+            '\xc3\xa7\xc3\xa3o &amp; &quot;foo&quot;')
+        value = 'nothing to escape'
+        self.assertTrue(xhtml_escape(value) is value)
+
+    def test_xhtml_escape_all(self):
+        self.assertEqual(xhtml_escape_all([]), [])
+        self.assertEqual(xhtml_escape_all(['a & b', u'<\xe7>', '"']),
+            ['a &amp; b', '&lt;\xc3\xa7&gt;', '&quot;'])
+        # Values with the separator or that can't be joined are escaped
+        # one by one.
+        self.assertEqual(xhtml_escape_all(['a\0<', 'b']), ['a\0&lt;', 'b'])
+        self.assertEqual(xhtml_escape_all(['\xc3\xa7&', u'\xe7']),
+            ['\xc3\xa7&amp;', '\xc3\xa7'])
 
     def test_xhtml_unescape(self):
         self.assertEqual(xhtml_unescape('&quot;foo&quot;'), '"foo"')
@@ -36,6 +36,34 @@ __version_info__ = (1, 0)
 #: enable_debugger
 #:     True to enable the interactive debugger when in debug mode, False
 #:     otherwise. Default is True.
+#:
+#: compile_rules
+#:     True to index the URL rules in a static prefix tree when the app is
+#:     initialized and to reuse URL adapters between requests, so that only
+#:     rules that can possibly match a path are tested. Default is False.
+#:
+#: preload_config
+#:     A list of module names to load default configurations from when the
+#:     app is initialized. Required values for these modules are checked
+#:     then, and a ``KeyError`` is raised if they are not set. Default is an
+#:     empty list.
+#:
+#: freeze_config
+#:     True to replace :attr:`tipfy.app.App.config` by a frozen snapshot when
+#:     the app is initialized, validating required values once so that
+#:     reading configuration values is a plain dictionary lookup. The
+#:     configuration can't be changed after that. Default is False.
+#:
+#: warmup
+#:     True to call :meth:`tipfy.app.App.warmup` when the app is initialized,
+#:     importing handlers and stores before the first request. Default is
+#:     False.
+#:
+#: warmup_functions
+#:     A list of functions, or strings to be imported, called with the app
+#:     as argument by :meth:`tipfy.app.App.warmup`. For example, use
+#:     `tipfyext.jinja2.warmup` to create the Jinja2 environment. Default is
+#:     an empty list.
 default_config = {
     'auth_store_class':    'tipfy.appengine.auth.AuthStore',
     'i18n_store_class':    'tipfy.i18n.I18nStore',
@@ -43,12 +71,79 @@ default_config = {
     'server_name':         None,
     'default_subdomain':   '',
     'enable_debugger':     True,
+    'compile_rules':       False,
+    'preload_config':      [],
+    'freeze_config':       False,
+    'warmup':              False,
+    'warmup_functions':    [],
 }
 
-from tipfy.app import (HTTPException, Request, Response, Tipfy, abort,
-    current_app, current_handler)
-from tipfy.handler import RequestHandler
-from tipfy.appengine import (APPENGINE, APPLICATION_ID, CURRENT_VERSION_ID,
-    DEV_APPSERVER)
-from tipfy.config import DEFAULT_VALUE, REQUIRED_VALUE
-from tipfy.routing import HandlerPrefix, NamePrefix, Rule, Subdomain, Submount
+import sys
+from types import ModuleType
+
+# Objects exported by the tipfy namespace, by module. They are imported
+# when first accessed, so that importing `tipfy` doesn't import the app
+# machinery and its dependencies.
+all_by_module = {
+    'tipfy.app':       ['HTTPException', 'Request', 'Response', 'Tipfy',
+                        'abort', 'current_app', 'current_handler'],
+    'tipfy.handler':   ['RequestHandler'],
+    'tipfy.appengine': ['APPENGINE', 'APPLICATION_ID', 'CURRENT_VERSION_ID',
+                        'DEV_APPSERVER'],
+    'tipfy.config':    ['DEFAULT_VALUE', 'REQUIRED_VALUE'],
+    'tipfy.routing':   ['HandlerPrefix', 'NamePrefix', 'Rule', 'Subdomain',
+                        'Submount'],
+}
+
+# Submodules that are imported when accessed as attributes.
+attribute_modules = frozenset(['app', 'appengine', 'auth', 'cache', 'config',
+    'handler', 'i18n', 'json', 'local', 'middleware', 'routing', 'scripting',
+    'sessions', 'template', 'testing', 'utils'])
+
+# Names imported by ``from tipfy import *``: the objects above, the default
+# config and the submodules the objects are imported from.
+star_names = ('default_config', 'app', 'appengine', 'config', 'handler',
+    'local', 'routing')
+
+object_origins = {}
+for module, items in all_by_module.iteritems():
+    for item in items:
+        object_origins[item] = module
+
+
+class module(ModuleType):
+    """Imports objects and submodules when they are first accessed."""
+    def __getattr__(self, name):
+        if name in object_origins:
+            module = __import__(object_origins[name], None, None, [name])
+            for extra_name in all_by_module[module.__name__]:
+                setattr(self, extra_name, getattr(module, extra_name))
+
+            return getattr(module, name)
+        elif name in attribute_modules:
+            __import__('tipfy.' + name)
+
+        return ModuleType.__getattribute__(self, name)
+
+    def __dir__(self):
+        result = list(new_module.__all__)
+        result.extend(('__file__', '__path__', '__doc__', '__all__',
+            '__name__', '__package__', '__version__', '__version_info__',
+            'default_config'))
+        return result
+
+
+# Keep a reference to this module so that it's not garbage collected.
+old_module = sys.modules['tipfy']
+
+# Set up the new module and patch it into the dict of loaded modules.
+new_module = sys.modules['tipfy'] = module('tipfy')
+new_module.__dict__.update({
+    '__file__':         __file__,
+    '__path__':         __path__,
+    '__doc__':          __doc__,
+    '__all__':          tuple(object_origins) + star_names,
+    '__version__':      __version__,
+    '__version_info__': __version_info__,
+    'default_config':   default_config,
+})
@@ -12,6 +12,7 @@ from __future__ import with_statement
 
 import logging
 import os
+import time
 import urlparse
 import wsgiref.handlers
 
@@ -130,6 +131,51 @@ class Response(werkzeug.wrappers.Response):
     """A response object with default mimetype set to ``text/html``."""
     default_mimetype = 'text/html'
 
+    def get_wsgi_headers(self, environ):
+        """Returns the headers to be sent for the given environment.
+
+        Werkzeug removes the entity headers from '304 Not Modified'
+        responses. The `Last-Modified` header is kept so that caches can
+        update the stored response.
+
+        :param environ:
+            A WSGI environment.
+        :returns:
+            A ``werkzeug.Headers`` object.
+        """
+        headers = super(Response, self).get_wsgi_headers(environ)
+        if self.status_code == 304 and 'Last-Modified' in self.headers:
+            headers['Last-Modified'] = self.headers['Last-Modified']
+
+        return headers
+
+
+class AppMiddleware(object):
+    """Base class for :class:`App` middleware."""
+    def before_request(self, request):
+        """Called before the request is dispatched.
+
+        If the returned value is not None, stops the middleware chain and uses
+        that value to create a response, and doesn't dispatch the request.
+
+        :param request:
+            A :class:`Request` instance.
+        """
+
+    def after_request(self, request, response):
+        """Called after a response is made for the request.
+
+        Must always return a response object.
+
+        These are executed in reverse order.
+
+        :param request:
+            A :class:`Request` instance.
+        :param response:
+            A :class:`Response` instance.
+        """
+        return response
+
 
 class RequestContext(object):
     """Sets and releases the context locals used during a request.
@@ -183,8 +229,24 @@ class App(object):
     router_class = Router
     #: Context class used when a request comes in.
     request_context_class = RequestContext
-
-    def __init__(self, rules=None, config=None, debug=False):
+    #: True after :meth:`warmup` was called.
+    warmed_up = False
+    #: A list of middleware instances applied to all requests. A middleware
+    #: can implement two methods that are called before and after a request
+    #: is dispatched to the router:
+    #:
+    #: before_request(request)
+    #:     Called before the request is matched and dispatched. If returns a
+    #:     response, stops the middleware chain and uses that response, not
+    #:     matching a rule or instantiating a handler.
+    #:
+    #: after_request(request, response)
+    #:     Called after a response is made, including responses returned by
+    #:     before_request. Must always return a response. These are executed
+    #:     in reverse order. Not called if an exception is raised.
+    middleware = None
+
+    def __init__(self, rules=None, config=None, debug=False, middleware=None):
         """Initializes the application.
 
         :param rules:
@@ -193,17 +255,30 @@ class App(object):
             Dictionary with configuration for the application modules.
         :param debug:
             True if this is debug mode, False otherwise.
+        :param middleware:
+            A list of middleware instances applied to all requests. If not
+            set, uses :attr:`middleware`.
         """
         local.current_app = self
         self.debug = debug
+        if middleware is not None:
+            self.middleware = middleware
+
         self.registry = {}
         self.error_handlers = {}
         self.config = self.config_class(config, {'tipfy': default_config})
+        self.config.preload(self.config['tipfy']['preload_config'])
+        if self.config['tipfy']['freeze_config']:
+            self.config = self.config.freeze()
+
         self.router = self.router_class(self, rules)
 
         if debug:
             logging.getLogger().setLevel(logging.DEBUG)
 
+        if self.config['tipfy']['warmup']:
+            self.warmup()
+
     def __call__(self, environ, start_response):
         """Called when a request comes in."""
         if self.debug and self.config['tipfy']['enable_debugger']:
@@ -238,8 +313,21 @@ class App(object):
                 if request.method not in self.allowed_methods:
                     abort(501)
 
-                rv = self.router.dispatch(request)
+                before, after = self.get_middleware_hooks()
+
+                # Execute before_request middleware.
+                for func in before:
+                    rv = func(request)
+                    if rv is not None:
+                        break
+                else:
+                    rv = self.router.dispatch(request)
+
                 response = self.make_response(request, rv)
+
+                # Execute after_request middleware.
+                for func in after:
+                    response = func(request, response)
             except Exception, e:
                 try:
                     rv = self.handle_exception(request, e)
@@ -256,6 +344,30 @@ class App(object):
 
             return response(environ, start_response)
 
+    def get_middleware_hooks(self):
+        """Returns the app middleware hooks. They are resolved from
+        :attr:`middleware` once and cached until the middleware list is
+        reassigned or its size changes.
+
+        :returns:
+            A tuple ``(before_request, after_request)`` with tuples of
+            middleware methods, in the order they are called.
+        """
+        middleware = self.middleware or ()
+        cached = self.__dict__.get('_middleware_hooks')
+        if cached is None or cached[0] is not middleware or \
+            cached[1] != len(middleware):
+            hooks = (
+                tuple(obj.before_request for obj in middleware if
+                    getattr(obj, 'before_request', None)),
+                tuple(obj.after_request for obj in reversed(middleware) if
+                    getattr(obj, 'after_request', None)),
+            )
+            cached = (middleware, len(middleware), hooks)
+            self._middleware_hooks = cached
+
+        return cached[2]
+
     def handle_exception(self, request, exception):
         """Handles an exception. To set app-wide error handlers, define them
         using the corresponent HTTP status code in the ``error_handlers``
@@ -353,6 +465,55 @@ class App(object):
 
         return self.response_class(*rv)
 
+    def warmup(self):
+        """Does work that would otherwise be done lazily in the first
+        requests: imports all handlers defined as strings in the URL rules,
+        imports the configured store classes and calls the configured
+        `warmup_functions`. Map a handler to ``/_ah/warmup`` to do this when
+        App Engine starts a new instance, or enable the `warmup` option to do
+        it when the app is initialized.
+
+        Store classes that fail to be imported are logged and skipped, as
+        they may be configured but not used by the app.
+
+        :returns:
+            A list of tuples ``(step, seconds)`` with the time spent in each
+            step.
+        """
+        def import_stores():
+            for name in ('auth_store_class', 'i18n_store_class',
+                'session_store_class'):
+                try:
+                    getattr(self, name)
+                except ImportError, e:
+                    logging.warning('Warmup: %s could not be imported: %s',
+                        name, e)
+
+        def call(func):
+            if isinstance(func, basestring):
+                func = werkzeug.utils.import_string(func)
+
+            func(self)
+
+        steps = [
+            ('handlers', self.router.import_handlers),
+            ('stores', import_stores),
+        ]
+        for func in self.config['tipfy']['warmup_functions']:
+            name = isinstance(func, basestring) and func or func.__name__
+            steps.append((name, lambda func=func: call(func)))
+
+        timings = []
+        for name, func in steps:
+            start = time.time()
+            func()
+            timings.append((name, time.time() - start))
+            logging.info('Warmup: %s took %.2f ms', name,
+                timings[-1][1] * 1000)
+
+        self.warmed_up = True
+        return timings
+
     def get_config(self, module, key=None, default=REQUIRED_VALUE):
         """Returns a configuration value for a module.
 
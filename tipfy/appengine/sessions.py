@@ -8,6 +8,7 @@
     :copyright: 2011 by tipfy.org.
     :license: BSD, see LICENSE.txt for more details.
 """
+import datetime
 import re
 import uuid
 
@@ -19,6 +20,17 @@ from tipfy.sessions import BaseSession
 from tipfy.appengine.db import (PickleProperty, get_protobuf_from_entity,
     get_entity_from_protobuf)
 
+#: Default configuration values for this module. Keys are:
+#:
+#: write_interval
+#:     Minimum interval in seconds between datastore writes of a
+#:     :class:`DatastoreSession`. A session modified again before this
+#:     interval passes is only updated in memcache, so changes can be lost
+#:     if the memcache entry is evicted. Default is 0 (always write).
+default_config = {
+    'write_interval': 0,
+}
+
 # Validate session keys.
 _UUID_RE = re.compile(r'^[a-f0-9]{32}$')
 
@@ -31,6 +43,9 @@ class SessionModel(db.Model):
     created = db.DateTimeProperty(auto_now_add=True)
     #: Modification date.
     updated = db.DateTimeProperty(auto_now=True)
+    #: Date of the last datastore write. Unlike `updated`, it is kept when
+    #: the entity is only updated in memcache.
+    written = db.DateTimeProperty()
     #: Session data, pickled.
     data = PickleProperty()
 
@@ -101,6 +116,30 @@ class SessionModel(db.Model):
         db.delete(self)
 
 
+class SessionBatch(object):
+    """Groups the memcache and datastore writes of the sessions saved in a
+    request. The writes are started together using asynchronous RPCs, so
+    saving waits for the slower of them instead of each one in turn.
+    """
+    def __init__(self):
+        #: Values to set in memcache, keyed by session id.
+        self.cache = {}
+        #: Entities to put in the datastore.
+        self.entities = []
+
+    def commit(self):
+        """Starts the batched writes and waits for them to complete."""
+        rpcs = []
+        if self.cache:
+            rpcs.append(memcache.Client().set_multi_async(self.cache))
+
+        if self.entities:
+            rpcs.append(db.put_async(self.entities))
+
+        for rpc in rpcs:
+            rpc.get_result()
+
+
 class AppEngineBaseSession(BaseSession):
     __slots__ = BaseSession.__slots__ + ('sid',)
 
@@ -133,14 +172,22 @@ class AppEngineBaseSession(BaseSession):
 
 class DatastoreSession(AppEngineBaseSession):
     """A session that stores data serialized in the datastore."""
+    __slots__ = AppEngineBaseSession.__slots__ + ('written',)
+
     model_class = SessionModel
 
+    def __init__(self, data=None, sid=None, new=False, written=None):
+        AppEngineBaseSession.__init__(self, data, sid, new)
+        # Date of the last datastore write, as in SessionModel.written.
+        self.written = written
+
     @classmethod
     def _get_by_sid(cls, sid, **kwargs):
         """Returns a session given a session id."""
         entity = cls.model_class.get_by_sid(sid)
         if entity is not None:
-            return cls(entity.data, sid)
+            return cls(entity.data, sid,
+                written=entity.written or entity.updated)
 
         return cls(new=True)
 
@@ -148,7 +195,20 @@ class DatastoreSession(AppEngineBaseSession):
         if not self.modified:
             return
 
-        self.model_class.create(self.sid, dict(self)).put()
+        entity = self.model_class.create(self.sid, dict(self))
+        batch = store.get_batch(__name__, SessionBatch)
+        interval = store.request.app.config[__name__]['write_interval']
+        now = datetime.datetime.now()
+        if self.written is None or \
+            now - self.written >= datetime.timedelta(seconds=interval):
+            entity.written = self.written = now
+            batch.entities.append(entity)
+        else:
+            # Written recently: only update memcache, keeping the date of
+            # the last datastore write.
+            entity.written = self.written
+
+        batch.cache[self.sid] = get_protobuf_from_entity(entity)
         store.set_secure_cookie(response, name, {'_sid': self.sid}, **kwargs)
 
 
@@ -167,7 +227,7 @@ class MemcacheSession(AppEngineBaseSession):
         if not self.modified:
             return
 
-        memcache.set(self.sid, dict(self))
+        store.get_batch(__name__, SessionBatch).cache[self.sid] = dict(self)
         store.set_secure_cookie(response, name, {'_sid': self.sid}, **kwargs)
 
 
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+    tipfy.appengine.sessions_cleanup
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Deletes expired datastore sessions using the task queue.
+
+    :copyright: 2011 by tipfy.org.
+    :license: BSD, see LICENSE.txt for more details.
+"""
+import datetime
+import logging
+
+from google.appengine.api import memcache
+from google.appengine.ext.deferred import defer
+
+from tipfy import RequestHandler
+from tipfy.appengine.sessions import SessionModel
+from tipfy.appengine.taskqueue import Mapper
+
+
+class SessionCleanupMapper(Mapper):
+    """Deletes :class:`tipfy.appengine.sessions.SessionModel` entities that
+    were not updated in a given number of seconds, and their memcache
+    entries. Only keys are queried and deletes are made in batches.
+    """
+    model = SessionModel
+    keys_only = True
+
+    def __init__(self, max_age):
+        """Initializes the mapper.
+
+        :param max_age:
+            Age in seconds after the last update when a session is deleted.
+        """
+        Mapper.__init__(self)
+        self.cutoff = datetime.datetime.now() - \
+            datetime.timedelta(seconds=max_age)
+        self.deleted = 0
+
+    def get_query(self):
+        q = self.model.all(keys_only=True)
+        q.filter('updated <', self.cutoff)
+        return q
+
+    def map(self, key):
+        return ([], [key])
+
+    def finish(self):
+        logging.info('Session cleanup finished: %d sessions deleted.',
+            self.deleted)
+
+    def _batch_write(self):
+        keys = self.to_delete
+        Mapper._batch_write(self)
+        if keys:
+            memcache.delete_multi([key.name() for key in keys])
+            self.deleted += len(keys)
+            logging.info('Session cleanup: %d sessions deleted.', len(keys))
+
+    def _continue(self, start_key, batch_size):
+        # Deleted sessions are not returned again, so the query restarts
+        # instead of resuming from the last key, which can't be filtered
+        # together with the inequality filter on `updated`.
+        Mapper._continue(self, None, batch_size)
+
+
+class SessionCleanupHandler(RequestHandler):
+    """A handler that starts a :class:`SessionCleanupMapper` in the task
+    queue. Sessions are deleted when they are older than the
+    ``session_max_age`` configured for ``tipfy.sessions``, plus the
+    ``write_interval`` configured for ``tipfy.appengine.sessions``.
+
+    The setup for *cron.yaml* is:
+
+    .. code-block:: yaml
+
+       cron:
+       - description: delete expired sessions
+         url: /_tasks/sessions/cleanup
+         schedule: every 24 hours
+
+    The URL rules for urls.py are::
+
+        Rule('/_tasks/sessions/cleanup', name='tasks/sessions/cleanup',
+             handler='tipfy.appengine.sessions_cleanup.SessionCleanupHandler')
+        Rule('/_ah/queue/deferred', name='tasks/deferred',
+             handler='tipfy.appengine.taskqueue.DeferredHandler')
+    """
+    #: Number of sessions deleted in each batch.
+    batch_size = 100
+
+    def get(self, **kwargs):
+        max_age = self.app.config['tipfy.sessions']['session_max_age']
+        if max_age is None:
+            logging.warning('Session cleanup: session_max_age is not set.')
+            return self.app.response_class('Not configured.',
+                mimetype='text/plain')
+
+        max_age += self.app.config['tipfy.appengine.sessions'][
+            'write_interval']
+        defer(SessionCleanupMapper(max_age).run, self.batch_size)
+        return self.app.response_class('Started.', mimetype='text/plain')
@@ -92,6 +92,10 @@ class Mapper(object):
     # to filter by.
     filters = []
 
+    # Subclasses can set this to True to query only keys. Then map() receives
+    # keys instead of entities.
+    keys_only = False
+
     def __init__(self):
         self.to_put = []
         self.to_delete = []
@@ -114,7 +118,7 @@ class Mapper(object):
         """Returns a query over the specified kind, with any appropriate
         filters applied.
         """
-        q = self.model.all()
+        q = self.model.all(keys_only=self.keys_only)
         for prop, value in self.filters:
             q.filter('%s =' % prop, value)
 
@@ -151,7 +155,7 @@ class Mapper(object):
                 self.to_delete.extend(map_deletes)
 
                 # Record the last entity we processed.
-                start_key = entity.key()
+                start_key = entity if self.keys_only else entity.key()
 
                 # Do updates and deletes in batches.
                 if (i + 1) % batch_size == 0:
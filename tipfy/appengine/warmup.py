@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+    tipfy.appengine.warmup
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Warmup request handler.
+
+    :copyright: 2011 by tipfy.org.
+    :license: BSD, see LICENSE.txt for more details.
+"""
+from tipfy import RequestHandler
+
+
+class WarmupHandler(RequestHandler):
+    """A handler for App Engine warmup requests, which are sent when a new
+    instance is started. It calls :meth:`tipfy.app.App.warmup` so that
+    handlers, stores and templates are loaded before user requests arrive.
+    If the app already warmed up, e.g., because the `warmup` option is
+    enabled, nothing is done.
+
+    The setup for *app.yaml* is:
+
+    .. code-block:: yaml
+
+       inbound_services:
+       - warmup
+
+    The URL rule for urls.py is::
+
+        Rule('/_ah/warmup', name='warmup',
+             handler='tipfy.appengine.warmup.WarmupHandler')
+    """
+    def get(self, **kwargs):
+        if self.app.warmed_up:
+            return self.app.response_class('Already warmed up.',
+                mimetype='text/plain')
+
+        timings = self.app.warmup()
+        lines = ['%s: %.2f ms' % (name, seconds * 1000) for name, seconds in
+            timings]
+        return self.app.response_class('\n'.join(lines),
+            mimetype='text/plain')
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+    tipfy.cache
+    ~~~~~~~~~~~
+
+    In-process caching utilities.
+
+    :copyright: 2011 by tipfy.org.
+    :license: BSD, see LICENSE.txt for more details.
+"""
+import threading
+
+# Positions in the linked list entries.
+_PREV, _NEXT, _KEY, _VALUE = 0, 1, 2, 3
+
+
+class LRUCache(object):
+    """A dictionary-like cache that keeps a limited number of items. When
+    the capacity is reached, the least recently used item is discarded::
+
+        cache = LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache.get('a')
+        cache['c'] = 3
+
+        # 'b' was discarded because 'a' was read after it was set.
+        assert 'b' not in cache
+    """
+    def __init__(self, capacity):
+        """Initializes the cache.
+
+        :param capacity:
+            Maximum number of items to keep.
+        """
+        assert capacity > 0, 'Cache capacity must be greater than zero.'
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self.clear()
+
+    def get(self, key, default=None):
+        """Returns a cached value and marks it as recently used.
+
+        :param key:
+            The cache key.
+        :param default:
+            Value to return if the key is not cached.
+        :returns:
+            The cached value, or `default`.
+        """
+        self._lock.acquire()
+        try:
+            link = self._map.get(key)
+            if link is None:
+                return default
+
+            self._unlink(link)
+            self._append(link)
+            return link[_VALUE]
+        finally:
+            self._lock.release()
+
+    def __getitem__(self, key):
+        rv = self.get(key, _missing)
+        if rv is _missing:
+            raise KeyError(key)
+
+        return rv
+
+    def __setitem__(self, key, value):
+        self._lock.acquire()
+        try:
+            link = self._map.get(key)
+            if link is not None:
+                self._unlink(link)
+                link[_VALUE] = value
+            else:
+                if len(self._map) >= self.capacity:
+                    oldest = self._root[_NEXT]
+                    self._unlink(oldest)
+                    del self._map[oldest[_KEY]]
+
+                link = self._map[key] = [None, None, key, value]
+
+            self._append(link)
+        finally:
+            self._lock.release()
+
+    def __delitem__(self, key):
+        self._lock.acquire()
+        try:
+            self._unlink(self._map.pop(key))
+        finally:
+            self._lock.release()
+
+    def __contains__(self, key):
+        return key in self._map
+
+    def __len__(self):
+        return len(self._map)
+
+    def pop(self, key, default=None):
+        """Removes a key from the cache and returns its value.
+
+        :param key:
+            The cache key.
+        :param default:
+            Value to return if the key is not cached.
+        :returns:
+            The cached value, or `default`.
+        """
+        self._lock.acquire()
+        try:
+            link = self._map.pop(key, None)
+            if link is None:
+                return default
+
+            self._unlink(link)
+            return link[_VALUE]
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """Removes all items from the cache."""
+        self._map = {}
+        self._root = root = [None, None, None, None]
+        root[_PREV] = root[_NEXT] = root
+
+    def _append(self, link):
+        root = self._root
+        last = root[_PREV]
+        link[_PREV], link[_NEXT] = last, root
+        last[_NEXT] = root[_PREV] = link
+
+    def _unlink(self, link):
+        link[_PREV][_NEXT] = link[_NEXT]
+        link[_NEXT][_PREV] = link[_PREV]
+
+
+_missing = object()
@@ -59,7 +59,7 @@ class Config(dict):
             A dictionary of configuration dictionaries for initial default
             values. These modules are marked as loaded.
         """
-        self.loaded = []
+        self.loaded = set()
         if values is not None:
             assert isinstance(values, dict)
             for module, config in values.iteritems():
@@ -69,7 +69,7 @@ class Config(dict):
             assert isinstance(defaults, dict)
             for module, config in defaults.iteritems():
                 self.setdefault(module, config)
-                self.loaded.append(module)
+                self.loaded.add(module)
 
     def __getitem__(self, module):
         """Returns the configuration for a module. If it is not already
@@ -92,7 +92,7 @@ class Config(dict):
             if values:
                 self.setdefault(module, values)
 
-            self.loaded.append(module)
+            self.loaded.add(module)
 
         try:
             return dict.__getitem__(self, module)
@@ -187,6 +187,106 @@ class Config(dict):
 
         return module_dict.get(key, default)
 
+    def preload(self, modules):
+        """Loads the default configuration for a list of modules and checks
+        that all their required values are set. Use it when the app starts to
+        fail early on missing configuration.
+
+        :param modules:
+            A list of module names.
+        """
+        for module in modules:
+            for key, value in self.__getitem__(module).iteritems():
+                if value is REQUIRED_VALUE:
+                    raise KeyError('Module %r requires the config key %r to '
+                        'be set.' % (module, key))
+
+    def freeze(self, modules=None):
+        """Returns a :class:`FrozenConfig` snapshot of this configuration.
+        Required values are validated once for all configured modules, so
+        reading them is a single dictionary lookup.
+
+        :param modules:
+            A list of module names to load default configurations from
+            before freezing, besides the configured ones.
+        :returns:
+            A :class:`FrozenConfig` instance.
+        """
+        for module in self.keys() + list(modules or ()):
+            self.__getitem__(module)
+
+        return FrozenConfig(self)
+
+
+class FrozenConfig(dict):
+    """A read-only snapshot of a :class:`Config`. Module configurations are
+    validated when the snapshot is created, raising a ``KeyError`` for
+    required values that were not set, and reading them doesn't require any
+    extra checks. Modules not configured when the snapshot was created load
+    their default configuration on first access, raising a ``KeyError`` if
+    it has required values, as they can't be set anymore.
+
+    Changing the snapshot or a module configuration raises a ``TypeError``.
+    """
+    def __init__(self, config):
+        """Initializes the snapshot.
+
+        :param config:
+            A :class:`Config` instance.
+        """
+        dict.__init__(self)
+        self.loaded = set(config.loaded)
+        for module, values in config.iteritems():
+            dict.__setitem__(self, module, FrozenSubConfig(module, values))
+
+    def __missing__(self, module):
+        if module not in self.loaded:
+            values = import_string(module + '.default_config', silent=True)
+            if values:
+                # Raises a KeyError, also on later accesses, if a required
+                # value is missing.
+                module_dict = FrozenSubConfig(module, values)
+                dict.__setitem__(self, module, module_dict)
+                return module_dict
+
+            self.loaded.add(module)
+
+        raise KeyError('Module %r is not configured.' % module)
+
+    def __setitem__(self, *args, **kwargs):
+        raise TypeError('A frozen configuration can not be changed.')
+
+    __delitem__ = setdefault = update = pop = popitem = clear = __setitem__
+
+    # Read methods are shared with Config.
+    get = Config.get.im_func
+
+    def get_config(self, module, key=None, default=REQUIRED_VALUE):
+        """Returns a configuration value for a module and optionally a key.
+        Will raise a KeyError if they the module is not configured or the key
+        doesn't exist and a default is not provided.
+
+        :param module:
+            The module name.
+        :params key:
+            The configuration key.
+        :param default:
+            Default value to return if the key doesn't exist.
+        :returns:
+            A module configuration.
+        """
+        module_dict = self.__getitem__(module)
+
+        if key is None:
+            return module_dict
+
+        value = module_dict.get(key, default)
+        if value is REQUIRED_VALUE:
+            raise KeyError('Module %r does not have the config key %r' %
+                (module, key))
+
+        return value
+
 
 class SubConfig(dict):
     def __init__(self, module, values=None):
@@ -194,11 +294,17 @@ class SubConfig(dict):
         self.module = module
 
     def __getitem__(self, key):
-        if key not in self:
+        try:
+            value = dict.__getitem__(self, key)
+        except KeyError:
             raise KeyError('Module %r does not have the config key %r' %
                 (self.module, key))
 
-        return self.get(key)
+        if value is REQUIRED_VALUE:
+            raise KeyError('Module %r requires the config key %r to be '
+                'set.' % (self.module, key))
+
+        return value
 
     def get(self, key, default=None):
         value = dict.get(self, key, default)
@@ -208,3 +314,22 @@ class SubConfig(dict):
                 'set.' % (self.module, key))
 
         return value
+
+
+class FrozenSubConfig(dict):
+    """A module configuration validated when it is created."""
+    def __init__(self, module, values):
+        for key, value in values.iteritems():
+            if value is REQUIRED_VALUE:
+                raise KeyError('Module %r requires the config key %r to be '
+                    'set.' % (module, key))
+
+        dict.__init__(self, values)
+        self.module = module
+
+    def __missing__(self, key):
+        raise KeyError('Module %r does not have the config key %r' %
+            (self.module, key))
+
+    __setitem__ = __delitem__ = setdefault = update = pop = popitem = \
+        clear = FrozenConfig.__setitem__.im_func
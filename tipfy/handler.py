@@ -34,6 +34,18 @@ class BaseRequestHandler(object):
 
     A Tipfy-compatible handler can be implemented using only these two methods.
     """
+    #: An optional method called with the rule arguments before GET and HEAD
+    #: requests, returning a `datetime` for when the requested resource was
+    #: last modified, or None if it is unknown. If the request has a matching
+    #: `If-Modified-Since` header, '304 Not Modified' is returned without
+    #: calling the requested method. Otherwise the value is used to set the
+    #: `Last-Modified` response header::
+    #:
+    #:     class PageHandler(RequestHandler):
+    #:         def last_modified(self, page_id):
+    #:             return Page.get_updated(page_id)
+    last_modified = None
+
     def __init__(self, request, app=None):
         """Initializes the handler.
 
@@ -83,7 +95,24 @@ class BaseRequestHandler(object):
                 # http://www.w3.org/Protocols/rfc2616/rfc2616-sec10.html#sec10.4.6
                 self.abort(405, valid_methods=self.get_valid_methods())
 
-            return self.make_response(method(**request.rule_args))
+            last_modified = None
+            if self.last_modified is not None and \
+                request.method in ('GET', 'HEAD'):
+                last_modified = self.last_modified(**request.rule_args)
+                if last_modified is not None:
+                    last_modified = _to_http_date(last_modified)
+                    since = request.if_modified_since
+                    if since is not None and not request.if_none_match and \
+                        last_modified <= since:
+                        response = self.app.response_class(status=304)
+                        response.last_modified = last_modified
+                        return response
+
+            response = self.make_response(method(**request.rule_args))
+            if last_modified is not None and response.last_modified is None:
+                response.last_modified = last_modified
+
+            return response
         except Exception, e:
             return self.handle_exception(exception=e)
 
@@ -282,39 +311,57 @@ class RequestHandler(BaseRequestHandler):
     middleware = None
 
     def __call__(self):
-        middleware = self.middleware or []
+        before, after, exception = self.get_middleware_hooks()
 
         # Execute before_dispatch middleware.
-        for obj in middleware:
-            func = getattr(obj, 'before_dispatch', None)
-            if func:
-                response = func(self)
-                if response is not None:
-                    break
+        for func in before:
+            response = func(self)
+            if response is not None:
+                break
         else:
             try:
                 response = self.dispatch()
             except Exception, e:
                 # Execute handle_exception middleware.
-                for obj in reversed(middleware):
-                    func = getattr(obj, 'handle_exception', None)
-                    if func:
-                        response = func(self, e)
-                        if response is not None:
-                            break
+                for func in exception:
+                    response = func(self, e)
+                    if response is not None:
+                        break
                 else:
                     # If a middleware didn't return a response, reraise.
                     raise
 
         # Execute after_dispatch middleware.
-        for obj in reversed(middleware):
-            func = getattr(obj, 'after_dispatch', None)
-            if func:
-                response = func(self, response)
+        for func in after:
+            response = func(self, response)
 
         # Done!
         return response
 
+    def get_middleware_hooks(self):
+        """Returns the middleware hooks for this handler. They are resolved
+        from :attr:`middleware` once and cached in the handler class until
+        the middleware list is reassigned or its size changes.
+
+        :returns:
+            A tuple ``(before_dispatch, after_dispatch, handle_exception)``
+            with tuples of middleware methods, in the order they are called.
+        """
+        cls = self.__class__
+        middleware = self.middleware or ()
+        cached = cls.__dict__.get('_middleware_hooks')
+        if cached is None or cached[0] is not middleware or \
+            cached[1] != len(middleware):
+            hooks = (
+                _get_hooks(middleware, 'before_dispatch'),
+                _get_hooks(reversed(middleware), 'after_dispatch'),
+                _get_hooks(reversed(middleware), 'handle_exception'),
+            )
+            cached = (middleware, len(middleware), hooks)
+            cls._middleware_hooks = cached
+
+        return cached[2]
+
 
 class RequestHandlerMiddleware(object):
     """Base class for :class:`RequestHandler` middleware."""
@@ -355,3 +402,19 @@ class RequestHandlerMiddleware(object):
         :param exception:
             An exception.
         """
+
+
+def _get_hooks(middleware, name):
+    """Returns a tuple with the methods named `name` from a list of
+    middleware.
+    """
+    return tuple(getattr(obj, name) for obj in middleware if
+        getattr(obj, name, None))
+
+
+def _to_http_date(value):
+    """Converts a datetime to naive UTC with the precision of HTTP dates."""
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+
+    return value.replace(microsecond=0)
@@ -21,10 +21,14 @@
     :license: BSD, see LICENSE.txt for more details.
 """
 from datetime import datetime
+import gettext as gettext_stdlib
+import marshal
 import os
 
 from babel import Locale, dates, numbers, support
 
+from werkzeug import cached_property, create_environ
+
 try:
     from pytz.gae import pytz
 except ImportError:
@@ -63,6 +67,7 @@ from tipfy.local import get_request
 #:       URL rule.
 #:
 #:     If none of the methods find a locale code, uses the default locale.
+#:     The lookup happens when the locale is first needed in a request.
 #:     Default is ``[('session', '_locale')]``: gets the locale from the
 #:     session key ``_locale``.
 #:
@@ -71,6 +76,18 @@ from tipfy.local import get_request
 #:
 #: date_formats
 #:     Default date formats for datetime, date and time.
+#:
+#: lookup_multipart_form
+#:     True to parse multipart request bodies, e.g., file uploads, when
+#:     searching the ``form`` methods in `locale_request_lookup` and
+#:     `timezone_request_lookup`. If False, ``form`` lookups only parse
+#:     url-encoded bodies, or use the form if it was already parsed.
+#:     Default is False.
+#:
+#: compiled_translations
+#:     True to load translations from catalogs compiled by
+#:     :func:`compile_translations` when they exist, instead of parsing the
+#:     ``.mo`` files. Default is False.
 default_config = {
     'locale':                  'en_US',
     'timezone':                'America/Chicago',
@@ -98,6 +115,8 @@ default_config = {
         'datetime.long':    None,
         'datetime.iso':     "yyyy'-'MM'-'dd'T'HH':'mm':'ssZ",
     },
+    'lookup_multipart_form':   False,
+    'compiled_translations':   False,
 }
 
 
@@ -131,32 +150,53 @@ class I18nMiddleware(object):
 
 
 class I18nStore(object):
+    """Translation and localization utilities for a request. The locale and
+    timezone for the request are only looked up when they are first needed,
+    e.g., to translate a string or to format a date.
+    """
     #: Loaded translations.
     loaded_translations = None
-    #: Current locale.
-    locale = None
-    #: Current translations.
-    translations = None
-    #: Current timezone.
-    timezone = None
-    #: Current tzinfo.
-    tzinfo = None
 
     def __init__(self, request):
+        self.request = request
         self.config = request.app.config[__name__]
         self.loaded_translations = request.app.registry.setdefault(
             'i18n.translations', {})
-        self.set_locale_for_request(request)
-        self.set_timezone_for_request(request)
+
+    @cached_property
+    def locale(self):
+        """Current locale."""
+        self.set_locale_for_request(self.request)
+        return self.locale
+
+    @cached_property
+    def translations(self):
+        """Current translations."""
+        self.set_locale_for_request(self.request)
+        return self.translations
+
+    @cached_property
+    def timezone(self):
+        """Current timezone."""
+        self.set_timezone_for_request(self.request)
+        return self.timezone
+
+    @cached_property
+    def tzinfo(self):
+        """Current tzinfo."""
+        self.set_timezone_for_request(self.request)
+        return self.tzinfo
 
     def set_locale_for_request(self, request):
         locale = _get_request_value(request,
-            self.config['locale_request_lookup'], self.config['locale'])
+            self.config['locale_request_lookup'], self.config['locale'],
+            self.config['lookup_multipart_form'])
         self.set_locale(locale)
 
     def set_timezone_for_request(self, request):
         timezone = _get_request_value(request,
-            self.config['timezone_request_lookup'], self.config['timezone'])
+            self.config['timezone_request_lookup'], self.config['timezone'],
+            self.config['lookup_multipart_form'])
         self.set_timezone(timezone)
 
     def set_locale(self, locale):
@@ -183,10 +223,45 @@ class I18nStore(object):
             ``America/Chicago``.
         """
         self.timezone = timezone
-        self.tzinfo = pytz.timezone(timezone)
+        self.tzinfo = _get_tzinfo(timezone)
+
+    @property
+    def babel_locale(self):
+        """The ``babel.Locale`` object for the current locale."""
+        return _get_locale(self.locale)
 
     def load_translations(self, locales, dirname='locale', domain='messages'):
-        return support.Translations.load(dirname, locales, domain)
+        return load_translations(locales, dirname, domain,
+            self.config['compiled_translations'])
+
+    @classmethod
+    def preload_translations(cls, app, dirname='locale', domain='messages'):
+        """Loads the translations for all locales returned by
+        :func:`list_translations`, so that requests don't need to load them.
+
+        :param app:
+            A :class:`tipfy.app.App` instance.
+        :param dirname:
+            Path to the translations directory.
+        :param domain:
+            The message domain.
+        """
+        # Translations are loaded by a store for a blank request, so that
+        # an overridden load_translations() is used.
+        request = app.request_class(create_environ())
+        request.app = app
+        store = cls(request)
+        for locale in list_translations(dirname):
+            locale = str(locale)
+            if locale in store.loaded_translations:
+                continue
+
+            locales = [locale]
+            if locale != store.config['locale']:
+                locales.append(store.config['locale'])
+
+            store.loaded_translations[locale] = store.load_translations(
+                locales, dirname, domain)
 
     def gettext(self, string, **variables):
         """Translates a given string according to the current locale.
@@ -273,6 +348,50 @@ class I18nStore(object):
 
         return format
 
+    def _get_pattern(self, key, format):
+        """A helper for the datetime formatting functions. Returns a parsed
+        pattern to be used by Babel date format functions. Patterns are
+        memoized per locale, format key and format, so they are not parsed
+        again on each call.
+
+        :param key:
+            A format key to be get from config. Valid values are "date",
+            "datetime" or "time".
+        :param format:
+            The format to be returned. Valid values are "short", "medium",
+            "long", "full" or a custom date/time pattern.
+        :returns:
+            A ``babel.dates.DateTimePattern`` object.
+        """
+        format = self._get_format(key, format)
+        cache_key = (self.locale, key, format)
+        try:
+            return _patterns[cache_key]
+        except KeyError:
+            pass
+
+        if format in ('short', 'medium', 'full', 'long'):
+            locale = self.babel_locale
+            if key == 'date':
+                pattern = dates.get_date_format(format, locale=locale)
+            elif key == 'time':
+                pattern = dates.get_time_format(format, locale=locale)
+            else:
+                # Combine the date and time patterns into the datetime
+                # format, as done by format_datetime() for named formats.
+                date_pattern = dates.get_date_format(format, locale=locale)
+                time_pattern = dates.get_time_format(format, locale=locale)
+                datetime_format = dates.get_datetime_format(format,
+                    locale=locale)
+                pattern = dates.DateTimePattern(datetime_format,
+                    datetime_format.replace('%', '%%').replace('{0}',
+                    time_pattern.format).replace('{1}', date_pattern.format))
+        else:
+            pattern = dates.parse_pattern(format)
+
+        _patterns[cache_key] = pattern
+        return pattern
+
     def format_date(self, date=None, format=None, rebase=True):
         """Returns a date formatted according to the given pattern and
         following the current locale.
@@ -294,12 +413,12 @@ class I18nStore(object):
         :returns:
             A formatted date in unicode.
         """
-        format = self._get_format('date', format)
+        format = self._get_pattern('date', format)
 
         if rebase and isinstance(date, datetime):
             date = self.to_local_timezone(date)
 
-        return dates.format_date(date, format, locale=self.locale)
+        return dates.format_date(date, format, locale=self.babel_locale)
 
     def format_datetime(self, datetime=None, format=None, rebase=True):
         """Returns a date and time formatted according to the given pattern
@@ -322,13 +441,13 @@ class I18nStore(object):
         :returns:
             A formatted date and time in unicode.
         """
-        format = self._get_format('datetime', format)
+        format = self._get_pattern('datetime', format)
 
         kwargs = {}
         if rebase:
             kwargs['tzinfo'] = self.tzinfo
 
-        return dates.format_datetime(datetime, format, locale=self.locale,
+        return dates.format_datetime(datetime, format, locale=self.babel_locale,
             **kwargs)
 
     def format_time(self, time=None, format=None, rebase=True):
@@ -352,13 +471,13 @@ class I18nStore(object):
         :returns:
             A formatted time in unicode.
         """
-        format = self._get_format('time', format)
+        format = self._get_pattern('time', format)
 
         kwargs = {}
         if rebase:
             kwargs['tzinfo'] = self.tzinfo
 
-        return dates.format_time(time, format, locale=self.locale, **kwargs)
+        return dates.format_time(time, format, locale=self.babel_locale, **kwargs)
 
     def format_timedelta(self, datetime_or_timedelta, granularity='second',
         threshold=.85):
@@ -383,7 +502,7 @@ class I18nStore(object):
             datetime_or_timedelta = datetime.utcnow() - datetime_or_timedelta
 
         return dates.format_timedelta(datetime_or_timedelta, granularity,
-            threshold=threshold, locale=self.locale)
+            threshold=threshold, locale=self.babel_locale)
 
     def format_number(self, number):
         """Returns the given number formatted for the current locale. Example::
@@ -396,7 +515,7 @@ class I18nStore(object):
         :returns:
             The formatted number.
         """
-        return numbers.format_number(number, locale=self.locale)
+        return numbers.format_number(number, locale=self.babel_locale)
 
     def format_decimal(self, number, format=None):
         """Returns the given decimal number formatted for the current locale.
@@ -427,7 +546,7 @@ class I18nStore(object):
             The formatted decimal number.
         """
         return numbers.format_decimal(number, format=format,
-            locale=self.locale)
+            locale=self.babel_locale)
 
     def format_currency(self, number, currency, format=None):
         """Returns a formatted currency value. Example::
@@ -454,7 +573,7 @@ class I18nStore(object):
             The formatted currency value.
         """
         return numbers.format_currency(number, currency, format=format,
-            locale=self.locale)
+            locale=self.babel_locale)
 
     def format_percent(self, number, format=None):
         """Returns formatted percent value for the current locale. Example::
@@ -479,7 +598,7 @@ class I18nStore(object):
             The formatted percent number.
         """
         return numbers.format_percent(number, format=format,
-            locale=self.locale)
+            locale=self.babel_locale)
 
     def format_scientific(self, number, format=None):
         """Returns value formatted in scientific notation for the current
@@ -501,7 +620,7 @@ class I18nStore(object):
             Value formatted in scientific notation.
         """
         return numbers.format_scientific(number, format=format,
-            locale=self.locale)
+            locale=self.babel_locale)
 
     def parse_date(self, string):
         """Parses a date from a string.
@@ -520,7 +639,7 @@ class I18nStore(object):
         :returns:
             The parsed date object.
         """
-        return dates.parse_date(string, locale=self.locale)
+        return dates.parse_date(string, locale=self.babel_locale)
 
     def parse_datetime(self, string):
         """Parses a date and time from a string.
@@ -533,7 +652,7 @@ class I18nStore(object):
         :returns:
             The parsed datetime object.
         """
-        return dates.parse_datetime(string, locale=self.locale)
+        return dates.parse_datetime(string, locale=self.babel_locale)
 
     def parse_time(self, string):
         """Parses a time from a string.
@@ -550,7 +669,7 @@ class I18nStore(object):
         :returns:
             The parsed time object.
         """
-        return dates.parse_time(string, locale=self.locale)
+        return dates.parse_time(string, locale=self.babel_locale)
 
     def parse_number(self, string):
         """Parses localized number string into a long integer. Example::
@@ -575,7 +694,7 @@ class I18nStore(object):
             ``NumberFormatError`` if the string can not be converted to a
             number.
         """
-        return numbers.parse_number(string, locale=self.locale)
+        return numbers.parse_number(string, locale=self.babel_locale)
 
     def parse_decimal(self, string):
         """Parses localized decimal string into a float. Example::
@@ -600,7 +719,7 @@ class I18nStore(object):
             ``NumberFormatError`` if the string can not be converted to a
             decimal number.
         """
-        return numbers.parse_decimal(string, locale=self.locale)
+        return numbers.parse_decimal(string, locale=self.babel_locale)
 
     def get_timezone_location(self, dt_or_tzinfo):
         """Returns a representation of the given timezone using "location
@@ -630,7 +749,111 @@ class I18nStore(object):
         :returns:
             The localized timezone name using location format.
         """
-        return dates.get_timezone_name(dt_or_tzinfo, locale=self.locale)
+        return dates.get_timezone_name(dt_or_tzinfo, locale=self.babel_locale)
+
+
+class CompiledTranslations(object):
+    """Translations loaded from a catalog compiled by
+    :func:`compile_translations`: a marshalled dictionary of messages and
+    the plural forms expression. It is faster to load than a ``.mo`` file,
+    and messages are looked up in a single dictionary.
+    """
+    #: Extension of compiled catalogs, which are saved next to the ``.mo``
+    #: files.
+    extension = '.marshal'
+
+    def __init__(self, catalog, plural_expr=None):
+        """Initializes the translations.
+
+        :param catalog:
+            A dictionary mapping message ids to translated messages, and
+            ``(message id, plural index)`` tuples to plural translations.
+        :param plural_expr:
+            The plural forms expression, in C syntax. Default is ``n != 1``.
+        """
+        self._catalog = catalog
+        self.plural = _get_plural_function(plural_expr or '(n != 1)')
+
+    def ugettext(self, message):
+        """Translates a message.
+
+        :param message:
+            The message id.
+        :returns:
+            The translated message.
+        """
+        rv = self._catalog.get(message)
+        if rv is None:
+            return unicode(message)
+
+        return rv
+
+    def ungettext(self, singular, plural, n):
+        """Translates a message with plural forms.
+
+        :param singular:
+            The message id of the singular form.
+        :param plural:
+            The message id of the plural form.
+        :param n:
+            The number used to select the plural form.
+        :returns:
+            The translated message.
+        """
+        rv = self._catalog.get((singular, self.plural(n)))
+        if rv is None:
+            if n == 1:
+                return unicode(singular)
+
+            return unicode(plural)
+
+        return rv
+
+    gettext = ugettext
+    ngettext = ungettext
+
+    @classmethod
+    def load(cls, dirname, locales, domain='messages'):
+        """Loads the compiled catalog for the first locale that has
+        translations. Like ``gettext.find()``, a locale with territory also
+        searches the translations for its language, e.g., ``pt`` for
+        ``pt_BR``. If the first translations found are a ``.mo`` file
+        without a compiled catalog, or with a compiled catalog older than
+        it, None is returned so that the ``.mo`` file is used.
+
+        :param dirname:
+            Path to the translations directory.
+        :param locales:
+            A list of locale codes in order of preference.
+        :param domain:
+            The message domain.
+        :returns:
+            A :class:`CompiledTranslations` instance, or None if no
+            up-to-date compiled catalog was found.
+        """
+        for locale in locales:
+            locale = str(locale)
+            for name in (locale, locale.split('_')[0]):
+                path = os.path.join(dirname, name, 'LC_MESSAGES', domain)
+                mtime = _get_mtime(path + cls.extension)
+                mo_mtime = _get_mtime(path + '.mo')
+                if mtime is None:
+                    if mo_mtime is None:
+                        continue
+
+                    return None
+
+                if mo_mtime is not None and mtime < mo_mtime:
+                    # The .mo file was updated after it was compiled.
+                    return None
+
+                f = open(path + cls.extension, 'rb')
+                try:
+                    catalog, plural_expr = marshal.load(f)
+                finally:
+                    f.close()
+
+                return cls(catalog, plural_expr)
 
 
 def set_locale(locale):
@@ -760,6 +983,87 @@ def list_translations(dirname='locale'):
     return result
 
 
+def load_translations(locales, dirname='locale', domain='messages',
+    compiled=False):
+    """Loads the translations for the first of the given locales that has
+    them.
+
+    :param locales:
+        A list of locale codes in order of preference.
+    :param dirname:
+        Path to the translations directory.
+    :param domain:
+        The message domain.
+    :param compiled:
+        True to load a catalog compiled by :func:`compile_translations`, if
+        one exists.
+    :returns:
+        A translations object.
+    """
+    if compiled:
+        translations = CompiledTranslations.load(dirname, locales, domain)
+        if translations is not None:
+            return translations
+
+    return support.Translations.load(dirname, locales, domain)
+
+
+def compile_translations(dirname='locale', domain='messages'):
+    """Compiles the ``.mo`` files of all existing translations to the format
+    loaded by :class:`CompiledTranslations`, when the `compiled_translations`
+    option is enabled. Compiled catalogs can only be loaded by the same
+    Python version that compiled them.
+
+    :param dirname:
+        Path to the translations directory.
+    :param domain:
+        The message domain.
+    :returns:
+        A list with the paths of the compiled catalogs.
+    """
+    result = []
+    for locale in list_translations(dirname):
+        path = os.path.join(dirname, str(locale), 'LC_MESSAGES', domain)
+        if not os.path.isfile(path + '.mo'):
+            continue
+
+        f = open(path + '.mo', 'rb')
+        try:
+            translations = support.Translations(f, domain)
+        finally:
+            f.close()
+
+        plural_expr = None
+        plural_forms = translations._info.get('plural-forms')
+        if plural_forms and 'plural=' in plural_forms:
+            plural_expr = plural_forms.split('plural=', 1)[1].strip()
+
+        path += CompiledTranslations.extension
+        f = open(path, 'wb')
+        try:
+            marshal.dump((translations._catalog, plural_expr), f)
+        finally:
+            f.close()
+
+        result.append(path)
+
+    return result
+
+
+def warmup(app):
+    """Loads the translations for all locales before the first request.
+    To use it, add it to the `warmup_functions` configured for tipfy::
+
+        config['tipfy'] = {
+            'warmup_functions': ['tipfy.i18n.warmup'],
+        }
+
+    :param app:
+        A :class:`tipfy.app.App` instance.
+    """
+    app.i18n_store_class.preload_translations(app)
+
+
 def lazy_gettext(string, **variables):
     """A lazy version of :func:`gettext`.
 
@@ -793,7 +1097,7 @@ def lazy_ngettext(singular, plural, n, **variables):
     return support.LazyProxy(ngettext, singular, plural, n, **variables)
 
 
-def _get_request_value(request, lookup_list, default=None):
+def _get_request_value(request, lookup_list, default=None, multipart=False):
     """Returns a locale code or timezone for the current request.
 
     It will use the configuration for ``locale_request_lookup`` or
@@ -806,15 +1110,24 @@ def _get_request_value(request, lookup_list, default=None):
     :param lookup_list:
         A list of `(attribute, key)` tuples to search in request, e.g.,
         ``[('args', 'lang'), ('session', 'locale')]``.
-    :default:
+    :param default:
         Default value to return in case none is found.
+    :param multipart:
+        True to parse a multipart request body to search ``POST`` values.
+        Otherwise they are only searched in url-encoded bodies or if the
+        form was already parsed.
     :returns:
         A locale code or timezone setting.
     """
     value = None
     attrs = ('args', 'form', 'cookies', 'session', 'rule_args')
     for method, key in lookup_list:
-        if method in attrs:
+        if method == 'form' and not multipart and \
+            'form' not in request.__dict__ and \
+            request.mimetype != 'application/x-www-form-urlencoded':
+            # Don't parse uploads just to find a key.
+            obj = None
+        elif method in attrs:
             # Get from GET, POST, cookies or rule_args.
             obj = getattr(request, method)
         else:
@@ -831,5 +1144,54 @@ def _get_request_value(request, lookup_list, default=None):
     return value
 
 
+_locales = {}
+_tzinfos = {}
+_patterns = {}
+_plural_functions = {}
+
+
+def _get_locale(locale):
+    """Returns a ``babel.Locale`` object for a locale code. Objects are
+    created once and shared.
+    """
+    rv = _locales.get(locale)
+    if rv is None:
+        rv = _locales[locale] = Locale.parse(locale)
+
+    return rv
+
+
+def _get_tzinfo(timezone):
+    """Returns a ``tzinfo`` object for a timezone name. Objects are created
+    once and shared.
+    """
+    rv = _tzinfos.get(timezone)
+    if rv is None:
+        rv = _tzinfos[timezone] = pytz.timezone(timezone)
+
+    return rv
+
+
+def _get_plural_function(expr):
+    """Returns a function that evaluates a plural forms expression. Functions
+    are shared by the catalogs that use the same expression.
+    """
+    func = _plural_functions.get(expr)
+    if func is None:
+        func = _plural_functions[expr] = gettext_stdlib.c2py(expr)
+
+    return func
+
+
+def _get_mtime(path):
+    """Returns the modification time of a file, or None if it doesn't
+    exist.
+    """
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
 # Alias to gettext.
 _ = gettext
@@ -8,13 +8,80 @@
     :copyright: 2011 by tipfy.org.
     :license: BSD, see LICENSE.txt for more details.
 """
-from werkzeug import ETagResponseMixin
+import hashlib
+import time
+
+from werkzeug import ETagResponseMixin, generate_etag, import_string
+
+from .appengine import APPENGINE
+from .cache import LRUCache
+
+#: Default configuration values for this module. Keys are:
+#:
+#: response_cache_backend
+#:     Shared cache used by :class:`ResponseCacheMiddleware`, behind the
+#:     in-process LRU. It can be a class or an import string for a class
+#:     implementing the ``werkzeug.contrib.cache`` API. If not set, uses
+#:     ``GAEMemcachedCache`` on App Engine and ``SimpleCache`` otherwise.
+#:
+#: response_cache_size
+#:     Maximum number of responses kept in the in-process LRU cache. Set it
+#:     to 0 to only use the shared backend. Default is 100.
+default_config = {
+    'response_cache_backend': None,
+    'response_cache_size':    100,
+}
 
 
 class ETagMiddleware(object):
     """Adds an etag to all responses if they haven't already set one, and
     returns '304 Not Modified' if the request contains a matching etag.
+
+    It can be used as :class:`tipfy.RequestHandler` middleware or as
+    :class:`tipfy.app.App` middleware.
+
+    The etag is computed hashing the response body chunk by chunk, so it is
+    never joined in memory. Streamed responses (e.g., using a generator as
+    body) are not buffered and don't receive an etag. Instead, a handler can
+    define a ``get_etag(**rule_args)`` method that returns a cheap version
+    value, like an entity `updated` timestamp, to be used as a weak etag::
+
+        class PageHandler(RequestHandler):
+            middleware = [ETagMiddleware()]
+
+            def get_etag(self, page_id):
+                return Page.get_updated(page_id)
+
+    When the request contains a matching etag, '304 Not Modified' is returned
+    before the handler method is called.
     """
+    def before_dispatch(self, handler):
+        """Called before the class:`tipfy.RequestHandler` method is executed.
+
+        :param handler:
+            A class:`tipfy.RequestHandler` instance.
+        :returns:
+            A '304 Not Modified' response if the handler etag matches the
+            request, or None.
+        """
+        get_etag = getattr(handler, 'get_etag', None)
+        request = handler.request
+        if get_etag is None or request.method not in ('GET', 'HEAD'):
+            return None
+
+        value = get_etag(**request.rule_args)
+        if value is None:
+            return None
+
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+
+        etag = request.registry['tipfy.etag'] = generate_etag(str(value))
+        if request.if_none_match.contains_weak(etag):
+            response = handler.app.response_class(status=304)
+            response.set_etag(etag, weak=True)
+            return response
+
     def after_dispatch(self, handler, response):
         """Called after the class:`tipfy.RequestHandler` method was executed.
 
@@ -25,12 +92,406 @@ class ETagMiddleware(object):
         :returns:
             A class:`tipfy.Response` instance.
         """
-        if not isinstance(response, ETagResponseMixin):
+        return self.after_request(handler.request, response)
+
+    def after_request(self, request, response):
+        """Called after a response is made by the class:`tipfy.app.App`.
+
+        :param request:
+            A class:`tipfy.Request` instance.
+        :param response:
+            A class:`tipfy.Response` instance.
+        :returns:
+            A class:`tipfy.Response` instance.
+        """
+        if not isinstance(response, ETagResponseMixin) or \
+            response.status_code == 304:
             return response
 
-        response.add_etag()
+        etag = request.registry.pop('tipfy.etag', None)
+        if 'ETag' not in response.headers:
+            if etag is not None:
+                response.set_etag(etag, weak=True)
+            elif not response.is_streamed:
+                response.set_etag(self.get_body_etag(response))
+            else:
+                return response
+
+        etag, weak = response.get_etag()
+        if request.if_none_match.contains_weak(etag):
+            not_modified = request.app.response_class(status=304)
+            not_modified.set_etag(etag, weak=weak)
+            return not_modified
+
+        return response
+
+    def get_body_etag(self, response):
+        """Returns an etag for a response body, hashing it incrementally.
+
+        :param response:
+            A class:`tipfy.Response` instance with a non-streamed body.
+        :returns:
+            The etag value.
+        """
+        charset = response.charset
+        digest = hashlib.md5()
+        for chunk in response.response:
+            if isinstance(chunk, unicode):
+                chunk = chunk.encode(charset)
+
+            digest.update(chunk)
+
+        return digest.hexdigest()
+
+
+class ResponseCache(object):
+    """A two-tier cache for serialized responses: an in-process LRU in front
+    of a shared backend such as memcache. Entries can be tagged and all
+    entries sharing a tag are invalidated at once with
+    :meth:`invalidate_tags`.
+    """
+    #: Prefix for the backend keys that store tag versions.
+    tag_prefix = 'tipfy.response_cache.tag:'
+    #: Time in seconds to keep tag versions. When a version expires, entries
+    #: stored with that tag are discarded.
+    tag_ttl = 86400
+    #: Time in seconds to keep tag versions in the process before reading
+    #: them again from the backend. Tags invalidated by other processes are
+    #: seen after at most this time.
+    local_tag_ttl = 5
+    #: Maximum number of tag versions kept in the process.
+    local_tag_size = 1000
+
+    def __init__(self, app):
+        """Initializes the cache.
+
+        :param app:
+            A :class:`tipfy.app.App` instance.
+        """
+        config = app.config[__name__]
+        backend = config['response_cache_backend']
+        if backend is None:
+            if APPENGINE:
+                backend = 'werkzeug.contrib.cache.GAEMemcachedCache'
+            else:
+                backend = 'werkzeug.contrib.cache.SimpleCache'
+
+        if isinstance(backend, basestring):
+            backend = import_string(backend)
+
+        self.backend = backend()
+
+        size = config['response_cache_size']
+        self.local = LRUCache(size) if size else None
+        self.tag_versions = LRUCache(self.local_tag_size)
+
+    def get(self, key):
+        """Returns a cached entry, or None if it is missing, expired or one
+        of its tags was invalidated after it was stored.
+
+        :param key:
+            The cache key.
+        :returns:
+            A tuple ``(status, headers, body)``, or None.
+        """
+        entry = None
+        if self.local is not None:
+            entry = self.local.get(key)
+            if entry is not None and entry[0] <= time.time():
+                self.local.pop(key)
+                entry = None
+
+        if entry is None:
+            entry = self.backend.get(key)
+            if entry is None:
+                return None
+
+            if self.local is not None:
+                self.local[key] = entry
+
+        expires, tags, response = entry
+        if tags and self.get_tag_versions(tags, False) != tags:
+            if self.local is not None:
+                self.local.pop(key)
+
+            return None
+
+        return response
+
+    def set(self, key, response, ttl, tags=None):
+        """Stores an entry in both cache tiers.
+
+        :param key:
+            The cache key.
+        :param response:
+            A tuple ``(status, headers, body)``.
+        :param ttl:
+            Time in seconds to keep the entry.
+        :param tags:
+            A list of tags to associate to the entry.
+        """
+        versions = {}
+        if tags:
+            versions = self.get_tag_versions(tags, True)
+
+        entry = (time.time() + ttl, versions, response)
+        self.backend.set(key, entry, ttl)
+        if self.local is not None:
+            self.local[key] = entry
+
+    def get_tag_versions(self, tags, create):
+        """Returns the current versions of a list of tags. Versions are
+        read from the process if they were read recently, and the others
+        are read from the backend at once.
+
+        :param tags:
+            A list of tag names.
+        :param create:
+            If True, creates versions for the tags that don't have one.
+            Otherwise their version is None.
+        :returns:
+            A dictionary mapping tags to versions.
+        """
+        now = time.time()
+        versions = {}
+        missing = []
+        for tag in tags:
+            cached = self.tag_versions.get(tag)
+            if cached is not None and cached[0] > now:
+                versions[tag] = cached[1]
+            else:
+                missing.append(tag)
+
+        if missing:
+            keys = [self.tag_prefix + tag for tag in missing]
+            values = self.backend.get_many(*keys)
+            new = [key for key, value in zip(keys, values) if value is None]
+            if new and create:
+                # Another process may add a version at the same time, so
+                # the versions are read again after adding them.
+                for key in new:
+                    self.backend.add(key, now, self.tag_ttl)
+
+                added = dict(zip(new, self.backend.get_many(*new)))
+                values = [added.get(key, value) for key, value in
+                    zip(keys, values)]
+
+            for tag, value in zip(missing, values):
+                if value is not None:
+                    self.tag_versions[tag] = (now + self.local_tag_ttl, value)
+                elif create:
+                    # The backend didn't keep the version. Entries stored
+                    # with it are never served, as their tag can't be
+                    # checked.
+                    value = now
+
+                versions[tag] = value
+
+        return versions
+
+    def invalidate_tags(self, *tags):
+        """Invalidates all entries stored with any of the given tags.
+
+        :param tags:
+            Tag names passed as positional arguments.
+        """
+        # A new version makes the versions recorded by old entries stale.
+        version = time.time()
+        self.backend.set_many(dict((self.tag_prefix + tag, version) for
+            tag in tags), self.tag_ttl)
+        for tag in tags:
+            self.tag_versions[tag] = (version + self.local_tag_ttl, version)
+
+    @classmethod
+    def factory(cls, _app, _name='tipfy.response_cache'):
+        if _name not in _app.registry:
+            _app.registry[_name] = cls(_app)
+
+        return _app.registry[_name]
+
+
+class ResponseCacheMiddleware(object):
+    """Caches successful GET responses, skipping the handler dispatch when a
+    cached response is available. It is a :class:`tipfy.RequestHandler`
+    middleware, and must be instantiated::
+
+        class PageHandler(RequestHandler):
+            middleware = [ResponseCacheMiddleware(ttl=600, tags=['pages'])]
+
+    Responses are cached by URL and query string, and optionally by request
+    headers and the current locale. Responses that set cookies or have a
+    status other than 200 are not cached. To invalidate tagged responses,
+    call::
+
+        ResponseCache.factory(app).invalidate_tags('pages')
+
+    To also serve cached responses before the URL rules are matched, so
+    that no handler is created, add an instance to the app middleware::
 
-        if handler.request.if_none_match.contains_raw(response.get_etag()[0]):
-            return handler.app.response_class(status=304)
+        app = App(rules, middleware=[ResponseCacheMiddleware()])
 
+    The app middleware only serves responses cached by handler middleware
+    created with ``public=True``, using the settings of the handler
+    middleware that stored them.
+
+    .. warning::
+       Responses served by the app middleware skip the handler and all its
+       middleware, including authentication and access checks. Only set
+       ``public=True`` for pages that anyone can see, or add the headers
+       that identify the user, such as ``Cookie``, to `vary_headers`.
+    """
+    def __init__(self, ttl=300, tags=None, vary_headers=None,
+        vary_locale=False, public=False):
+        """Initializes the middleware.
+
+        :param ttl:
+            Time in seconds to cache responses. Default is 300.
+        :param tags:
+            A list of tags for the cached responses, or a callable that
+            receives the handler and returns a list of tags.
+        :param vary_headers:
+            A list of request header names that change the response.
+        :param vary_locale:
+            If True, caches responses separately per locale.
+        :param public:
+            If True, cached responses can be served by the app middleware,
+            without dispatching to the handler. Default is False.
+        """
+        self.ttl = ttl
+        self.tags = tags
+        self.vary_headers = tuple(vary_headers or ())
+        self.vary_locale = vary_locale
+        self.public = public
+
+    def before_request(self, request):
+        """Called by the :class:`tipfy.app.App` before the URL rules are
+        matched.
+
+        :param request:
+            A :class:`tipfy.Request` instance.
+        :returns:
+            A cached response, or None.
+        """
+        if request.method not in ('GET', 'HEAD'):
+            return None
+
+        cache = ResponseCache.factory(request.app)
+        url_key = self.get_url_key(request)
+        # The settings used to store responses for this URL.
+        settings = cache.get(url_key)
+        if settings is None:
+            return None
+
+        vary_headers, vary_locale, public = settings
+        if not public:
+            return None
+
+        key = self.get_key(request, vary_headers, vary_locale)
+        request.registry['tipfy.response_cache.checked'] = key
+        return self.get_response(request, cache, key)
+
+    def before_dispatch(self, handler):
+        """Called before the class:`tipfy.RequestHandler` method is executed.
+
+        :param handler:
+            A class:`tipfy.RequestHandler` instance.
+        :returns:
+            A cached response, or None.
+        """
+        request = handler.request
+        if request.method not in ('GET', 'HEAD'):
+            return None
+
+        key = self.get_key(request, self.vary_headers, self.vary_locale)
+        if request.registry.get('tipfy.response_cache.checked') != key:
+            response = self.get_response(request,
+                ResponseCache.factory(handler.app), key)
+            if response is not None:
+                return response
+
+        if request.method == 'GET':
+            request.registry['tipfy.response_cache.key'] = key
+
+    def after_dispatch(self, handler, response):
+        """Called after the class:`tipfy.RequestHandler` method was executed.
+
+        :param handler:
+            A class:`tipfy.RequestHandler` instance.
+        :param response:
+            A class:`tipfy.Response` instance.
+        :returns:
+            A class:`tipfy.Response` instance.
+        """
+        request = handler.request
+        key = request.registry.pop('tipfy.response_cache.key', None)
+        if key is None or response.status_code != 200 or \
+            response.is_streamed or 'Set-Cookie' in response.headers:
+            return response
+
+        tags = self.tags
+        if callable(tags):
+            tags = tags(handler)
+
+        cache = ResponseCache.factory(handler.app)
+        cached = (response.status_code, list(response.headers),
+            response.data)
+        cache.set(key, cached, self.ttl, tags)
+        # The settings are stored for handlers that aren't public too, so
+        # that they replace the settings of a handler that was public.
+        cache.set(self.get_url_key(request), (self.vary_headers,
+            self.vary_locale, self.public), self.ttl)
         return response
+
+    def get_response(self, request, cache, key):
+        """Returns a cached response.
+
+        :param request:
+            A :class:`tipfy.Request` instance.
+        :param cache:
+            A :class:`ResponseCache` instance.
+        :param key:
+            The cache key.
+        :returns:
+            A class:`tipfy.Response` instance, or None.
+        """
+        cached = cache.get(key)
+        if cached is not None:
+            status, headers, body = cached
+            return request.app.response_class(body, status=status,
+                headers=headers)
+
+    def get_url_key(self, request):
+        """Returns the key for the settings used to cache responses for the
+        requested URL.
+
+        :param request:
+            A :class:`tipfy.Request` instance.
+        :returns:
+            A cache key.
+        """
+        parts = [request.base_url, sorted(request.args.items(multi=True))]
+        return 'tipfy.response_cache.url:' + \
+            hashlib.sha1(repr(parts)).hexdigest()
+
+    def get_key(self, request, vary_headers, vary_locale):
+        """Returns the cache key for the current request.
+
+        :param request:
+            A :class:`tipfy.Request` instance.
+        :param vary_headers:
+            A list of request header names that change the response.
+        :param vary_locale:
+            If True, the key includes the current locale.
+        :returns:
+            A cache key.
+        """
+        parts = [request.base_url, sorted(request.args.items(multi=True))]
+        parts.extend(request.headers.get(h) for h in vary_headers)
+        if vary_locale:
+            if request.rule is None:
+                # The locale can be set from the rule arguments.
+                request.app.router.match(request)
+
+            parts.append(request.i18n.locale)
+
+        return 'tipfy.response_cache:' + hashlib.sha1(repr(parts)).hexdigest()
@@ -8,11 +8,15 @@
     :copyright: 2011 by tipfy.org.
     :license: BSD, see LICENSE.txt for more details.
 """
+from urlparse import urljoin
+
+from werkzeug import exceptions
 from werkzeug import routing
 from werkzeug import urls
 from werkzeug import utils
 from werkzeug import wrappers
 
+from .cache import LRUCache
 from .local import get_request, local
 
 # For export.
@@ -25,6 +29,14 @@ Submount = routing.Submount
 
 
 class Router(object):
+    #: Maximum number of URL adapters kept when `compile_rules` is enabled.
+    #: The cache is emptied when this size is reached.
+    max_adapters = 100
+    #: Maximum number of URLs kept by the URL builder caches, one for URLs
+    #: built without arguments and one for URLs built with arguments. Set to
+    #: 0 to disable the caches.
+    max_cached_urls = 1000
+
     def __init__(self, app, rules=None):
         """Initializes the router.
 
@@ -35,7 +47,16 @@ class Router(object):
         """
         self.app = app
         self.handlers = {}
+        self.compiled = app.config['tipfy']['compile_rules']
+        self.adapters = {}
+        self.static_urls = {}
+        self.urls = None
+        if self.max_cached_urls:
+            self.urls = LRUCache(self.max_cached_urls)
         self.map = self.create_map(rules)
+        if self.compiled:
+            # Sort and index the rules now instead of in the first request.
+            self.map.update()
 
     def add(self, rule):
         """Adds a rule to the URL map.
@@ -50,6 +71,11 @@ class Router(object):
         else:
             self.map.add(rule)
 
+        # Built URLs may change with the new rules.
+        self.static_urls.clear()
+        if self.urls is not None:
+            self.urls.clear()
+
     def match(self, request):
         """Matches registered :class:`Rule` definitions against the current
         request and returns the matched rule and rule arguments.
@@ -67,15 +93,55 @@ class Router(object):
             A tuple ``(rule, rule_args)`` with the matched rule and rule
             arguments.
         """
-        # Bind the URL map to the current request
-        request.rule_adapter = self.map.bind_to_environ(request.environ,
-            server_name=self.get_server_name(request))
+        if self.compiled:
+            request.rule_adapter = self.get_adapter(request)
+            match = request.rule_adapter.match(
+                request.environ.get('PATH_INFO'), request.method,
+                return_rule=True)
+        else:
+            # Bind the URL map to the current request
+            request.rule_adapter = self.map.bind_to_environ(request.environ,
+                server_name=self.get_server_name(request))
+
+            # Match the path against registered rules.
+            match = request.rule_adapter.match(return_rule=True)
 
-        # Match the path against registered rules.
-        match = request.rule_adapter.match(return_rule=True)
         request.rule, request.rule_args = match
         return match
 
+    def get_adapter(self, request):
+        """Returns a URL adapter for the current request, reusing adapters
+        bound to the same server name, script name, URL scheme and request
+        method. This is only used when `compile_rules` is enabled.
+
+        Unlike adapters built by ``Map.bind_to_environ()``, the returned
+        adapter doesn't have a default path info, so the path must be passed
+        explicitly to ``match()``.
+
+        :param request:
+            A :class:`tipfy.app.Request` instance.
+        :returns:
+            A :class:`CompiledMapAdapter` instance.
+        """
+        environ = request.environ
+        server_name = self.get_server_name(request)
+        key = (server_name, environ.get('HTTP_HOST'),
+            environ.get('SERVER_NAME'), environ.get('SERVER_PORT'),
+            environ.get('SCRIPT_NAME'), environ['wsgi.url_scheme'],
+            environ['REQUEST_METHOD'])
+
+        adapter = self.adapters.get(key)
+        if adapter is None:
+            if len(self.adapters) >= self.max_adapters:
+                self.adapters.clear()
+
+            bound = self.map.bind_to_environ(environ, server_name=server_name)
+            adapter = self.adapters[key] = CompiledMapAdapter(self.map,
+                bound.server_name, bound.script_name, bound.subdomain,
+                bound.url_scheme, None, bound.default_method)
+
+        return adapter
+
     def dispatch(self, request):
         """Dispatches a request. This instantiates and calls a
         :class:`tipfy.RequestHandler` based on the matched :class:`Rule`.
@@ -91,6 +157,24 @@ class Router(object):
             A :class:`tipfy.app.Response` instance.
         """
         rule, rule_args = self.match(request)
+        handler = self.get_handler(rule)
+        rv = local.current_handler = handler(request)
+        if not isinstance(rv, wrappers.BaseResponse) and \
+            hasattr(rv, '__call__'):
+            # If it is a callable but not a response, we call it again.
+            rv = rv()
+
+        return rv
+
+    def get_handler(self, rule):
+        """Returns the handler for a rule. If the handler is defined as a
+        string, it is imported and replaced in the rule.
+
+        :param rule:
+            A :class:`Rule` instance.
+        :returns:
+            A handler class or function.
+        """
         handler = rule.handler
         if isinstance(handler, basestring):
             if handler not in self.handlers:
@@ -98,13 +182,16 @@ class Router(object):
 
             rule.handler = handler = self.handlers[handler]
 
-        rv = local.current_handler = handler(request)
-        if not isinstance(rv, wrappers.BaseResponse) and \
-            hasattr(rv, '__call__'):
-            # If it is a callable but not a response, we call it again.
-            rv = rv()
+        return handler
 
-        return rv
+    def import_handlers(self):
+        """Imports all handlers defined as strings in the URL rules, including
+        the ones prefixed by :class:`HandlerPrefix`. Rules that only build
+        URLs or redirect are skipped, as they are never dispatched.
+        """
+        for rule in self.map.iter_rules():
+            if not rule.build_only and rule.redirect_to is None:
+                self.get_handler(rule)
 
     def url_for(self, request, name, kwargs):
         """Returns a URL for a named :class:`Rule`. This is the central place
@@ -139,8 +226,7 @@ class Router(object):
         anchor = kwargs.pop('_anchor', None)
         full = kwargs.pop('_full', False) and not scheme and not netloc
 
-        url = request.rule_adapter.build(name, values=kwargs, method=method,
-                                        force_external=full)
+        url = self.build_url(request.rule_adapter, name, kwargs, method, full)
 
         if scheme or netloc:
             url = '%s://%s%s' % (scheme or 'http', netloc or request.host, url)
@@ -150,6 +236,55 @@ class Router(object):
 
         return url
 
+    def build_url(self, adapter, name, values, method=None, full=False):
+        """Builds a URL using a URL adapter, caching the result. URLs built
+        without arguments are kept in a dictionary, and URLs built with
+        arguments in a LRU cache. Both hold up to :attr:`max_cached_urls`
+        items. URLs with arguments are only cached if all values are strings,
+        numbers, booleans or None, as other objects could be converted
+        differently after being modified.
+
+        :param adapter:
+            A URL adapter bound to the current request.
+        :param name:
+            The rule name.
+        :param values:
+            A dictionary of values to build the URL.
+        :param method:
+            The request method of the rule to be used, if any.
+        :param full:
+            If True, builds an absolute URL.
+        :returns:
+            The built URL.
+        """
+        if self.urls is None:
+            return adapter.build(name, values=values, method=method,
+                force_external=full)
+
+        key = (adapter.server_name, adapter.script_name, adapter.subdomain,
+            adapter.url_scheme, adapter.default_method, name, method, full)
+
+        if values:
+            for value in values.itervalues():
+                if type(value) not in _cacheable_types:
+                    return adapter.build(name, values=values, method=method,
+                        force_external=full)
+
+            cache = self.urls
+            key += tuple(sorted((k, type(v), v) for k, v in
+                values.iteritems()))
+        else:
+            cache = self.static_urls
+            if key not in cache and len(cache) >= self.max_cached_urls:
+                cache.clear()
+
+        url = cache.get(key)
+        if url is None:
+            url = cache[key] = adapter.build(name, values=values,
+                method=method, force_external=full)
+
+        return url
+
     def create_map(self, rules=None):
         """Returns a ``werkzeug.routing.Map`` instance with the given
         :class:`Rule` definitions.
@@ -157,9 +292,11 @@ class Router(object):
         :param rules:
             A list of :class:`Rule` definitions.
         :returns:
-            A ``werkzeug.routing.Map`` instance.
+            A ``werkzeug.routing.Map`` instance, or a :class:`CompiledMap`
+            if `compile_rules` is enabled.
         """
-        return Map(rules, default_subdomain=self.get_default_subdomain())
+        map_class = self.compiled and CompiledMap or Map
+        return map_class(rules, default_subdomain=self.get_default_subdomain())
 
     def get_default_subdomain(self):
         """Returns the default subdomain for rules without a subdomain
@@ -187,6 +324,163 @@ class Router(object):
     build = url_for
 
 
+class CompiledMap(Map):
+    """A ``werkzeug.routing.Map`` that indexes its rules in a tree of static
+    path segments. Each rule is stored in the node of the last complete
+    segment that precedes its first variable part, so when matching a path
+    only rules stored in the nodes along that path need to be tested.
+
+    The index is rebuilt whenever the map is updated after rules are added.
+    """
+    def __init__(self, *args, **kwargs):
+        self._root = None
+        super(CompiledMap, self).__init__(*args, **kwargs)
+
+    def update(self):
+        """Sorts the rules if they changed and rebuilds the index."""
+        if self._remap or self._root is None:
+            super(CompiledMap, self).update()
+            self._root = self._build_index()
+
+    def get_candidates(self, path):
+        """Returns the rules that can possibly match a path, in the same
+        order in which they would be tested by ``Map``.
+
+        :param path:
+            A path info without leading slashes, in unicode.
+        :returns:
+            A list of rules.
+        """
+        node = self._root
+        for segment in path.split(u'/'):
+            child = node.children.get(segment)
+            if child is None:
+                break
+
+            node = child
+
+        return node.rules
+
+    def _build_index(self):
+        root = _RuleNode()
+        for rule in self._rules:
+            node = root
+            for segment in self._get_static_segments(rule):
+                node = node.children.setdefault(segment, _RuleNode())
+
+            node.rules.append(rule)
+
+        # Each node keeps the rules from its ancestors, so matching only
+        # needs the rules from the deepest node reached by a path.
+        positions = dict((id(rule), i) for i, rule in enumerate(self._rules))
+        stack = [(root, [])]
+        while stack:
+            node, inherited = stack.pop()
+            if inherited:
+                node.rules = sorted(inherited + node.rules,
+                    key=lambda rule: positions[id(rule)])
+
+            for child in node.children.itervalues():
+                stack.append((child, node.rules))
+
+        return root
+
+    def _get_static_segments(self, rule):
+        path = rule.rule
+        if isinstance(path, str):
+            path = path.decode(self.charset, 'ignore')
+
+        pos = path.find(u'<')
+        static = pos == -1 and path or path[:pos]
+        segments = static.lstrip(u'/').split(u'/')
+        # The last piece is only a complete segment if the whole rule is
+        # static; otherwise it can be followed by a variable part.
+        last = segments.pop()
+        if pos == -1 and last:
+            segments.append(last)
+
+        return segments
+
+
+class _RuleNode(object):
+    __slots__ = ('children', 'rules')
+
+    def __init__(self):
+        self.children = {}
+        self.rules = []
+
+
+class CompiledMapAdapter(routing.MapAdapter):
+    """A ``werkzeug.routing.MapAdapter`` that only tests the rules returned
+    by :meth:`CompiledMap.get_candidates`. Matching results, redirects and
+    raised exceptions are the same as in ``MapAdapter.match()``.
+    """
+    def match(self, path_info=None, method=None, return_rule=False):
+        """Matches a path against the candidate rules.
+
+        .. seealso:: ``werkzeug.routing.MapAdapter.match()``.
+        """
+        self.map.update()
+        if path_info is None:
+            path_info = self.path_info
+        if not isinstance(path_info, unicode):
+            path_info = path_info.decode(self.map.charset, 'ignore')
+        method = (method or self.default_method).upper()
+        path = u'%s|/%s' % (self.subdomain, path_info.lstrip('/'))
+        have_match_for = set()
+        for rule in self.map.get_candidates(path_info.lstrip('/')):
+            try:
+                rv = rule.match(path)
+            except routing.RequestSlash:
+                raise routing.RequestRedirect(str('%s://%s%s%s/%s/' % (
+                    self.url_scheme,
+                    self.subdomain and self.subdomain + '.' or '',
+                    self.server_name,
+                    self.script_name[:-1],
+                    urls.url_quote(path_info.lstrip('/'), self.map.charset)
+                )))
+            if rv is None:
+                continue
+            if rule.methods is not None and method not in rule.methods:
+                have_match_for.update(rule.methods)
+                continue
+            if self.map.redirect_defaults:
+                for r in self.map._rules_by_endpoint[rule.endpoint]:
+                    if r.provides_defaults_for(rule) and \
+                       r.suitable_for(rv, method):
+                        rv.update(r.defaults)
+                        subdomain, path = r.build(rv)
+                        raise routing.RequestRedirect(str('%s://%s%s%s/%s' % (
+                            self.url_scheme,
+                            subdomain and subdomain + '.' or '',
+                            self.server_name,
+                            self.script_name[:-1],
+                            urls.url_quote(path.lstrip('/'), self.map.charset)
+                        )))
+            if rule.redirect_to is not None:
+                if isinstance(rule.redirect_to, basestring):
+                    def _handle_match(match):
+                        value = rv[match.group(1)]
+                        return rule._converters[match.group(1)].to_url(value)
+                    redirect_url = routing._simple_rule_re.sub(_handle_match,
+                                                               rule.redirect_to)
+                else:
+                    redirect_url = rule.redirect_to(self, **rv)
+                raise routing.RequestRedirect(str(urljoin('%s://%s%s%s' % (
+                    self.url_scheme,
+                    self.subdomain and self.subdomain + '.' or '',
+                    self.server_name,
+                    self.script_name
+                ), redirect_url)))
+            if return_rule:
+                return rule, rv
+            else:
+                return rule.endpoint, rv
+        if have_match_for:
+            raise exceptions.MethodNotAllowed(valid_methods=list(have_match_for))
+        raise exceptions.NotFound()
+
+
 class Rule(routing.Rule):
     """A Rule represents one URL pattern. Tipfy extends Werkzeug's Rule
     to support handler and name definitions. Handler is the
@@ -419,6 +713,10 @@ def url_for(_name, **kwargs):
     return request.app.router.url_for(request, _name, kwargs)
 
 
+# Types of values that allow built URLs to be cached.
+_cacheable_types = frozenset([str, unicode, int, long, float, bool,
+    type(None)])
+
 # Add regex converter to the list of converters.
 Map.default_converters = dict(Map.default_converters)
 Map.default_converters['regex'] = RegexConverter
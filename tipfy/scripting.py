@@ -8,8 +8,21 @@
     :copyright: 2011 by tipfy.org.
     :license: BSD, see LICENSE.txt for more details.
 """
+from __future__ import with_statement
+
+import __builtin__
+import imp
+import logging
+import marshal
 import os
+import struct
 import sys
+import time
+import zipfile
+import zipimport
+
+#: Extensions of native modules, which can't be imported from zip files.
+NATIVE_EXTENSIONS = ('.so', '.pyd', '.dll')
 
 
 def set_gae_sys_path():
@@ -18,8 +31,7 @@ def set_gae_sys_path():
     app_path = os.path.join(base_path, 'app')
     gae_path = os.path.join(base_path, 'var/parts/google_appengine')
 
-    extra_paths = [
-        app_path,
+    extra_paths = [app_path] + get_lib_paths(app_path) + [
         gae_path,
         # These paths are required by the SDK.
         os.path.join(gae_path, 'lib', 'antlr3'),
@@ -30,3 +42,217 @@ def set_gae_sys_path():
     ]
 
     sys.path = extra_paths + sys.path
+
+
+def get_lib_paths(app_path):
+    """Returns the library paths of an app that exist: ``lib``, ``lib/dist``
+    and the zip bundle ``lib/dist.zip``, in this order. Missing paths are
+    left out because each of them costs a failed lookup for every import.
+
+    A zipimporter is created for the zip bundle and stored in
+    ``sys.path_importer_cache``, so the zip directory is read only once.
+
+    :param app_path:
+        The app directory.
+    :returns:
+        A list of paths to add to ``sys.path``.
+    """
+    lib_path = os.path.join(app_path, 'lib')
+    paths = []
+    for path in (lib_path, os.path.join(lib_path, 'dist')):
+        if os.path.isdir(path):
+            paths.append(path)
+
+    zip_path = os.path.join(lib_path, 'dist.zip')
+    if os.path.isfile(zip_path):
+        if zip_path not in sys.path_importer_cache:
+            sys.path_importer_cache[zip_path] = zipimport.zipimporter(
+                zip_path)
+
+        paths.append(zip_path)
+
+    return paths
+
+
+def build_zip(src_dir, zip_path, compile_pyc=True):
+    """Packs a libraries directory into a zip file to be imported using
+    zipimport. Importing from a zip reads its directory once instead of
+    checking the filesystem for each module.
+
+    When `compile_pyc` is True, a ``.pyc`` file is added next to each
+    module, so that modules are not compiled every time they are imported
+    from the zip. They are only used by the same Python version that built
+    the zip; other versions import the sources.
+
+    Native extensions can't be imported from a zip file, and are left out
+    with a warning.
+
+    :param src_dir:
+        The directory with packages and modules to pack.
+    :param zip_path:
+        The path of the zip file to create.
+    :param compile_pyc:
+        True to add compiled modules to the zip. Default is True.
+    """
+    zip_file = zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED)
+    try:
+        for dirpath, dirnames, filenames in os.walk(src_dir):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                arcname = os.path.relpath(path, src_dir).replace(os.sep, '/')
+                ext = os.path.splitext(filename)[1]
+                if ext in ('.pyc', '.pyo'):
+                    continue
+                elif ext in NATIVE_EXTENSIONS:
+                    logging.warning('Native extension %r was not added to '
+                        'the zip file.', arcname)
+                    continue
+
+                f = open(path, 'rb')
+                try:
+                    data = f.read()
+                finally:
+                    f.close()
+
+                info = zipfile.ZipInfo(arcname, time.localtime(
+                    os.stat(path).st_mtime)[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = 0644 << 16L
+                zip_file.writestr(info, data)
+
+                if compile_pyc and ext == '.py':
+                    pyc = _compile_pyc(data, os.path.join(zip_path, arcname),
+                        info.date_time)
+                    if pyc is not None:
+                        info = zipfile.ZipInfo(arcname + 'c', info.date_time)
+                        info.compress_type = zipfile.ZIP_DEFLATED
+                        info.external_attr = 0644 << 16L
+                        zip_file.writestr(info, pyc)
+    finally:
+        zip_file.close()
+
+
+def _compile_pyc(source, filename, date_time):
+    """Returns the contents of a ``.pyc`` file for a module source, or None
+    if it can't be compiled.
+    """
+    try:
+        code = compile(source.replace('\r\n', '\n'), filename, 'exec')
+    except SyntaxError, e:
+        logging.warning('Module %r was not compiled: %s', filename, e)
+        return None
+
+    # zipimport compares this to the timestamp of the source in the zip
+    # directory, which is stored in local time with a 2 seconds resolution.
+    mtime = int(time.mktime(date_time + (0, 0, -1)))
+    return imp.get_magic() + struct.pack('<I', mtime) + marshal.dumps(code)
+
+
+class ImportProfiler(object):
+    """Records the time spent importing modules, as a tree of imports.
+    While active, it replaces the builtin ``__import__``::
+
+        profiler = ImportProfiler()
+        with profiler:
+            import main
+
+        print profiler.format(threshold=1)
+
+    Only imports that load new modules are recorded. Times include the
+    time spent importing nested modules.
+    """
+    def __init__(self):
+        #: The root of the import tree. Each node is a list
+        #: ``[name, milliseconds, children]``.
+        self.root = [None, 0.0, []]
+        self._stack = [self.root]
+        self._import = None
+
+    def __enter__(self):
+        self._import = __builtin__.__import__
+        __builtin__.__import__ = self.import_module
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        __builtin__.__import__ = self._import
+
+    def import_module(self, name, globals=None, locals=None, fromlist=None,
+        level=-1):
+        """Replacement for ``__import__`` that times new imports."""
+        count = len(sys.modules)
+        node = [name, 0.0, []]
+        self._stack.append(node)
+        start = time.time()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            node[1] = (time.time() - start) * 1000
+            self._stack.pop()
+            if len(sys.modules) != count:
+                node[0] = self._get_module_name(name, globals, level)
+                self._stack[-1][2].append(node)
+
+    def _get_module_name(self, name, globals, level):
+        if level == 0 or not globals or '__name__' not in globals:
+            return name
+
+        package = globals.get('__package__')
+        if not package:
+            package = globals['__name__']
+            if '__path__' not in globals:
+                package = package.rpartition('.')[0]
+
+        if level > 1:
+            package = package.rsplit('.', level - 1)[0]
+
+        full_name = '.'.join(filter(None, (package, name)))
+        if sys.modules.get(full_name) is not None:
+            return full_name
+
+        return name
+
+    def format(self, threshold=0):
+        """Returns the import tree as text, one module per line with the
+        total import time in milliseconds.
+
+        :param threshold:
+            Imports that took less than this number of milliseconds are
+            not displayed.
+        :returns:
+            The formatted import tree.
+        """
+        lines = []
+
+        def add(node, depth):
+            name, ms, children = node
+            if ms >= threshold:
+                lines.append('%9.1f ms  %s%s' % (ms, '  ' * depth, name))
+                for child in children:
+                    add(child, depth + 1)
+
+        for node in self.root[2]:
+            add(node, 0)
+
+        return '\n'.join(lines)
+
+
+def profile_imports(modules, threshold=0):
+    """Imports the given modules and returns the import tree with the
+    time spent importing each module, formatted by
+    :meth:`ImportProfiler.format`.
+
+    :param modules:
+        A list of module names to import.
+    :param threshold:
+        Imports that took less than this number of milliseconds are not
+        displayed.
+    :returns:
+        The formatted import tree.
+    """
+    profiler = ImportProfiler()
+    with profiler:
+        for name in modules:
+            __import__(name)
+
+    return profiler.format(threshold)
@@ -10,15 +10,18 @@
     :copyright: 2011 by tipfy.org.
     :license: Apache Sotware License, see LICENSE for details.
 """
+import base64
 import hashlib
 import hmac
 import logging
 import time
+import zlib
 
 from tipfy import APPENGINE, DEFAULT_VALUE, REQUIRED_VALUE
-from tipfy.utils import json_b64encode, json_b64decode
+from tipfy.utils import (json_b64encode, json_b64decode, json_decode,
+    json_encode)
 
-from werkzeug import cached_property
+from werkzeug import cached_property, import_string
 from werkzeug.contrib.sessions import ModificationTrackingDict
 
 #: Default configuration values for this module. Keys are:
@@ -36,6 +39,17 @@ from werkzeug.contrib.sessions import ModificationTrackingDict
 #:     Name of the cookie to save a session or session id. Default is
 #:     `session`.
 #:
+#: serializer
+#:     Format used to serialize secure cookies: `json` (JSON encoded to
+#:     base64) or `compact` (JSON with shortened keys, compressed with zlib
+#:     when large). Can also be an import string for a serializer class.
+#:     The compact format also reads `json` cookies, and sessions stored in
+#:     them are saved again in the compact format. Default is `json`.
+#:
+#: signature_hash
+#:     Name of the hash function used to sign secure cookies: `sha1` or
+#:     `sha256`. Changing it invalidates existing cookies. Default is `sha1`.
+#:
 #: session_max_age:
 #:     Default session expiration time in seconds. Limits the duration of the
 #:     contents of a cookie, even if a session cookie exists. If None, the
@@ -64,6 +78,8 @@ default_config = {
     'secret_key':      REQUIRED_VALUE,
     'default_backend': 'securecookie',
     'cookie_name':     'session',
+    'serializer':      'json',
+    'signature_hash':  'sha1',
     'session_max_age': None,
     'cookie_args': {
         'max_age':     None,
@@ -119,7 +135,10 @@ class SecureCookieSession(BaseSession):
         if name:
             data = store.get_secure_cookie(name)
             if data is not None:
-                return cls(data)
+                session = cls(data)
+                # Save again cookies that use an outdated format.
+                session.modified = store.is_secure_cookie_outdated(name)
+                return session
 
         return cls(new=True)
 
@@ -130,19 +149,132 @@ class SecureCookieSession(BaseSession):
         store.set_secure_cookie(response, name, dict(self), **kwargs)
 
 
+class JSONSerializer(object):
+    """Serializes secure cookie values to JSON encoded to base64."""
+    def dumps(self, value):
+        """Serializes a value.
+
+        :param value:
+            A dictionary.
+        :returns:
+            The serialized value.
+        """
+        return json_b64encode(value)
+
+    def loads(self, value):
+        """Deserializes a value.
+
+        :param value:
+            A value returned by :meth:`dumps`.
+        :returns:
+            The deserialized value.
+        """
+        return json_b64decode(value)
+
+    def is_outdated(self, value):
+        """Checks if a value was serialized in an older format.
+
+        :param value:
+            A serialized value.
+        :returns:
+            True if the value should be serialized again.
+        """
+        return False
+
+
+class CompactSerializer(JSONSerializer):
+    """Serializes secure cookie values to a compact format: common keys are
+    shortened and payloads larger than :attr:`threshold` are compressed
+    with zlib. Values serialized by :class:`JSONSerializer` are also read.
+    """
+    #: Prefix that identifies the compact format. It is not a base64
+    #: character, so it never starts a value serialized to JSON and base64.
+    prefix = '~'
+    #: Minimum payload size in bytes to be compressed.
+    threshold = 128
+    #: Short aliases for common session keys.
+    aliases = {
+        '_auth':       '!a',
+        '_csrf_token': '!c',
+        '_flash':      '!f',
+        '_sid':        '!s',
+    }
+
+    def __init__(self):
+        self.keys = dict((v, k) for k, v in self.aliases.iteritems())
+
+    def dumps(self, value):
+        aliases = self.aliases
+        data = {}
+        for key, item in value.iteritems():
+            if key in aliases:
+                key = aliases[key]
+            elif isinstance(key, basestring) and key.startswith('!'):
+                key = '!' + key
+
+            data[key] = item
+
+        data = json_encode(data)
+        flag = 'j'
+        if len(data) > self.threshold:
+            compressed = zlib.compress(data, 9)
+            if len(compressed) < len(data):
+                data, flag = compressed, 'z'
+
+        return self.prefix + flag + \
+            base64.urlsafe_b64encode(data).rstrip('=')
+
+    def loads(self, value):
+        if not value.startswith(self.prefix):
+            return JSONSerializer.loads(self, value)
+
+        value = str(value)
+        flag, data = value[1], value[2:]
+        data = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+        if flag == 'z':
+            data = zlib.decompress(data)
+        elif flag != 'j':
+            raise ValueError('Unknown serialization flag %r.' % flag)
+
+        keys = self.keys
+        rv = {}
+        for key, item in json_decode(data).iteritems():
+            if key in keys:
+                key = keys[key]
+            elif key.startswith('!!'):
+                key = key[1:]
+
+            rv[key] = item
+
+        return rv
+
+    def is_outdated(self, value):
+        return not value.startswith(self.prefix)
+
+
 class SecureCookieStore(object):
     """Encapsulates getting and setting secure cookies.
 
     Extracted from `Tornado`_ and modified.
     """
-    def __init__(self, secret_key):
+    def __init__(self, secret_key, hash_name='sha1', serializer=None):
         """Initilizes this secure cookie store.
 
         :param secret_key:
             A long, random sequence of bytes to be used as the HMAC secret
             for the cookie signature.
+        :param hash_name:
+            Name of the hash function used for the signature, `sha1` or
+            `sha256`. Default is `sha1`.
+        :param serializer:
+            A serializer instance for the cookie values. Default is a
+            :class:`JSONSerializer`.
         """
         self.secret_key = secret_key
+        self.serializer = serializer or JSONSerializer()
+        # The keyed HMAC is prepared once and copied for each signature.
+        self._hmac = hmac.new(secret_key, digestmod=getattr(hashlib,
+            hash_name))
 
     def get_cookie(self, request, name, max_age=None):
         """Returns the given signed cookie if it validates, or None.
@@ -175,7 +307,7 @@ class SecureCookieStore(object):
             return
 
         try:
-            return json_b64decode(parts[0])
+            return self.serializer.loads(parts[0])
         except:
             logging.warning('Cookie value failed to be decoded: %r', parts[0])
             return
@@ -207,26 +339,54 @@ class SecureCookieStore(object):
             An signed value using HMAC.
         """
         timestamp = str(int(time.time()))
-        value = json_b64encode(value)
+        value = self.serializer.dumps(value)
         signature = self._get_signature(name, value, timestamp)
         return '|'.join([value, timestamp, signature])
 
     def _get_signature(self, *parts):
         """Generated an HMAC signatures."""
-        hash = hmac.new(self.secret_key, digestmod=hashlib.sha1)
+        hash = self._hmac.copy()
         hash.update('|'.join(parts))
         return hash.hexdigest()
 
+    def is_outdated(self, request, name):
+        """Checks if a cookie was serialized in an older format.
+
+        :param request:
+            A :class:`tipfy.app.Request` object.
+        :param name:
+            Cookie name.
+        :returns:
+            True if the cookie value should be saved again.
+        """
+        value = request.cookies.get(name)
+        if not value:
+            return False
+
+        return self.serializer.is_outdated(value.split('|', 1)[0])
+
     def _check_signature(self, a, b):
         """Checks if an HMAC signatures is valid."""
-        if len(a) != len(b):
-            return False
+        if isinstance(a, unicode):
+            a = a.encode('utf-8')
+
+        return _compare_digest(a, b)
+
 
-        result = 0
-        for x, y in zip(a, b):
-            result |= ord(x) ^ ord(y)
+def _compare_digest(a, b):
+    """Compares two strings in constant time."""
+    if len(a) != len(b):
+        return False
+
+    result = 0
+    for x, y in zip(a, b):
+        result |= ord(x) ^ ord(y)
+
+    return result == 0
 
-        return result == 0
+
+# Use the C implementation when available (Python 2.7.7+).
+_compare_digest = getattr(hmac, 'compare_digest', _compare_digest)
 
 
 class SessionStore(object):
@@ -234,6 +394,11 @@ class SessionStore(object):
     default_backends = {
         'securecookie': SecureCookieSession,
     }
+    #: A dictionary with the supported secure cookie serializers.
+    serializers = {
+        'json':    JSONSerializer,
+        'compact': CompactSerializer,
+    }
 
     def __init__(self, request, backends=None):
         self.request = request
@@ -247,6 +412,8 @@ class SessionStore(object):
         self._sessions = {}
         # Tracked cookies.
         self._cookies = {}
+        # Batches of writes to commit when saving.
+        self._batches = {}
 
     @cached_property
     def secure_cookie_store(self):
@@ -255,7 +422,18 @@ class SessionStore(object):
         :returns:
             A :class:`SecureCookieStore` instance.
         """
-        return SecureCookieStore(self.config['secret_key'])
+        # The store is shared by all requests, so the HMAC is set up once.
+        registry = self.request.app.registry
+        store = registry.get('tipfy.sessions.secure_cookie_store')
+        if store is None:
+            serializer = self.config['serializer']
+            serializer = self.serializers.get(serializer) or \
+                import_string(serializer)
+            store = registry['tipfy.sessions.secure_cookie_store'] = \
+                SecureCookieStore(self.config['secret_key'],
+                self.config['signature_hash'], serializer())
+
+        return store
 
     def get_session(self, key=None, backend=None, **kwargs):
         """Returns a session for a given key. If the session doesn't exist, a
@@ -344,6 +522,17 @@ class SessionStore(object):
         return self.secure_cookie_store.get_cookie(self.request, name,
             max_age=max_age)
 
+    def is_secure_cookie_outdated(self, name):
+        """Checks if a secure cookie from the request was serialized in an
+        older format, and should be saved again.
+
+        :param name:
+            Cookie name.
+        :returns:
+            True if the cookie is outdated, False otherwise.
+        """
+        return self.secure_cookie_store.is_outdated(self.request, name)
+
     def set_secure_cookie(self, response, name, value, **kwargs):
         """Sets a secure cookie in the response.
 
@@ -416,6 +605,30 @@ class SessionStore(object):
                 for key, (value, kwargs) in sessions.iteritems():
                     value.save_session(response, self, key, **kwargs)
 
+        if self._batches:
+            batches, self._batches = self._batches, {}
+            for batch in batches.values():
+                batch.commit()
+
+    def get_batch(self, key, factory):
+        """Returns a batch shared by the sessions saved in this request.
+        Session backends use it to group their writes: the batch ``commit()``
+        method is called once at the end of :meth:`save`, after all sessions
+        were saved.
+
+        :param key:
+            A key to identify the batch.
+        :param factory:
+            A callable that returns a new batch, used if it doesn't exist.
+        :returns:
+            A batch object.
+        """
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = factory()
+
+        return batch
+
     def get_cookie_args(self, **kwargs):
         """Returns a copy of the default cookie configuration updated with the
         passed arguments.
@@ -431,9 +644,14 @@ class SessionStore(object):
 
 
 class SessionMiddleware(object):
-    """Saves sessions at the end of a request."""
+    """Saves sessions at the end of a request. It can be used as
+    :class:`tipfy.RequestHandler` middleware or as :class:`tipfy.app.App`
+    middleware.
+    """
     def after_dispatch(self, handler, response):
         """Called after the class:`tipfy.RequestHandler` method was executed.
+        Sessions are saved by the session store of the handler, which can
+        be overridden, if it was used.
 
         :param handler:
             A class:`tipfy.RequestHandler` instance.
@@ -442,7 +660,26 @@ class SessionMiddleware(object):
         :returns:
             A class:`tipfy.Response` instance.
         """
-        handler.session_store.save(response)
+        if 'session_store' in handler.__dict__:
+            handler.session_store.save(response)
+            return response
+
+        return self.after_request(handler.request, response)
+
+    def after_request(self, request, response):
+        """Called after a response is made by the class:`tipfy.app.App`.
+        Sessions are only saved if the session store was used.
+
+        :param request:
+            A class:`tipfy.Request` instance.
+        :param response:
+            A class:`tipfy.Response` instance.
+        :returns:
+            A class:`tipfy.Response` instance.
+        """
+        if 'session_store' in request.__dict__:
+            request.session_store.save(response)
+
         return response
 
 
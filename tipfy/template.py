@@ -27,6 +27,20 @@ the compiled templates:
     loader = template.Loader("/home/btaylor")
     print loader.load("test.html").generate(myvalue="XXX")
 
+Loaders don't use a bytecode cache unless one is passed to them. With a
+bytecode cache, compiled templates are stored and are not parsed again
+when a new loader is created, e.g., when a new instance of the app
+starts:
+
+    cache = template.FileSystemBytecodeCache("/tmp/templates_cache")
+    loader = template.Loader("templates", bytecode_cache=cache)
+
+Where the file system is read-only, as on App Engine, compile the
+templates to a zip file before deploying, using the precompile_templates
+manage action or precompile(), and pass ZipBytecodeCache("templates.zip")
+instead. In development, Loader(..., debug=True) reloads templates when
+they change.
+
 We compile all templates to raw Python. Error-reporting is currently... uh,
 interesting. Syntax for the templates
 
@@ -81,99 +95,42 @@ to all templates by default.
 
 from __future__ import with_statement
 
+import __builtin__
 import cStringIO
 import datetime
-import htmlentitydefs
+import hashlib
+import imp
 import logging
+import marshal
 import os.path
 import re
-import urllib
-import xml.sax.saxutils
+import shutil
+import tempfile
+import types
 import zipfile
 
+from .cache import LRUCache
 from .json import json_encode
+from .utils import squeeze, url_escape, utf8, xhtml_escape, xhtml_unescape
 
 
-def utf8(value):
-    """Encodes a unicode value to UTF-8 if not yet encoded.
-
-    :param value:
-        Value to be encoded.
-    :returns:
-        An encoded string.
-    """
-    if isinstance(value, unicode):
-        return value.encode("utf-8")
-
-    assert isinstance(value, str)
-    return value
-
-
-def _unicode(value):
-    """Encodes a string value to unicode if not yet decoded.
+#: Default variables available in templates.
+_NAMESPACE = {
+    "__builtins__": __builtin__,
+    "escape": xhtml_escape,
+    "url_escape": url_escape,
+    "json_encode": json_encode,
+    "squeeze": squeeze,
+    "datetime": datetime,
+}
 
-    :param value:
-        Value to be decoded.
-    :returns:
-        A decoded string.
-    """
-    if isinstance(value, str):
-        return value.decode("utf-8")
+# Version of the generated code, part of the bytecode cache keys.
+_CODE_VERSION = 4
 
-    assert isinstance(value, unicode)
-    return value
-
-
-def xhtml_escape(value):
-    """Escapes a string so it is valid within XML or XHTML.
-
-    :param value:
-        The value to be escaped.
-    :returns:
-        The escaped value.
-    """
-    return utf8(xml.sax.saxutils.escape(value, {'"': "&quot;"}))
-
-
-def xhtml_unescape(value):
-    """Un-escapes an XML-escaped string.
-
-    :param value:
-        The value to be un-escaped.
-    :returns:
-        The un-escaped value.
-    """
-    return re.sub(r"&(#?)(\w+?);", _convert_entity, _unicode(value))
-
-
-def squeeze(value):
-    """Replace all sequences of whitespace chars with a single space."""
-    return re.sub(r"[\x00-\x20]+", " ", value).strip()
-
-
-def url_escape(value):
-    """Returns a valid URL-encoded version of the given value."""
-    return urllib.quote_plus(utf8(value))
-
-
-def _convert_entity(m):
-    if m.group(1) == "#":
-        try:
-            return unichr(int(m.group(2)))
-        except ValueError:
-            return "&#%s;" % m.group(2)
-    try:
-        return _HTML_UNICODE_MAP[m.group(2)]
-    except KeyError:
-        return "&%s;" % m.group(2)
-
-
-def _build_unicode_map():
-    return dict((name, unichr(value)) for \
-        name, value in htmlentitydefs.name2codepoint.iteritems())
-
-
-_HTML_UNICODE_MAP = _build_unicode_map()
+# Names from the namespace passed as arguments to _execute() and
+# _stream() when a template uses them, so that they are looked up as
+# locals.
+_LOCAL_NAMES = ("escape", "url_escape", "json_encode", "squeeze")
 
 
 class Template(object):
@@ -181,59 +138,167 @@ class Template(object):
 
     We compile into Python from the given template_string. You can generate
     the template from variables with generate().
+
+    If a bytecode_cache is given, the compiled code is stored in it, and
+    loaded from it when the template source and the templates it extends
+    or includes didn't change. Then the template is only parsed if needed.
+
+    The template can also be generated in chunks with generate_stream().
+    A chunk is yielded at each {% block %} boundary, and inside loops once
+    stream_threshold bytes are buffered.
     """
+    stream_threshold = 8192
+
     def __init__(self, template_string, name="<string>", loader=None,
-                 compress_whitespace=None):
+                 compress_whitespace=None, bytecode_cache=None):
         self.name = name
         if compress_whitespace is None:
             compress_whitespace = name.endswith(".html") or \
                 name.endswith(".js")
-        reader = _TemplateReader(name, template_string)
-        self.file = _File(_parse(reader))
-        self.code = self._generate_python(loader, compress_whitespace)
+        self.template_string = template_string
+        self.loader = loader
+        self.compress_whitespace = compress_whitespace
+        self.source_hash = hashlib.sha1(utf8(template_string)).hexdigest()
+        self._file = None
+        self._code = None
+        self.compiled = None
+        self.mtimes = None
+        if bytecode_cache is not None:
+            key = self.get_cache_key()
+            cached = bytecode_cache.get(key)
+            if cached is not None and self._check_dependencies(cached[0]):
+                self.dependencies = [dep for dep, source_hash in cached[0]]
+                self.compiled = cached[1]
+        if self.compiled is None:
+            self.dependencies = []
+            self._code = self._generate_python(loader, compress_whitespace)
+            try:
+                self.compiled = compile(self._code, self.name, "exec")
+            except:
+                formatted_code = _format_code(self._code).rstrip()
+                logging.error("%s code:\n%s", self.name, formatted_code)
+                raise
+            if bytecode_cache is not None:
+                dependencies = [(dep, loader.load(dep).source_hash) for
+                                dep in self.dependencies]
+                bytecode_cache.set(key, dependencies, self.compiled)
+        # Run the module code once to get the code of _execute(). Each
+        # call to generate() makes a function from it with new globals.
+        namespace = {}
+        exec self.compiled in namespace
+        self.execute_code = namespace["_execute"].func_code
+        code = self.execute_code
+        self.local_names = code.co_varnames[:code.co_argcount]
+        # The code of _stream() is only generated if generate_stream() is
+        # used.
+        self._stream_code = None
+        self._stream_source = None
+
+    @property
+    def file(self):
+        """The parsed template, parsed when first needed."""
+        if self._file is None:
+            reader = _TemplateReader(self.name, self.template_string)
+            self._file = _File(_parse(reader))
+        return self._file
+
+    @property
+    def code(self):
+        """The generated Python code, generated when first needed."""
+        if self._code is None:
+            self._code = self._generate_python(self.loader,
+                                               self.compress_whitespace)
+        return self._code
+
+    @property
+    def stream_code(self):
+        """The code of the _stream() function used by generate_stream(),
+        generated and compiled when first needed.
+        """
+        if self._stream_code is None:
+            source = self._generate_python(self.loader,
+                                           self.compress_whitespace,
+                                           stream=True)
+            try:
+                compiled = compile(source, self.name, "exec")
+            except:
+                formatted_code = _format_code(source).rstrip()
+                logging.error("%s code:\n%s", self.name, formatted_code)
+                raise
+            namespace = {}
+            exec compiled in namespace
+            self._stream_source = source
+            self._stream_code = namespace["_stream"].func_code
+        return self._stream_code
+
+    def get_cache_key(self):
+        """Returns the key for this template in a bytecode cache."""
+        return hashlib.sha1("%s\0%d\0%s\0%d" % (utf8(self.name),
+            self.compress_whitespace, self.source_hash,
+            _CODE_VERSION)).hexdigest()
+
+    def generate(self, **kwargs):
+        """Generate this template with the given arguments."""
+        namespace = _NAMESPACE.copy()
+        namespace.update(kwargs)
+        execute = types.FunctionType(self.execute_code, namespace)
         try:
-            self.compiled = compile(self.code, self.name, "exec")
+            return execute(*[namespace[name] for name in self.local_names])
         except:
             formatted_code = _format_code(self.code).rstrip()
             logging.error("%s code:\n%s", self.name, formatted_code)
             raise
 
-    def generate(self, **kwargs):
-        """Generate this template with the given arguments."""
-        namespace = {
-            "escape": xhtml_escape,
-            "url_escape": url_escape,
-            "json_encode": json_encode,
-            "squeeze": squeeze,
-            "datetime": datetime,
-        }
+    def generate_stream(self, **kwargs):
+        """Generate this template with the given arguments, yielding the
+        output in chunks. The returned iterator can be used as the body
+        of a Response.
+        """
+        code = self.stream_code
+        namespace = _NAMESPACE.copy()
         namespace.update(kwargs)
-        exec self.compiled in namespace
-        execute = namespace["_execute"]
+        stream = types.FunctionType(code, namespace)
+        local_names = code.co_varnames[1:code.co_argcount]
         try:
-            return execute()
+            for chunk in stream(self.stream_threshold,
+                                *[namespace[name] for name in local_names]):
+                yield chunk
         except:
-            formatted_code = _format_code(self.code).rstrip()
+            formatted_code = _format_code(self._stream_source).rstrip()
             logging.error("%s code:\n%s", self.name, formatted_code)
             raise
 
-    def _generate_python(self, loader, compress_whitespace):
+    def _check_dependencies(self, dependencies):
+        if dependencies and not self.loader:
+            return False
+        for name, source_hash in dependencies:
+            try:
+                if self.loader.load(name).source_hash != source_hash:
+                    return False
+            except (IOError, KeyError, ParseError):
+                return False
+        return True
+
+    def _generate_python(self, loader, compress_whitespace, stream=False):
         buffer = cStringIO.StringIO()
         try:
             named_blocks = {}
-            ancestors = self._get_ancestors(loader)
+            dependencies = []
+            ancestors = self._get_ancestors(loader, dependencies)
             ancestors.reverse()
             for ancestor in ancestors:
                 ancestor.find_named_blocks(loader, named_blocks)
             self.file.find_named_blocks(loader, named_blocks)
             writer = _CodeWriter(buffer, named_blocks, loader, self,
-                                 compress_whitespace)
+                                 compress_whitespace, dependencies)
+            writer.stream = stream
             ancestors[0].generate(writer)
+            self.dependencies = dependencies
             return buffer.getvalue()
         finally:
             buffer.close()
 
-    def _get_ancestors(self, loader):
+    def _get_ancestors(self, loader, dependencies=None):
         ancestors = [self.file]
         for chunk in self.file.body.chunks:
             if isinstance(chunk, _ExtendsBlock):
@@ -241,23 +306,130 @@ class Template(object):
                     raise ParseError("{% extends %} block found, but no "
                                      "template loader")
                 template = loader.load(chunk.name, self.name)
-                ancestors.extend(template._get_ancestors(loader))
+                if dependencies is not None:
+                    _add_dependency(dependencies, template.name)
+                ancestors.extend(template._get_ancestors(loader,
+                                                         dependencies))
         return ancestors
 
 
+class BytecodeCache(object):
+    """Base class for persistent caches of compiled templates. Compiled
+    code is stored with marshal, keyed by a hash of the template name and
+    source, and is only loaded by the Python version that stored it.
+
+    Subclasses implement load_bytecode() and dump_bytecode().
+    """
+    def get(self, key):
+        """Returns a tuple (dependencies, code) for a cache key, or None."""
+        data = self.load_bytecode(key)
+        if data is None or data[:4] != imp.get_magic():
+            return None
+        try:
+            return marshal.loads(data[4:])
+        except (EOFError, ValueError, TypeError):
+            return None
+
+    def set(self, key, dependencies, code):
+        """Stores the compiled code of a template.
+
+        :param key:
+            The template cache key.
+        :param dependencies:
+            A list of tuples (name, source_hash) for the templates that
+            were extended or included when the code was generated.
+        :param code:
+            The compiled code object.
+        """
+        self.dump_bytecode(key, imp.get_magic() +
+                           marshal.dumps((dependencies, code)))
+
+    def load_bytecode(self, key):
+        """Returns the stored data for a cache key, or None."""
+        raise NotImplementedError()
+
+    def dump_bytecode(self, key, data):
+        """Stores the data for a cache key."""
+        raise NotImplementedError()
+
+
+class FileSystemBytecodeCache(BytecodeCache):
+    """A bytecode cache that stores one file per template in a directory.
+    If the directory can't be written, e.g., on App Engine, templates are
+    still loaded from it.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key + ".cache")
+
+    def load_bytecode(self, key):
+        try:
+            f = open(self.get_path(key), "rb")
+        except IOError:
+            return None
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def dump_bytecode(self, key, data):
+        path = self.get_path(key)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+            f = os.fdopen(fd, "wb")
+            try:
+                f.write(data)
+            finally:
+                f.close()
+            # Rename, so that incomplete files are never read.
+            os.rename(tmp_path, path)
+        except (IOError, OSError), e:
+            logging.debug("Template bytecode not saved in %r: %s", path, e)
+
+
+class ZipBytecodeCache(BytecodeCache):
+    """A read-only bytecode cache that loads compiled templates from a zip
+    file created by precompile().
+    """
+    def __init__(self, zip_path):
+        self.zipfile = zipfile.ZipFile(zip_path, "r")
+        self.names = frozenset(self.zipfile.namelist())
+
+    def load_bytecode(self, key):
+        name = key + ".cache"
+        if name in self.names:
+            return self.zipfile.read(name)
+        return None
+
+    def dump_bytecode(self, key, data):
+        pass
+
+
 class Loader(object):
     """A template loader that loads from a single root directory.
 
     You must use a template loader to use template constructs like
-    {% extends %} and {% include %}. Loader caches all templates after
-    they are loaded the first time.
+    {% extends %} and {% include %}. Loader caches the cache_size most
+    recently used templates after they are loaded the first time; a
+    cache_size of 0 or None disables this cache. In debug mode, it
+    reloads templates when their files or the files of the templates they
+    extend or include are modified.
     """
-    def __init__(self, root_directory):
+    def __init__(self, root_directory, debug=False, cache_size=50,
+                 bytecode_cache=None):
         self.root = os.path.abspath(root_directory)
-        self.templates = {}
+        self.debug = debug
+        self.cache_size = cache_size
+        self.bytecode_cache = bytecode_cache
+        self.reset()
 
     def reset(self):
-        self.templates = {}
+        if self.cache_size:
+            self.templates = LRUCache(self.cache_size)
+        else:
+            self.templates = {}
 
     def resolve_path(self, name, parent_path=None):
         if parent_path and not parent_path.startswith("<") and \
@@ -270,35 +442,126 @@ class Loader(object):
                 name = relative_path[len(self.root) + 1:]
         return name
 
+    def get_source(self, name):
+        f = open(os.path.join(self.root, name), "r")
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def get_mtime(self, name):
+        try:
+            return os.path.getmtime(os.path.join(self.root, name))
+        except OSError:
+            return None
+
     def load(self, name, parent_path=None):
         name = self.resolve_path(name, parent_path=parent_path)
-        if name not in self.templates:
-            path = os.path.join(self.root, name)
-            f = open(path, "r")
-            self.templates[name] = Template(f.read(), name=name, loader=self)
-            f.close()
-        return self.templates[name]
+        template = self.templates.get(name)
+        if template is not None and self.debug and \
+           self._is_modified(template):
+            template = None
+        if template is None:
+            if self.debug:
+                mtime = self.get_mtime(name)
+            template = Template(self.get_source(name), name=name,
+                                loader=self,
+                                bytecode_cache=self.bytecode_cache)
+            if self.debug:
+                template.mtimes = {name: mtime}
+                for dep in template.dependencies:
+                    template.mtimes[dep] = self.get_mtime(dep)
+            if self.cache_size:
+                self.templates[name] = template
+        return template
+
+    def _is_modified(self, template):
+        if template.mtimes is None:
+            return False
+        for name, mtime in template.mtimes.iteritems():
+            if self.get_mtime(name) != mtime:
+                return True
+        return False
 
 
 class ZipLoader(Loader):
     """A template loader that loads from a zip file and a root directory.
 
     You must use a template loader to use template constructs like
-    {% extends %} and {% include %}. Loader caches all templates after
-    they are loaded the first time.
+    {% extends %} and {% include %}. Loader caches the most recently used
+    templates after they are loaded the first time.
     """
-    def __init__(self, zip_path, root_directory):
+    def __init__(self, zip_path, root_directory, cache_size=50,
+                 bytecode_cache=None):
         self.zipfile = zipfile.ZipFile(zip_path, 'r')
         self.root = os.path.join(root_directory)
-        self.templates = {}
+        self.debug = False
+        self.cache_size = cache_size
+        self.bytecode_cache = bytecode_cache
+        self.reset()
 
-    def load(self, name, parent_path=None):
-        name = self.resolve_path(name, parent_path=parent_path)
-        if name not in self.templates:
-            path = os.path.join(self.root, name)
-            tpl = self.zipfile.read(path)
-            self.templates[name] = Template(tpl, name=name, loader=self)
-        return self.templates[name]
+    def get_source(self, name):
+        return self.zipfile.read(os.path.join(self.root, name))
+
+
+def precompile(root_directory, target):
+    """Compiles all templates in a directory and stores them in a bytecode
+    cache directory or, if target ends with ".zip", in a zip file to be
+    used by ZipBytecodeCache. Files that are not valid templates are
+    skipped.
+
+    :param root_directory:
+        The templates directory.
+    :param target:
+        The bytecode cache directory or zip file.
+    :returns:
+        A list with the names of the compiled templates.
+    """
+    if target.endswith(".zip"):
+        cache_dir = tempfile.mkdtemp()
+    else:
+        cache_dir = target
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    try:
+        loader = Loader(root_directory,
+                        bytecode_cache=FileSystemBytecodeCache(cache_dir))
+        compiled = []
+        for dirpath, dirnames, filenames in os.walk(loader.root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            for filename in sorted(filenames):
+                if filename.startswith(".") or \
+                   filename.endswith((".py", ".pyc", ".zip")):
+                    continue
+                name = os.path.relpath(os.path.join(dirpath, filename),
+                                       loader.root).replace(os.sep, "/")
+                try:
+                    loader.load(name)
+                except (ParseError, SyntaxError), e:
+                    logging.warning("Template %r was not compiled: %s",
+                                    name, e)
+                    continue
+                compiled.append(name)
+
+        if cache_dir != target:
+            zip_file = zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED)
+            try:
+                for filename in sorted(os.listdir(cache_dir)):
+                    zip_file.write(os.path.join(cache_dir, filename),
+                                   filename)
+            finally:
+                zip_file.close()
+    finally:
+        if cache_dir != target:
+            shutil.rmtree(cache_dir)
+
+    return compiled
+
+
+def _add_dependency(dependencies, name):
+    if name not in dependencies:
+        dependencies.append(name)
 
 
 class _Node(object):
@@ -308,6 +571,13 @@ class _Node(object):
     def generate(self, writer):
         raise NotImplementedError()
 
+    def has_loop(self, writer):
+        """Returns True if the generated code has a for or while loop."""
+        for child in self.each_child():
+            if child.has_loop(writer):
+                return True
+        return False
+
     def find_named_blocks(self, loader, named_blocks):
         for child in self.each_child():
             child.find_named_blocks(loader, named_blocks)
@@ -318,11 +588,31 @@ class _File(_Node):
         self.body = body
 
     def generate(self, writer):
-        writer.write_line("def _execute():")
+        if writer.stream:
+            self.generate_function(writer, "_stream", ["_threshold"])
+        else:
+            self.generate_function(writer, "_execute", [])
+
+    def generate_function(self, writer, name, args):
+        # Templates with loops look up the buffer methods, builtins and
+        # the names in _LOCAL_NAMES as locals. For the others it would
+        # only add work to each call.
+        writer.local = self.has_loop(writer)
+        if writer.local:
+            args = args + list(_LOCAL_NAMES)
+        writer.write_line("def %s(%s):" % (name, ", ".join(args)))
         with writer.indent():
-            writer.write_line("_buffer = []")
+            writer.write_buffer()
+            if writer.local:
+                writer.write_line("_isinstance, _str, _unicode = "
+                                  "isinstance, str, unicode")
+            if writer.stream:
+                writer.write_line("_counted = _size = 0")
             self.body.generate(writer)
-            writer.write_line("return ''.join(_buffer)")
+            if writer.stream:
+                writer.write_line("if _buffer: yield ''.join(_buffer)")
+            else:
+                writer.write_line("return ''.join(_buffer)")
 
     def each_child(self):
         return (self.body,)
@@ -333,8 +623,55 @@ class _ChunkList(_Node):
         self.chunks = chunks
 
     def generate(self, writer):
+        # Adjacent text and expressions are written to the buffer with a
+        # single call. Text is merged, including the text of included
+        # templates and, unless streaming, of named blocks.
+        values = []
+        for chunk in self.fold(writer):
+            if isinstance(chunk, _Text):
+                value = chunk.compressed(writer)
+                if not value:
+                    continue
+                if values and isinstance(values[-1], str):
+                    values[-1] += value
+                else:
+                    values.append(value)
+            elif isinstance(chunk, _Expression):
+                name = "_tmp%d" % len(values)
+                chunk.generate_value(writer, name)
+                values.append([name])
+            else:
+                writer.write_output(values)
+                values = []
+                chunk.generate(writer)
+        writer.write_output(values)
+
+    def has_loop(self, writer):
+        for chunk in self.fold(writer):
+            if chunk.has_loop(writer):
+                return True
+        return False
+
+    def fold(self, writer):
+        """Yields the chunks of this list, replacing included templates
+        and, unless streaming, named blocks by their chunks.
+        """
         for chunk in self.chunks:
-            chunk.generate(writer)
+            if isinstance(chunk, _IncludeBlock):
+                included = writer.loader.load(chunk.name, chunk.template_name)
+                _add_dependency(writer.dependencies, included.name)
+                old = writer.current_template
+                writer.current_template = included
+                try:
+                    for child in included.file.body.fold(writer):
+                        yield child
+                finally:
+                    writer.current_template = old
+            elif isinstance(chunk, _NamedBlock) and not writer.stream:
+                for child in writer.named_blocks[chunk.name].fold(writer):
+                    yield child
+            else:
+                yield chunk
 
     def each_child(self):
         return self.chunks
@@ -349,7 +686,12 @@ class _NamedBlock(_Node):
         return (self.body,)
 
     def generate(self, writer):
+        writer.flush()
         writer.named_blocks[self.name].generate(writer)
+        writer.flush()
+
+    def has_loop(self, writer):
+        return writer.named_blocks[self.name].has_loop(writer)
 
     def find_named_blocks(self, loader, named_blocks):
         named_blocks[self.name] = self.body
@@ -371,11 +713,10 @@ class _IncludeBlock(_Node):
         included.file.find_named_blocks(loader, named_blocks)
 
     def generate(self, writer):
-        included = writer.loader.load(self.name, self.template_name)
-        old = writer.current_template
-        writer.current_template = included
-        included.file.body.generate(writer)
-        writer.current_template = old
+        _ChunkList([self]).generate(writer)
+
+    def has_loop(self, writer):
+        return _ChunkList([self]).has_loop(writer)
 
 
 class _ApplyBlock(_Node):
@@ -391,11 +732,14 @@ class _ApplyBlock(_Node):
         writer.apply_counter += 1
         writer.write_line("def %s():" % method_name)
         with writer.indent():
-            writer.write_line("_buffer = []")
+            # The method gets the whole output of the block.
+            stream = writer.stream
+            writer.stream = False
+            writer.write_buffer()
             self.body.generate(writer)
             writer.write_line("return ''.join(_buffer)")
-        writer.write_line("_buffer.append(%s(%s()))" % (
-            self.method, method_name))
+            writer.stream = stream
+        writer.write_output([["%s(%s())" % (self.method, method_name)]])
 
 
 class _ControlBlock(_Node):
@@ -409,8 +753,17 @@ class _ControlBlock(_Node):
     def generate(self, writer):
         writer.write_line("%s:" % self.statement)
         with writer.indent():
+            if self.is_loop:
+                writer.flush(threshold=True)
             self.body.generate(writer)
 
+    @property
+    def is_loop(self):
+        return self.statement.startswith(("for ", "while "))
+
+    def has_loop(self, writer):
+        return self.is_loop or self.body.has_loop(writer)
+
 
 class _IntermediateControlBlock(_Node):
     def __init__(self, statement):
@@ -433,11 +786,18 @@ class _Expression(_Node):
         self.expression = expression
 
     def generate(self, writer):
-        writer.write_line("_tmp = %s" % self.expression)
-        writer.write_line("if isinstance(_tmp, str): _buffer.append(_tmp)")
-        writer.write_line("elif isinstance(_tmp, unicode): "
-                          "_buffer.append(_tmp.encode('utf-8'))")
-        writer.write_line("else: _buffer.append(str(_tmp))")
+        self.generate_value(writer, "_tmp")
+        writer.write_output([["_tmp"]])
+
+    def generate_value(self, writer, name):
+        """Writes code that assigns the expression, as a str, to name."""
+        writer.write_line("%s = %s" % (name, self.expression))
+        # Builtins are prefixed when they are locals.
+        prefix = writer.local and "_" or ""
+        writer.write_line("if not %(p)sisinstance(%(n)s, %(p)sstr): "
+                          "%(n)s = %(n)s.encode('utf-8') if "
+                          "%(p)sisinstance(%(n)s, %(p)sunicode) else "
+                          "%(p)sstr(%(n)s)" % dict(n=name, p=prefix))
 
 
 class _Text(_Node):
@@ -445,6 +805,11 @@ class _Text(_Node):
         self.value = value
 
     def generate(self, writer):
+        value = self.compressed(writer)
+        if value:
+            writer.write_output([value])
+
+    def compressed(self, writer):
         value = self.value
 
         # Compress lots of white space to a single character. If the whitespace
@@ -453,9 +818,7 @@ class _Text(_Node):
         if writer.compress_whitespace and "<pre>" not in value:
             value = re.sub(r"([\t ]+)", " ", value)
             value = re.sub(r"(\s*\n\s*)", "\n", value)
-
-        if value:
-            writer.write_line('_buffer.append(%r)' % value)
+        return value
 
 
 class ParseError(Exception):
@@ -465,13 +828,18 @@ class ParseError(Exception):
 
 class _CodeWriter(object):
     def __init__(self, file, named_blocks, loader, current_template,
-                 compress_whitespace):
+                 compress_whitespace, dependencies=None):
         self.file = file
         self.named_blocks = named_blocks
         self.loader = loader
         self.current_template = current_template
         self.compress_whitespace = compress_whitespace
+        if dependencies is None:
+            dependencies = []
+        self.dependencies = dependencies
         self.apply_counter = 0
+        self.stream = False
+        self.local = False
         self._indent = 0
 
     def indent(self):
@@ -495,6 +863,51 @@ class _CodeWriter(object):
             self.file.write("    ")
         print >> self.file, line
 
+    def write_buffer(self):
+        """Writes code to start a new output buffer."""
+        self.write_line("_buffer = []")
+        if self.local:
+            self.write_line("_append, _extend = _buffer.append, "
+                            "_buffer.extend")
+
+    def write_output(self, values):
+        """Writes code to add values to the buffer. Each value is a str,
+        or a list with the name of a variable holding a str.
+        """
+        if not values:
+            return
+        values = [value[0] if isinstance(value, list) else repr(value)
+                  for value in values]
+        if len(values) == 1:
+            self.write_line("%s(%s)" % (self.get_method("append"),
+                                        values[0]))
+        else:
+            self.write_line("%s((%s))" % (self.get_method("extend"),
+                                          ", ".join(values)))
+
+    def get_method(self, name):
+        """Returns the code to get a method of the buffer."""
+        if self.local:
+            return "_" + name
+        return "_buffer." + name
+
+    def flush(self, threshold=False):
+        """When generating _stream(), writes code to yield the buffered
+        output, or only once it reaches _threshold bytes.
+        """
+        if not self.stream:
+            return
+        if threshold:
+            self.write_line("_counted, _size = len(_buffer), "
+                            "_size + sum(map(len, _buffer[_counted:]))")
+            self.write_line("if _size >= _threshold:")
+        else:
+            self.write_line("if _buffer:")
+        with self.indent():
+            self.write_line("yield ''.join(_buffer)")
+            self.write_line("del _buffer[:]")
+            self.write_line("_counted = _size = 0")
+
 
 class _TemplateReader(object):
     def __init__(self, name, text):
@@ -19,7 +19,6 @@ import htmlentitydefs
 import re
 import unicodedata
 import urllib
-import xml.sax.saxutils
 
 # Imported here for compatibility.
 from .json import json_encode, json_decode, json_b64encode, json_b64decode
@@ -33,9 +32,45 @@ def xhtml_escape(value):
     :param value:
         The value to be escaped.
     :returns:
-        The escaped value.
+        The escaped value, encoded to UTF-8.
     """
-    return utf8(xml.sax.saxutils.escape(value, {'"': "&quot;"}))
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+
+    # Values without special characters are returned unchanged. For long
+    # values, replace() finds the characters faster than "in".
+    if len(value) > 256:
+        return value.replace("&", "&amp;").replace("<", "&lt;").replace(
+            ">", "&gt;").replace('"', "&quot;")
+    if "&" in value:
+        value = value.replace("&", "&amp;")
+    if "<" in value:
+        value = value.replace("<", "&lt;")
+    if ">" in value:
+        value = value.replace(">", "&gt;")
+    if '"' in value:
+        value = value.replace('"', "&quot;")
+    return value
+
+
+def xhtml_escape_all(values):
+    """Escapes a list of strings so they are valid within XML or XHTML.
+    This is faster than escaping each value when there are many of them.
+
+    :param values:
+        A list of values to be escaped.
+    :returns:
+        A list with the escaped values, encoded to UTF-8.
+    """
+    # The values are escaped at once, joined by a character that is not
+    # in any of them.
+    try:
+        joined = "\0".join(values)
+    except (TypeError, UnicodeDecodeError):
+        joined = None
+    if joined is None or joined.count("\0") != len(values) - 1:
+        return [xhtml_escape(value) for value in values]
+    return xhtml_escape(joined).split("\0")
 
 
 def xhtml_unescape(value):
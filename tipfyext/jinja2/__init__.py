@@ -188,6 +188,20 @@ class Jinja2(object):
         return _app.registry[_name]
 
 
+def warmup(app):
+    """Creates the Jinja2 environment for an app before the first request.
+    To use it, add it to the `warmup_functions` configured for tipfy::
+
+        config['tipfy'] = {
+            'warmup_functions': ['tipfyext.jinja2.warmup'],
+        }
+
+    :param app:
+        A :class:`tipfy.app.App` instance.
+    """
+    Jinja2.factory(app, 'jinja2')
+
+
 class Jinja2Mixin(object):
     """Mixin that adds ``render_template`` and ``render_response`` methods
     to a :class:`tipfy.RequestHandler`. It will use the request context to